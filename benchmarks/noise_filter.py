@@ -0,0 +1,51 @@
+"""
+Validation of the noise pre-filter (see FilesRunner.noise_threshold) on annotated ROIs:
+for every threshold the share of skipped ROIs and the recall of annotated peaks are reported.
+Only thresholds which keep all annotated peaks are safe to use.
+
+Usage: python benchmarks/noise_filter.py FOLDER [FOLDER ...] [--thresholds 1.2 1.5 2 3]
+           [--peak-minimum-points 8]
+"""
+import os
+import sys
+import json
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from processing_utils.run_utils import noise_mask  # noqa: E402
+from processing_utils.runner import FilesRunner  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('folders', nargs='+', help='folders with annotated ROIs')
+    parser.add_argument('--thresholds', type=float, nargs='+', default=[1.2, 1.5, 2., 3.])
+    parser.add_argument('--peak-minimum-points', type=int, default=8)
+    args = parser.parse_args()
+
+    signals, labels = [], []
+    for folder in args.folders:
+        for file in sorted(os.listdir(folder)):
+            if file[0] != '.':
+                with open(os.path.join(folder, file)) as json_file:
+                    roi = json.load(json_file)
+                signals.append(np.asarray(roi['intensity'], dtype=np.float64))
+                labels.append(roi['label'])
+    labels = np.array(labels) != 0
+    offsets = np.zeros(len(signals) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(signal) for signal in signals])
+    i = np.concatenate(signals)
+
+    print('{} ROIs, {} with peaks'.format(len(labels), labels.sum()))
+    print('{:>9s} {:>9s} {:>9s} {:>9s}'.format('threshold', 'skipped', 'recall', 'lost'))
+    for threshold in args.thresholds:
+        noise = noise_mask(i, offsets, args.peak_minimum_points, threshold, FilesRunner.spike_smoothness)
+        lost = np.sum(noise & labels)
+        recall = 1 - lost / labels.sum() if labels.sum() else float('nan')
+        print('{:9.2f} {:9.1%} {:9.4f} {:9d}'.format(threshold, noise.mean(), recall, lost))
+
+
+if __name__ == '__main__':
+    main()
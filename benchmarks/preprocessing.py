@@ -0,0 +1,55 @@
+"""
+Micro-benchmark of log-scaling preprocessing of Segmentator and RecurrentCNN:
+the former per-signal loop versus the batched implementation.
+
+Usage: python benchmarks/preprocessing.py [--batch-sizes 1 64 256] [--points 256] [--repeats 20]
+"""
+import os
+import sys
+import time
+import argparse
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.cnn_segmentator import preprocessing  # noqa: E402
+
+
+def loop_preprocessing(batch):
+    batch_size, _, n_points = batch.shape
+    processed_batch = batch.clone().view(batch_size, n_points)
+    for x in processed_batch:
+        x[x < 1e-4] = 0
+        pos = (x != 0)
+        x[pos] = torch.log10(x[pos])
+        x[pos] = x[pos] - torch.min(x[pos])
+        x[pos] = x[pos] / torch.max(x[pos])
+    return processed_batch.view(batch_size, 1, n_points)
+
+
+def measure(function, batch, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        function(batch)
+    return (time.perf_counter() - start) / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 64, 256])
+    parser.add_argument('--points', type=int, default=256)
+    parser.add_argument('--repeats', type=int, default=20)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    for batch_size in args.batch_sizes:
+        batch = torch.rand(batch_size, 1, args.points) ** 4
+        loop = measure(loop_preprocessing, batch, args.repeats)
+        batched = measure(preprocessing, batch, args.repeats)
+        print('batch size {:4d}: loop {:8.3f} ms, batched {:8.3f} ms, speedup x{:.1f}, equal: {}'.format(
+            batch_size, loop * 1e3, batched * 1e3, loop / batched,
+            torch.equal(loop_preprocessing(batch), preprocessing(batch))))
+
+
+if __name__ == '__main__':
+    main()
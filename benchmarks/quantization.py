@@ -0,0 +1,110 @@
+"""
+Evaluation of int8 quantized models against float32 models on annotated ROIs:
+classification accuracy, mean IoU of predicted and annotated peaks and throughput.
+
+Usage: python benchmarks/quantization.py TEST_FOLDER --mode sequential
+           --weights data/weights/Classifier.pt data/weights/Segmentator.pt
+           [--quantization static] [--calibration TRAIN_FOLDER] [--batch-size 64]
+Random weights are used if they are not given (only the deltas are meaningful then).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import warnings
+import numpy as np
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.registry import load_model  # noqa: E402
+from models.rcnn import RecurrentCNN  # noqa: E402
+from models.cnn_classifier import Classifier  # noqa: E402
+from models.cnn_segmentator import Segmentator  # noqa: E402
+from processing_utils.roi import construct_ROI  # noqa: E402
+from processing_utils.runner import BasicRunner  # noqa: E402
+
+
+def load_folder(folder):
+    """
+    Load annotated ROIs (*.json files) from folder
+    :return: a tuple (list of ROIs, list of labels, list of annotated borders)
+    """
+    rois, labels, borders = [], [], []
+    for file in sorted(os.listdir(folder)):
+        if file[0] != '.':
+            with open(os.path.join(folder, file)) as json_file:
+                dict_roi = json.load(json_file)
+            rois.append(construct_ROI(dict_roi))
+            labels.append(dict_roi['label'])
+            borders.append(dict_roi['borders'])
+    return rois, labels, borders
+
+
+def iou(length, predicted, annotated):
+    """
+    Intersection over union of points covered by predicted and annotated peaks
+    """
+    pred = np.zeros(length, dtype=bool)
+    gt = np.zeros(length, dtype=bool)
+    for begin, end in predicted:
+        pred[begin:end + 1] = True
+    for begin, end in annotated:
+        gt[begin:end + 1] = True
+    union = (pred | gt).sum()
+    return (pred & gt).sum() / union if union else 1.
+
+
+def evaluate(runner, rois, labels, borders):
+    """
+    :return: a tuple (accuracy, mean IoU on ROIs annotated as peaks, ROIs per second)
+    """
+    runner.predict_borders(rois[:runner.batch_size])  # warm up
+    start = time.perf_counter()
+    predicted = runner.predict_borders(rois)
+    elapsed = time.perf_counter() - start
+    accuracy = np.mean([(roi_borders is not None) == bool(label) for roi_borders, label in zip(predicted, labels)])
+    ious = [iou(len(roi.i), roi_borders or [], annotated)
+            for roi, roi_borders, label, annotated in zip(rois, predicted, labels, borders) if label]
+    return accuracy, np.mean(ious) if ious else float('nan'), len(rois) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('test', help='folder with annotated ROIs')
+    parser.add_argument('--mode', choices=['all in one', 'sequential'], default='sequential')
+    parser.add_argument('--weights', nargs='*', default=[],
+                        help='weights of RecurrentCNN or of Classifier and Segmentator')
+    parser.add_argument('--quantization', choices=['dynamic', 'static'], default='static')
+    parser.add_argument('--calibration', help='folder with ROIs for static quantization (test folder by default)')
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--peak-minimum-points', type=int, default=8)
+    args = parser.parse_args()
+    warnings.simplefilter('ignore', UserWarning)
+
+    torch.manual_seed(0)
+    architectures = ['RecurrentCNN'] if args.mode == 'all in one' else ['Classifier', 'Segmentator']
+    if args.weights:
+        models = [load_model(architecture, path, 'cpu') for architecture, path in zip(architectures, args.weights)]
+    else:
+        models = [{'RecurrentCNN': RecurrentCNN, 'Classifier': Classifier,
+                   'Segmentator': Segmentator}[architecture]().eval() for architecture in architectures]
+    rois, labels, borders = load_folder(args.test)
+    calibration = load_folder(args.calibration)[0] if args.calibration else rois
+
+    fp32 = BasicRunner(args.mode, models, args.peak_minimum_points, 'cpu', args.batch_size)
+    int8 = BasicRunner(args.mode, models, args.peak_minimum_points, 'cpu', args.batch_size,
+                       quantization=args.quantization, calibration=calibration)
+    fp32_accuracy, fp32_iou, fp32_speed = evaluate(fp32, rois, labels, borders)
+    int8_accuracy, int8_iou, int8_speed = evaluate(int8, rois, labels, borders)
+    print('{} ROIs, {} quantization'.format(len(rois), args.quantization))
+    print('{:9s} {:>9s} {:>9s} {:>9s}'.format('', 'fp32', 'int8', 'delta'))
+    print('{:9s} {:9.4f} {:9.4f} {:+9.4f}'.format('accuracy', fp32_accuracy, int8_accuracy,
+                                                   int8_accuracy - fp32_accuracy))
+    print('{:9s} {:9.4f} {:9.4f} {:+9.4f}'.format('IoU', fp32_iou, int8_iou, int8_iou - fp32_iou))
+    print('{:9s} {:9.0f} {:9.0f}    x{:.2f}'.format('ROIs/s', fp32_speed, int8_speed, int8_speed / fp32_speed))
+
+
+if __name__ == '__main__':
+    main()
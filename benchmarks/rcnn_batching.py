@@ -0,0 +1,53 @@
+"""
+Benchmark of RecurrentCNN inference on ROIs of different lengths:
+one ROI per forward pass versus padded batches of ROIs of similar length.
+
+Usage: python benchmarks/rcnn_batching.py [--rois 2000] [--batch-sizes 1 16 64 256]
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.rcnn import RecurrentCNN  # noqa: E402
+from processing_utils.roi import ROI  # noqa: E402
+from processing_utils.runner import BasicRunner  # noqa: E402
+
+
+def generate_rois(n_rois, seed=0):
+    rng = np.random.RandomState(seed)
+    rois = []
+    for length in rng.randint(10, 300, n_rois):
+        x = np.arange(length)
+        i = 1e4 * np.exp(-(x - rng.uniform(0, length)) ** 2 / length) + rng.uniform(0, 100, length)
+        rois.append(ROI([0, length - 1], [0., length - 1.], i, [100.] * length, 100.))
+    return rois
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rois', type=int, default=2000)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 16, 64, 256])
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    model = RecurrentCNN().eval()
+    rois = generate_rois(args.rois)
+    reference = None
+    for batch_size in args.batch_sizes:
+        runner = BasicRunner('all in one', [model], 5, 'cpu', batch_size=batch_size)
+        start = time.perf_counter()
+        borders = runner.predict_borders(rois)
+        elapsed = time.perf_counter() - start
+        if reference is None:
+            reference = (elapsed, borders)
+        print('batch size {:4d}: {:7.2f} s, {:7.1f} ROIs/s, speedup x{:.1f}, same result: {}'.format(
+            batch_size, elapsed, len(rois) / elapsed, reference[0] / elapsed, borders == reference[1]))
+
+
+if __name__ == '__main__':
+    main()
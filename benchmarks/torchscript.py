@@ -0,0 +1,56 @@
+"""
+Benchmark of eager and exported (TorchScript, frozen and optimized for inference)
+models on CPU.
+
+Usage: python benchmarks/torchscript.py [--batch-size 64] [--points 256] [--repeats 20]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import warnings
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.export import architectures, export_model  # noqa: E402
+from models.registry import ModelRegistry  # noqa: E402
+
+
+def measure(model, signal, repeats):
+    with torch.no_grad():
+        model(signal)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            model(signal)
+    return (time.perf_counter() - start) / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--points', type=int, default=256)
+    parser.add_argument('--repeats', type=int, default=20)
+    args = parser.parse_args()
+    warnings.simplefilter('ignore', FutureWarning)
+
+    torch.manual_seed(0)
+    signal = torch.rand(args.batch_size, 1, args.points)
+    signal = signal / torch.max(signal, dim=2, keepdim=True)[0]
+    registry = ModelRegistry()
+    with tempfile.TemporaryDirectory() as directory:
+        for architecture, model_class in architectures.items():
+            weights = os.path.join(directory, architecture + '.pt')
+            torch.save(model_class().state_dict(), weights)
+            eager = registry.get(architecture, weights, 'cpu')
+            scripted = registry.get(architecture, export_model(architecture, weights), 'cpu')
+            eager_time = measure(eager, signal, args.repeats)
+            scripted_time = measure(scripted, signal, args.repeats)
+            print('{:12s}: eager {:8.2f} ms, scripted {:8.2f} ms, {:7.0f} vs {:7.0f} ROIs/s, speedup x{:.2f}'.format(
+                architecture, eager_time * 1e3, scripted_time * 1e3, args.batch_size / eager_time,
+                args.batch_size / scripted_time, eager_time / scripted_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,11 @@
 # distutils: language = c++
-import pymzml
+import numpy as np
 from libcpp.map cimport map
 from libcpp.vector cimport vector
+from libcpp.algorithm cimport sort
 from cython.operator cimport dereference, postincrement, postdecrement
-from processing_utils.roi import ROI
+from processing_utils.roi import ROIBatch
+from processing_utils.scan_store import open_run, iter_spectra
 
 cdef struct cROI:
     int scan_begin
@@ -22,32 +24,18 @@ cdef struct MsScan:
     
 
 def get_ROIs(str path, float delta_mz=0.005, int required_points=15, int dropped_points=3, progress_callback=None):
-    # read all scans in mzML file
-    run = pymzml.run.Reader(path)
-    cdef vector[MsScan] scans
-    for scan in run:
-        if scan.ms_level == 1:
-            scans.push_back(MsScan(scan.i, scan.mz, scan.scan_time[0]))
-            
+    # scans are read one by one from the mzML file and dropped after processing
+    run = open_run(path)
+    cdef int spectrum_count = run.get_spectrum_count()  # from the index (MS1 and MS2 spectra)
+
     cdef vector[cROI] rois  # completed ROIs (vector)
     cdef map[float, cROI] process_rois  # processing ROIs (map)
-    
-    # initialize a processed data
-    cdef MsScan init_scan = scans[0]
-    cdef float start_time = init_scan.rt
-
-    cdef float min_mz = min(init_scan.mz)
-    cdef float max_mz = max(init_scan.mz)
+    # expiry index: scan number -> keys of ROIs, which should be retired at this scan if they aren't extended
+    cdef map[int, vector[float]] expiry
+    cdef map[int, vector[float]].iterator expiry_it
+    cdef vector[float]* expiring
     cdef cROI new_roi
-    for n in range(init_scan.i.size()):
-        if init_scan.i[n] != 0:
-            new_roi = cROI(0, 0, start_time, start_time, vector[float](),
-                          vector[float](), init_scan.mz[n], 1)
-            new_roi.i.push_back(init_scan.i[n])
-            new_roi.mz.push_back(init_scan.mz[n])
-            process_rois[init_scan.mz[n]] = new_roi
-            
-    
+
     cdef float ceiling_mz  # the closest m/z not less than the given
     cdef cROI* ceiling
     cdef map[float, cROI].iterator ceiling_it
@@ -56,21 +44,37 @@ def get_ROIs(str path, float delta_mz=0.005, int required_points=15, int dropped
     cdef map[float, cROI].iterator floor_it
     cdef float closest_mz  # the closest m/z
     cdef cROI* closest
+    cdef float closest_key
 
     cdef cROI* roi
     cdef float mz
     cdef MsScan current_scan
-    
+    cdef int number = -1  # number of the processed MS1 scan
+    cdef int k, m
+
     cdef map[float, cROI].iterator map_it
-    
-    for number in range(1, scans.size()):
-        current_scan = scans[number]
+
+    for spectrum_number, scan in iter_spectra(run, 1):  # MS2 spectra aren't decoded
+        number += 1
+        current_scan = MsScan(scan.i, scan.mz, scan.scan_time[0])
+        if number == 0:
+            # initialize a processed data
+            for n in range(current_scan.i.size()):
+                if current_scan.i[n] != 0:
+                    new_roi = cROI(0, 0, current_scan.rt, current_scan.rt, vector[float](),
+                                   vector[float](), current_scan.mz[n], 1)
+                    new_roi.i.push_back(current_scan.i[n])
+                    new_roi.mz.push_back(current_scan.mz[n])
+                    process_rois[current_scan.mz[n]] = new_roi
+                    expiry[number + dropped_points + 1].push_back(current_scan.mz[n])
+            continue
         for n in range(current_scan.i.size()):
             if current_scan.i[n] != 0:
                 mz = current_scan.mz[n]
                 # find ceiling_it and floor_it
                 floor_it = process_rois.lower_bound(mz)
-                if floor_it != process_rois.end() and floor_it != process_rois.begin():
+                if floor_it != process_rois.begin():
+                    # the ROI before lower bound is the floor (the last ROI if m/z is above every key)
                     ceiling_it = postdecrement(floor_it)
                 else:
                     ceiling_it = floor_it
@@ -83,25 +87,33 @@ def get_ROIs(str path, float delta_mz=0.005, int required_points=15, int dropped
                     floor = &dereference(floor_it).second
                     floor_mz = floor.mz_mean
                 # getting closest roi (if possible)
-                if ceiling_it == process_rois.end() and floor_it == process_rois.end():  # process_rois is empty?
+                if ceiling_it == process_rois.end() and floor_it == process_rois.end():  # process_rois is empty
                     new_roi = cROI(number, number, current_scan.rt, current_scan.rt, vector[float](),
                               vector[float](), mz, 1)
                     new_roi.i.push_back(current_scan.i[n])
                     new_roi.mz.push_back(current_scan.mz[n])
                     process_rois[mz] = new_roi
+                    expiry[number + dropped_points + 1].push_back(mz)
+                    # there is no closest ROI: 'closest' would point to a ROI from the previous
+                    # iterations, which may be already erased (the point would be counted twice)
+                    continue
                 elif ceiling_it == process_rois.end():
                     closest_mz = floor_mz
                     closest = floor
+                    closest_key = dereference(floor_it).first
                 elif floor_it == process_rois.end():
                     closest_mz = ceiling_mz
                     closest = ceiling
+                    closest_key = dereference(ceiling_it).first
                 else:
                     if ceiling_mz - mz > mz - floor_mz:
                         closest_mz = floor_mz
                         closest = floor
+                        closest_key = dereference(floor_it).first
                     else:
                         closest_mz = ceiling_mz
                         closest = ceiling
+                        closest_key = dereference(ceiling_it).first
                 # expanding existing roi or creates a new one
                 if abs(closest_mz - mz) < delta_mz:
                     roi = closest
@@ -114,59 +126,89 @@ def get_ROIs(str path, float delta_mz=0.005, int required_points=15, int dropped
                                                                                + current_scan.i[n]))
                         roi.i[roi.i.size() - 1] = roi.i[roi.i.size() - 1] + current_scan.i[n]
                     else:
+                        # insert 'zeros' for the skipped scans (mz_mean isn't changed since the last point)
+                        for k in range(number - roi.scan_end - 1):
+                            roi.mz.push_back(roi.mz_mean)
+                            roi.i.push_back(0)
                         roi.mz_mean = 0.9 * roi.mz_mean + 0.1 * mz
                         roi.points += 1
                         roi.mz.push_back(mz)
                         roi.i.push_back(current_scan.i[n])
                         roi.scan_end = number 
                         roi.rt_end = current_scan.rt
+                        expiry[number + dropped_points + 1].push_back(closest_key)
                 else:
                     new_roi = cROI(number, number, current_scan.rt, current_scan.rt, vector[float](),
                               vector[float](), mz, 1)
                     new_roi.i.push_back(current_scan.i[n])
                     new_roi.mz.push_back(current_scan.mz[n])
                     process_rois[mz] = new_roi
-        # Check and cleanup
-        map_it = process_rois.begin()
-        while map_it != process_rois.end():
-            roi = &dereference(map_it).second
-            mz = roi.mz_mean
-            if roi.scan_end < number <= roi.scan_end + dropped_points:
-                # insert 'zero' in the end
-                roi.mz.push_back(mz)
-                roi.i.push_back(0)
-                postincrement(map_it)
-            elif roi.scan_end != number:
-                if roi.points >= required_points:
-                    new_roi = dereference(map_it).second
-                    rois.push_back(new_roi)
-                process_rois.erase(postincrement(map_it))
-            else:
-                postincrement(map_it)
-        if progress_callback is not None and not number % 10:
-            progress_callback.emit(int(number * 100 / scans.size()))
+                    expiry[number + dropped_points + 1].push_back(mz)
+        # Check and cleanup: only the ROIs, which weren't extended in 'dropped_points' scans
+        expiry_it = expiry.find(number)
+        if expiry_it != expiry.end():
+            expiring = &dereference(expiry_it).second
+            sort(expiring.begin(), expiring.end())  # ROIs are completed in order of keys
+            for k in range(expiring.size()):
+                map_it = process_rois.find(dereference(expiring)[k])
+                if map_it == process_rois.end():
+                    continue
+                roi = &dereference(map_it).second
+                if roi.scan_end + dropped_points + 1 == number:
+                    # insert 'zeros' in the end
+                    for m in range(dropped_points):
+                        roi.mz.push_back(roi.mz_mean)
+                        roi.i.push_back(0)
+                    if roi.points >= required_points:
+                        rois.push_back(dereference(roi))
+                    process_rois.erase(map_it)
+            expiry.erase(expiry_it)
+        if progress_callback is not None and not spectrum_number % 10:
+            progress_callback.emit(int(spectrum_number * 100 / spectrum_count))
     # add final rois
     map_it = process_rois.begin()
     while map_it != process_rois.end():
         roi = &dereference(map_it).second
         if roi.points >= required_points:
-            for n in range(dropped_points - (scans.size() - 1 - roi.scan_end)):
+            for m in range(dropped_points):
                 roi.mz.push_back(roi.mz_mean)
                 roi.i.push_back(0)
             rois.push_back(dereference(roi))
         postincrement(map_it)
-    # expand constructed roi and creating python object
+    # expand constructed rois and pack them into columnar batch
+    cdef size_t total = 0
     cdef vector[cROI].iterator roi_it = rois.begin()
-    python_rois = []
+    while roi_it != rois.end():
+        total += dereference(roi_it).i.size() + dropped_points
+        postincrement(roi_it)
+    roi_i = np.zeros(total, dtype=np.float32)
+    roi_mz = np.empty(total, dtype=np.float32)
+    offsets = np.zeros(rois.size() + 1, dtype=np.int64)
+    roi_scan = np.empty((rois.size(), 2), dtype=np.int64)
+    roi_rt = np.empty((rois.size(), 2), dtype=np.float64)
+    roi_mzmean = np.empty(rois.size(), dtype=np.float64)
+    cdef float[:] i_view = roi_i
+    cdef float[:] mz_view = roi_mz
+    cdef size_t position = 0
+    k = 0
+    roi_it = rois.begin()
     while roi_it != rois.end():
         roi = &dereference(roi_it)
-        roi.i.insert(roi.i.begin(), dropped_points, 0)
-        roi.mz.insert(roi.mz.begin(), dropped_points, roi.mz_mean)
+        # insert 'zeros' in the beginning
+        for m in range(dropped_points):
+            mz_view[position] = roi.mz_mean
+            position += 1
+        for m in range(roi.i.size()):
+            i_view[position] = roi.i[m]
+            mz_view[position] = roi.mz[m]
+            position += 1
+        offsets[k + 1] = position
         # change scan numbers (necessary for future matching)
-        roi.scan_begin = roi.scan_begin - dropped_points
-        roi.scan_end = roi.scan_end + dropped_points
-
-        python_rois.append(ROI([roi.scan_begin, roi.scan_end], [roi.rt_begin, roi.rt_end],
-                               roi.i, roi.mz, roi.mz_mean))
+        roi_scan[k, 0] = roi.scan_begin - dropped_points
+        roi_scan[k, 1] = roi.scan_end + dropped_points
+        roi_rt[k, 0] = roi.rt_begin
+        roi_rt[k, 1] = roi.rt_end
+        roi_mzmean[k] = roi.mz_mean
+        k += 1
         postincrement(roi_it)
-    return python_rois
+    return ROIBatch(roi_i, roi_mz, offsets, roi_scan, roi_rt, roi_mzmean)
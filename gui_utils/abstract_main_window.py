@@ -3,7 +3,7 @@ from functools import partial
 from PyQt5 import QtWidgets, QtCore
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
-from processing_utils.roi import construct_tic, construct_eic
+from processing_utils.roi import construct_tic, construct_eics
 from gui_utils.auxilary_utils import ProgressBarsList, ProgressBarsListItem, FileListWidget, FeatureListWidget
 from gui_utils.threading import Worker
 
@@ -120,22 +120,41 @@ class AbtractMainWindow(QtWidgets.QMainWindow):
         return plotted, label
 
     def plot_eic(self, file, mz, delta):
-        label = f'EIC {mz:.4f} ± {delta:.4f}: {file[:file.rfind(".")]}'
-        plotted = False
-        if label not in self._label2line:
+        labels = self.plot_eics(file, [mz], delta)
+        return bool(labels), self._eic_label(file, mz, delta)
+
+    def plot_eics(self, file, mzs, delta):
+        """
+        Plot EICs for a list of m/z values (file is read once)
+        :return: labels of new lines
+        """
+        labels, new_mzs = [], []
+        for mz in mzs:
+            label = self._eic_label(file, mz, delta)
+            if label not in self._label2line and label not in labels:
+                labels.append(label)
+                new_mzs.append(mz)
+        if labels:
             path = self._list_of_files.file2path[file]
 
-            pb = ProgressBarsListItem(f'Plotting EIC (mz={mz:.4f}): {file}', parent=self._pb_list)
+            caption = f'mz={new_mzs[0]:.4f}' if len(new_mzs) == 1 else f'{len(new_mzs)} m/z values'
+            pb = ProgressBarsListItem(f'Plotting EIC ({caption}): {file}', parent=self._pb_list)
             self._pb_list.addItem(pb)
-            worker = Worker(construct_eic, path, label, mz, delta)
+            worker = Worker(construct_eics, path, labels, new_mzs, delta)
             worker.signals.progress.connect(pb.setValue)
-            worker.signals.result.connect(self.plotter)
+            worker.signals.result.connect(self._plot_lines)
             worker.signals.finished.connect(partial(self._threads_finisher, pb=pb))
 
             self._thread_pool.start(worker)
+        return labels
 
-            plotted = True
-        return plotted, label
+    @staticmethod
+    def _eic_label(file, mz, delta):
+        return f'EIC {mz:.4f} ± {delta:.4f}: {file[:file.rfind(".")]}'
+
+    def _plot_lines(self, objs):
+        for obj in objs:
+            self.plotter(obj)
 
     def delete_line(self, label):
         self._ax.lines.remove(self._label2line[label])
@@ -9,9 +9,7 @@ import matplotlib.pyplot as plt
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
 from gui_utils.auxilary_utils import GetFolderWidget, GetFileWidget, FeatureListWidget
-from models.rcnn import RecurrentCNN
-from models.cnn_classifier import Classifier
-from models.cnn_segmentator import Segmentator
+from models.registry import load_model
 from processing_utils.runner import BasicRunner
 from processing_utils.roi import construct_ROI
 from processing_utils.run_utils import Feature
@@ -105,22 +103,10 @@ class EvaluationParameterWindow(QtWidgets.QDialog):
             # to do: device should be customizable parameter
             test_folder = self.test_folder_getter.get_folder()
             if self.mode == 'all in one':
-                # to do: save models as pytorch scripts
-                model = RecurrentCNN().to(device)
-                path2weights = self.model_weights_getter.get_file()
-                model.load_state_dict(torch.load(path2weights, map_location=device))
-                model.eval()
-                models = [model]
+                models = [load_model('RecurrentCNN', self.model_weights_getter.get_file(), device)]
             elif self.mode == 'sequential':
-                classifier = Classifier().to(device)
-                path2classifier_weights = self.classifier_weights_getter.get_file()
-                classifier.load_state_dict(torch.load(path2classifier_weights, map_location=device))
-                classifier.eval()
-                segmentator = Segmentator().to(device)
-                path2segmentator_weights = self.segmentator_weights_getter.get_file()
-                segmentator.load_state_dict(torch.load(path2segmentator_weights, map_location=device))
-                segmentator.eval()
-                models = [classifier, segmentator]
+                models = [load_model('Classifier', self.classifier_weights_getter.get_file(), device),
+                          load_model('Segmentator', self.segmentator_weights_getter.get_file(), device)]
             else:
                 assert False, self.mode
             minimum_peak_points = int(self.peak_points_getter.text())
@@ -275,54 +261,58 @@ class EvaluationMainWindow(QtWidgets.QDialog):
         self.plot_feature(feature)
 
     def update(self):
+        files, dict_rois, rois = [], [], []
         for file in os.listdir(self.test_folder):
             if file[0] != '.':
                 with open(os.path.join(self.test_folder, file)) as json_file:
                     dict_roi = json.load(json_file)
-                # get predicted features
-                roi = construct_ROI(dict_roi)
-                features = self.runner(roi, 'predicted/' + file)
-                # append gt (ground truth) features
-                for border in dict_roi['borders']:
-                    gt = np.zeros(len(roi.i), dtype=np.bool)
-                    gt[border[0]:border[1]+1] = 1
-                    scan_frequency = (roi.scan[1] - roi.scan[0]) / (roi.rt[1] - roi.rt[0])
-                    rtmin = roi.rt[0] + border[0] / scan_frequency
-                    rtmax = roi.rt[0] + border[1] / scan_frequency
-                    match = False
-                    for feature in features:
-                        if len(feature) == 1 and feature.samples[0][:2] == 'pr':
-                            predicted_border = feature.borders[0]
-                            pred = np.zeros(len(roi.i), dtype=np.bool)
-                            pred[predicted_border[0]:predicted_border[1]+1] = 1
-                            # calculate iou
-                            intersection = (pred & gt).sum()  # will be zero if Truth=0 or Prediction=0
-                            union = (pred | gt).sum()
-                            if intersection / union > 0.5:
-                                match = True
-                                feature.append('gt/' + file, roi, border, 0, np.sum(roi.i[border[0]:border[1]]),
-                                               roi.mzmean, rtmin, rtmax)
-                                break
-                    if not match:
-                        features.append(Feature(['gt/' + file], [roi], [border], [0], [np.sum(roi.i[border[0]:border[1]])],
-                                                roi.mzmean, rtmin, rtmax, 0, 0))
-
-                # append tp, tn, fp, fn
+                files.append(file)
+                dict_rois.append(dict_roi)
+                rois.append(construct_ROI(dict_roi))
+        # get predicted features (ROIs are processed in batches)
+        predicted = self.runner.process_rois(rois, ['predicted/' + file for file in files])
+        for file, dict_roi, roi, features in zip(files, dict_rois, rois, predicted):
+            # append gt (ground truth) features
+            for border in dict_roi['borders']:
+                gt = np.zeros(len(roi.i), dtype=np.bool)
+                gt[border[0]:border[1]+1] = 1
+                scan_frequency = (roi.scan[1] - roi.scan[0]) / (roi.rt[1] - roi.rt[0])
+                rtmin = roi.rt[0] + border[0] / scan_frequency
+                rtmax = roi.rt[0] + border[1] / scan_frequency
+                match = False
                 for feature in features:
-                    if len(feature) == 2:
-                        self.tp_features.add_feature(feature)
-                    elif len(feature) == 1 and feature.samples[0][:2] == 'pr':
-                        self.fp_features.add_feature(feature)
-                    elif len(feature) == 1 and feature.samples[0][:2] == 'gt':
-                        self.fn_features.add_feature(feature)
-                    else:
-                        print(len(feature)), print(feature.samples[0][:2])
-                        assert False, feature.samples
-
-                if len(features) == 0:
-                    noise_feature = Feature(['noise/' + file], [roi], [[0, 0]], [0], [0],
-                                            roi.mzmean, roi.rt[0], roi.rt[1], 0, 0)
-                    self.tn_features.add_feature(noise_feature)
+                    if len(feature) == 1 and feature.samples[0][:2] == 'pr':
+                        predicted_border = feature.borders[0]
+                        pred = np.zeros(len(roi.i), dtype=np.bool)
+                        pred[predicted_border[0]:predicted_border[1]+1] = 1
+                        # calculate iou
+                        intersection = (pred & gt).sum()  # will be zero if Truth=0 or Prediction=0
+                        union = (pred | gt).sum()
+                        if intersection / union > 0.5:
+                            match = True
+                            feature.append('gt/' + file, roi, border, 0, np.sum(roi.i[border[0]:border[1]]),
+                                           roi.mzmean, rtmin, rtmax)
+                            break
+                if not match:
+                    features.append(Feature(['gt/' + file], [roi], [border], [0], [np.sum(roi.i[border[0]:border[1]])],
+                                            roi.mzmean, rtmin, rtmax, 0, 0))
+
+            # append tp, tn, fp, fn
+            for feature in features:
+                if len(feature) == 2:
+                    self.tp_features.add_feature(feature)
+                elif len(feature) == 1 and feature.samples[0][:2] == 'pr':
+                    self.fp_features.add_feature(feature)
+                elif len(feature) == 1 and feature.samples[0][:2] == 'gt':
+                    self.fn_features.add_feature(feature)
+                else:
+                    print(len(feature)), print(feature.samples[0][:2])
+                    assert False, feature.samples
+
+            if len(features) == 0:
+                noise_feature = Feature(['noise/' + file], [roi], [[0, 0]], [0], [0],
+                                        roi.mzmean, roi.rt[0], roi.rt[1], 0, 0)
+                self.tn_features.add_feature(noise_feature)
 
     def plot_feature(self, feature):
         self.ax.clear()
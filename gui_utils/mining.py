@@ -10,7 +10,8 @@ try:
     from cython_utils.roi import get_ROIs
 except ImportError:
     from processing_utils.roi import get_ROIs
-from processing_utils.roi import construct_ROI
+from processing_utils.roi import construct_ROI, get_ROIs_parallel
+from processing_utils.roi_cache import ROICache
 # from processing_utils.run_utils import classifier_prediction
 from gui_utils.abstract_main_window import AbtractMainWindow
 from gui_utils.auxilary_utils import FileListWidget, GetFolderWidget, ProgressBarsListItem
@@ -119,6 +120,11 @@ class AnnotationParameterWindow(QtWidgets.QDialog):
         self.dropped_points_getter = QtWidgets.QLineEdit(self)
         self.dropped_points_getter.setText('3')
 
+        n_jobs_label = QtWidgets.QLabel()
+        n_jobs_label.setText('Number of processes for ROI detection:')
+        self.n_jobs_getter = QtWidgets.QLineEdit(self)
+        self.n_jobs_getter.setText('1')
+
         run_button = QtWidgets.QPushButton('Run annotation')
         run_button.clicked.connect(self._run_button)
 
@@ -138,6 +144,8 @@ class AnnotationParameterWindow(QtWidgets.QDialog):
         #     parameter_layout.addWidget(self.peak_points_getter)
         parameter_layout.addWidget(dropped_points_label)
         parameter_layout.addWidget(self.dropped_points_getter)
+        parameter_layout.addWidget(n_jobs_label)
+        parameter_layout.addWidget(self.n_jobs_getter)
         parameter_layout.addWidget(run_button)
 
         # main layout
@@ -155,6 +163,9 @@ class AnnotationParameterWindow(QtWidgets.QDialog):
             delta_mz = float(self.mz_getter.text())
             required_points = int(self.roi_points_getter.text())
             dropped_points = int(self.dropped_points_getter.text())
+            n_jobs = int(self.n_jobs_getter.text())
+            if n_jobs < 1:
+                raise ValueError
             if self.mode == 'semi-automatic':
                 self.minimum_peak_points = int(self.peak_points_getter.text())
 
@@ -165,7 +176,12 @@ class AnnotationParameterWindow(QtWidgets.QDialog):
             if path2mzml is None:
                 raise ValueError
 
-            worker = Worker(get_ROIs, path2mzml, delta_mz, required_points, dropped_points)
+            cache = ROICache()
+            if n_jobs > 1:  # ROI detection in m/z slabs
+                worker = Worker(cache.detect, get_ROIs_parallel, path2mzml,
+                                delta_mz, required_points, dropped_points, n_jobs)
+            else:
+                worker = Worker(cache.detect, get_ROIs, path2mzml, delta_mz, required_points, dropped_points)
             worker.signals.result.connect(self._start_annotation)
             self.parent.run_thread('ROI detection:', worker)
 
@@ -224,7 +240,7 @@ class AnnotationMainWindow(QtWidgets.QDialog):
         #     # variables where save CNN predictions
         #     self.label = 0
         # shuffle ROIs
-        self.ROIs = ROIs
+        self.ROIs = list(ROIs)  # ROIBatch -> a list of ROI views
         np.random.seed(1313)
         np.random.shuffle(self.ROIs)
 
@@ -5,9 +5,8 @@ from gui_utils.abstract_main_window import AbtractMainWindow
 from gui_utils.auxilary_utils import FileListWidget, GetFileWidget
 from gui_utils.threading import Worker
 from processing_utils.runner import FilesRunner
-from models.rcnn import RecurrentCNN
-from models.cnn_classifier import Classifier
-from models.cnn_segmentator import Segmentator
+from processing_utils.roi_cache import ROICache
+from models.registry import load_model
 
 
 class ProcessingParameterWindow(QtWidgets.QDialog):
@@ -44,6 +43,12 @@ class ProcessingParameterWindow(QtWidgets.QDialog):
         A getter for dropped_points parameter
     peak_points_getter : QtWidgets.QLineEdit
         A getter for peak_minimum_points parameter
+    n_jobs_getter : QtWidgets.QLineEdit
+        A getter for number of processes for ROI detection
+    n_files_jobs_getter : QtWidgets.QLineEdit
+        A getter for number of files processed simultaneously
+    memory_limit_getter : QtWidgets.QLineEdit
+        A getter for memory limit (in GB) for simultaneous ROI detection
     """
     def __init__(self, files, mode, parent: AbtractMainWindow):
         self.parent = parent
@@ -116,6 +121,21 @@ class ProcessingParameterWindow(QtWidgets.QDialog):
         self.peak_points_getter = QtWidgets.QLineEdit(self)
         self.peak_points_getter.setText('8')
 
+        n_jobs_label = QtWidgets.QLabel()
+        n_jobs_label.setText('Number of processes for ROI detection:')
+        self.n_jobs_getter = QtWidgets.QLineEdit(self)
+        self.n_jobs_getter.setText('1')
+
+        n_files_jobs_label = QtWidgets.QLabel()
+        n_files_jobs_label.setText('Number of files processed simultaneously:')
+        self.n_files_jobs_getter = QtWidgets.QLineEdit(self)
+        self.n_files_jobs_getter.setText('1')
+
+        memory_limit_label = QtWidgets.QLabel()
+        memory_limit_label.setText('Memory limit for ROI detection, GB (empty means free memory):')
+        self.memory_limit_getter = QtWidgets.QLineEdit(self)
+        self.memory_limit_getter.setText('')
+
         parameters_layout.addWidget(mz_label)
         parameters_layout.addWidget(self.mz_getter)
         parameters_layout.addWidget(roi_points_label)
@@ -124,6 +144,12 @@ class ProcessingParameterWindow(QtWidgets.QDialog):
         parameters_layout.addWidget(self.dropped_points_getter)
         parameters_layout.addWidget(peak_points_label)
         parameters_layout.addWidget(self.peak_points_getter)
+        parameters_layout.addWidget(n_jobs_label)
+        parameters_layout.addWidget(self.n_jobs_getter)
+        parameters_layout.addWidget(n_files_jobs_label)
+        parameters_layout.addWidget(self.n_files_jobs_getter)
+        parameters_layout.addWidget(memory_limit_label)
+        parameters_layout.addWidget(self.memory_limit_getter)
 
         # run button
         run_button = QtWidgets.QPushButton('Run processing')
@@ -149,45 +175,34 @@ class ProcessingParameterWindow(QtWidgets.QDialog):
             required_points = int(self.roi_points_getter.text())
             dropped_points = int(self.dropped_points_getter.text())
             minimum_peak_points = int(self.peak_points_getter.text())
+            n_jobs = int(self.n_jobs_getter.text())
+            n_files_jobs = int(self.n_files_jobs_getter.text())
+            if n_jobs < 1 or n_files_jobs < 1:
+                raise ValueError
+            memory_limit = None
+            if self.memory_limit_getter.text().strip():
+                memory_limit = int(float(self.memory_limit_getter.text()) * 2 ** 30)
             path2mzml = []
             for file in self.list_of_files.selectedItems():
                 path2mzml.append(self.list_of_files.file2path[file.text()])
             if not path2mzml:
                 raise ValueError
             if self.mode == 'all in one':
-                # to do: save models as pytorch scripts
-                model = RecurrentCNN().to(device)
-                path2weights = self.weights_widget.get_file()
-                model.load_state_dict(torch.load(path2weights, map_location=device))
-                model.eval()
-                models = [model]
+                models = [load_model('RecurrentCNN', self.weights_widget.get_file(), device)]
             elif self.mode == 'sequential':
-                classifier = Classifier().to(device)
-                path2classifier_weights = self.weights_classifier_widget.get_file()
-                classifier.load_state_dict(torch.load(path2classifier_weights, map_location=device))
-                classifier.eval()
-                segmentator = Segmentator().to(device)
-                path2segmentator_weights = self.weights_segmentator_widget.get_file()
-                segmentator.load_state_dict(torch.load(path2segmentator_weights, map_location=device))
-                segmentator.eval()
-                models = [classifier, segmentator]
+                models = [load_model('Classifier', self.weights_classifier_widget.get_file(), device),
+                          load_model('Segmentator', self.weights_segmentator_widget.get_file(), device)]
             elif self.mode == 'simple':
                 self.mode = 'sequential'
-                classifier = Classifier().to(device)
-                path2classifier_weights = os.path.join('data', 'weights', 'Classifier.pt')
-                classifier.load_state_dict(torch.load(path2classifier_weights, map_location=device))
-                classifier.eval()
-                segmentator = Segmentator().to(device)
-                path2segmentator_weights = os.path.join('data', 'weights', 'Segmentator.pt')
-                segmentator.load_state_dict(torch.load(path2segmentator_weights, map_location=device))
-                segmentator.eval()
-                models = [classifier, segmentator]
+                models = [load_model('Classifier', os.path.join('data', 'weights', 'Classifier.pt'), device),
+                          load_model('Segmentator', os.path.join('data', 'weights', 'Segmentator.pt'), device)]
             else:
                 assert False, self.mode
 
             runner = FilesRunner(self.mode, models, delta_mz,
                                  required_points, dropped_points,
-                                 minimum_peak_points, device)
+                                 minimum_peak_points, device, n_jobs, ROICache(),
+                                 n_files_jobs, memory_limit)
 
             worker = Worker(runner, path2mzml, multiple_process=True)
             worker.signals.result.connect(self.parent.set_features)
@@ -10,7 +10,7 @@ import matplotlib.pyplot as plt
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
 from gui_utils.auxilary_utils import GetFolderWidget
-from training_utils.dataset import ROIDataset
+from training_utils.dataset import ROIDataset, BucketLoader
 from training_utils.training import train_model, CombinedLoss, accuracy, iou
 from models.rcnn import RecurrentCNN
 from models.cnn_classifier import Classifier
@@ -109,11 +109,12 @@ class TrainingMainWindow(QtWidgets.QDialog):
         # to do: device should be adjustable parameter
         device = torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
         if self.mode == 'all in one':
-            # create data loaders
+            # create data loaders (ROIs of similar length are padded to a batch)
+            batch_size = 64
             train_dataset = ROIDataset(path=train_folder, device=device, balanced=True)
-            train_loader = DataLoader(train_dataset, batch_size=1, shuffle=True)
+            train_loader = BucketLoader(train_dataset, batch_size=batch_size, shuffle=True)
             val_dataset = ROIDataset(path=val_folder, device=device, balanced=False)
-            val_loader = DataLoader(val_dataset, batch_size=1, shuffle=False)
+            val_loader = BucketLoader(val_dataset, batch_size=batch_size, shuffle=False)
             # create model
             model = RecurrentCNN().to(device)
             optimizer = optim.Adam(params=model.parameters(), lr=1e-3)
@@ -124,7 +125,7 @@ class TrainingMainWindow(QtWidgets.QDialog):
             # add training widget
             main_layout.addWidget(TrainingMainWidget(train_loader, val_loader, model, optimizer, accuracy, iou,
                                                      scheduler, label_criterion, integration_criterion,
-                                                     intersection_criterion, 64, self))
+                                                     intersection_criterion, 1, self))
         elif self.mode == 'sequential':
             # create data loaders
             batch_size = 64
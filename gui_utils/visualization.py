@@ -1,9 +1,20 @@
+import re
 from functools import partial
 from PyQt5 import QtWidgets, QtGui
 from gui_utils.abstract_main_window import AbtractMainWindow
 from gui_utils.auxilary_utils import ClickableListWidget, FileListWidget
 
 
+def parse_mz_list(text):
+    """
+    Parse a list of m/z values separated by commas, semicolons or spaces
+    """
+    mzs = [float(value) for value in re.split(r'[,;\s]+', text.strip()) if value]
+    if not mzs:
+        raise ValueError
+    return mzs
+
+
 class EICParameterWindow(QtWidgets.QDialog):
     def __init__(self, parent: AbtractMainWindow):
         self.parent = parent
@@ -12,7 +23,7 @@ class EICParameterWindow(QtWidgets.QDialog):
 
         mz_layout = QtWidgets.QHBoxLayout()
         mz_label = QtWidgets.QLabel(self)
-        mz_label.setText('m/z=')
+        mz_label.setText('m/z (comma separated list)=')
         self.mz_getter = QtWidgets.QLineEdit(self)
         self.mz_getter.setText('100.000')
         mz_layout.addWidget(mz_label)
@@ -37,16 +48,16 @@ class EICParameterWindow(QtWidgets.QDialog):
 
     def plot(self):
         try:
-            mz = float(self.mz_getter.text())
+            mzs = parse_mz_list(self.mz_getter.text())
             delta = float(self.delta_getter.text())
             for file in self.parent.get_selected_files():
                 file = file.text()
-                self.parent.plot_eic(file, mz, delta)
+                self.parent.plot_eics(file, mzs, delta)
             self.close()
         except ValueError:
             # popup window with exception
             msg = QtWidgets.QMessageBox(self)
-            msg.setText("'m/z' and 'delta' should be float numbers!")
+            msg.setText("'m/z' should be a list of float numbers and 'delta' should be a float number!")
             msg.setIcon(QtWidgets.QMessageBox.Warning)
             msg.exec_()
 
@@ -74,7 +85,7 @@ class VisualizationWindow(QtWidgets.QDialog):
 
         mz_layout = QtWidgets.QHBoxLayout()
         mz_label = QtWidgets.QLabel(self)
-        mz_label.setText('m/z=')
+        mz_label.setText('m/z (comma separated list)=')
         self.mz_getter = QtWidgets.QLineEdit(self)
         self.mz_getter.setText('100.000')
         mz_layout.addWidget(mz_label)
@@ -135,17 +146,16 @@ class VisualizationWindow(QtWidgets.QDialog):
                     self._plotted_list.addItem(label)
         elif mode == 'Extracted Ion Chromatogram (EIC)':
             try:
-                mz = float(self.mz_getter.text())
+                mzs = parse_mz_list(self.mz_getter.text())
                 delta = float(self.delta_getter.text())
                 for file in self._list_of_files.selectedItems():
                     file = file.text()
-                    plotted, label = self.parent.plot_eic(file, mz, delta)
-                    if plotted:
+                    for label in self.parent.plot_eics(file, mzs, delta):
                         self._plotted_list.addItem(label)
             except ValueError:
                 # popup window with exception
                 msg = QtWidgets.QMessageBox(self)
-                msg.setText("'mz' and 'delta' should be float numbers!")
+                msg.setText("'mz' should be a list of float numbers and 'delta' should be a float number!")
                 msg.setIcon(QtWidgets.QMessageBox.Warning)
                 msg.exec_()
 
@@ -1,18 +1,24 @@
+import copy
 import torch
 import torch.nn as nn
+from torch.nn.utils.fusion import fuse_conv_bn_eval
 
 
 def preprocessing(batch):
-    batch_size, _, n_peaks = batch.shape
-    processed_batch = batch.clone().view(batch_size, n_peaks)
-    # TO DO: rewrite without loop
-    for x in processed_batch:
-        x[x < 1e-4] = 0
-        pos = (x != 0)
-        x[pos] = torch.log10(x[pos])
-        x[pos] = x[pos] - torch.min(x[pos])
-        x[pos] = x[pos] / torch.max(x[pos])
-    return processed_batch.view(batch_size, 1, n_peaks)
+    """
+    Log-scaling of signals: points above 1e-4 are log-scaled and min-max normalized
+    within every signal, other points are set to zero (all signals are processed at once)
+    :param batch: torch.Tensor (batch_size, 1, n_points)
+    :return: torch.Tensor (batch_size, 1, n_points)
+    """
+    batch_size, _, n_points = batch.shape
+    x = batch.reshape(batch_size, n_points)
+    pos = ~(x < 1e-4)
+    x = torch.log10(torch.where(pos, x, torch.ones_like(x)))
+    x = x - torch.where(pos, x, torch.full_like(x, float('inf'))).min(dim=1, keepdim=True)[0]
+    x = x / torch.where(pos, x, torch.full_like(x, -float('inf'))).max(dim=1, keepdim=True)[0]
+    x = torch.where(pos, x, torch.zeros_like(x))
+    return x.view(batch_size, 1, n_points)
 
 
 class Block(nn.Module):
@@ -28,6 +34,15 @@ class Block(nn.Module):
     def forward(self, x):
         return self.basic_block(x)
 
+    def fuse(self):
+        """
+        Fold BatchNorm into the preceding convolution (inference only): the block
+        becomes a single convolution with ReLU
+        """
+        if len(self.basic_block) == 3:
+            conv, batch_norm, relu = self.basic_block
+            self.basic_block = nn.Sequential(fuse_conv_bn_eval(conv, batch_norm), relu)
+
 
 class Segmentator(nn.Module):
     def __init__(self):
@@ -81,6 +96,23 @@ class Segmentator(nn.Module):
             nn.Conv1d(16, 2, 1, padding=0)
         )
 
+    @property
+    def is_fused(self):
+        return not any(isinstance(module, nn.BatchNorm1d) for module in self.modules())
+
+    def fused(self):
+        """
+        A copy of the model in eval mode with BatchNorm layers folded into convolutions
+        (the model itself is returned if it is already fused)
+        """
+        if self.is_fused:
+            return self
+        model = copy.deepcopy(self).eval()
+        for module in list(model.modules()):
+            if isinstance(module, Block):
+                module.fuse()
+        return model
+
     def forward(self, x):
         x = torch.cat((x, preprocessing(x)), dim=1)
         starter = self.starter(x)
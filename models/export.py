@@ -0,0 +1,81 @@
+"""
+Export of models to TorchScript: the exported file contains the code and the weights
+of the model, so it is loaded without models package (see registry.ModelRegistry).
+
+Usage: python -m models.export ARCHITECTURE WEIGHTS [OUTPUT]
+"""
+import os
+import argparse
+import torch
+import torch.nn as nn
+from typing import Optional
+from models.rcnn import RecurrentCNN
+from models.cnn_classifier import Classifier
+from models.cnn_segmentator import Segmentator
+
+
+architectures = {'RecurrentCNN': RecurrentCNN, 'Classifier': Classifier, 'Segmentator': Segmentator}
+
+
+class Normalized(nn.Module):
+    """
+    Classifier or Segmentator with the normalization of signals folded in
+    """
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, x):
+        return self.model(x / torch.max(x, dim=2, keepdim=True)[0])
+
+
+class NormalizedRecurrent(nn.Module):
+    """
+    RecurrentCNN with the normalization of signals folded in
+    """
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, x, lengths: Optional[torch.Tensor] = None):
+        return self.model(x / torch.max(x, dim=2, keepdim=True)[0], lengths)
+
+
+def scripted_path(path):
+    """
+    Default path of exported model: 'RecurrentCNN.pt' -> 'RecurrentCNN.script.pt'
+    """
+    root, extension = os.path.splitext(path)
+    return root + '.script' + (extension or '.pt')
+
+
+def export_model(architecture, weights, output=None):
+    """
+    Script the model, freeze it (weights become constants) and save
+    :param architecture: a name of model class ('RecurrentCNN', 'Classifier' or 'Segmentator')
+    :param weights: path to weights (state dict)
+    :param output: path to exported model (see scripted_path by default)
+    :return: path to exported model
+    """
+    if architecture not in architectures:
+        raise ValueError(f'unknown architecture: {architecture}')
+    model = architectures[architecture]()
+    model.load_state_dict(torch.load(weights, map_location='cpu'))
+    wrapper = NormalizedRecurrent if architecture == 'RecurrentCNN' else Normalized
+    scripted = torch.jit.freeze(torch.jit.script(wrapper(model).eval()))
+    output = output or scripted_path(weights)
+    torch.jit.save(scripted, output, _extra_files={'architecture': architecture})
+    return output
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export a model to TorchScript')
+    parser.add_argument('architecture', choices=sorted(architectures))
+    parser.add_argument('weights', help='path to weights (state dict)')
+    parser.add_argument('output', nargs='?', default=None, help='path to exported model')
+    args = parser.parse_args()
+    print(export_model(args.architecture, args.weights, args.output))
+
+
+if __name__ == '__main__':
+    main()
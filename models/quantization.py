@@ -0,0 +1,51 @@
+"""
+Int8 quantization of models for CPU inference: LSTM and Linear layers are
+quantized dynamically (weights are int8, activations are quantized on the fly),
+conv stacks of Classifier and Segmentator are quantized statically with FX
+graph mode quantization, which needs calibration signals.
+"""
+import copy
+import torch
+import torch.nn as nn
+from torch.ao.quantization import quantize_dynamic, get_default_qconfig_mapping
+from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+
+# conv stacks which are quantized statically (they are nn.Sequential without custom code)
+conv_stacks = {'Classifier': ['convBlock'],
+               'Segmentator': ['starter', 'pass_down1', 'pass_down2', 'code', 'pass_up2', 'pass_up1', 'finisher']}
+
+
+def quantize_model(model, calibration=None, backend=None):
+    """
+    Quantize a copy of the model for CPU inference
+    :param model: RecurrentCNN, Classifier or Segmentator
+    :param calibration: a batch of preprocessed signals (torch.Tensor) for static quantization
+        of conv stacks (only LSTM and Linear layers are quantized if it is None)
+    :param backend: quantized engine ('x86', 'fbgemm', 'qnnpack', current engine by default),
+        the current engine is restored after quantization
+    :return: quantized model in eval mode
+    """
+    if isinstance(model, torch.jit.ScriptModule):
+        raise ValueError('exported models can not be quantized, use their weights (state dicts)')
+    # the engine is only switched while the model is quantized: packed weights keep their backend,
+    # so the quantized model runs without changing the global setting
+    previous = torch.backends.quantized.engine
+    backend = backend or previous
+    torch.backends.quantized.engine = backend
+    try:
+        model = copy.deepcopy(model).cpu().eval()
+        stacks = conv_stacks.get(model.__class__.__name__, [])
+        if calibration is not None and stacks:
+            qconfig_mapping = get_default_qconfig_mapping(backend)
+            calibration = calibration.cpu()
+            for name in stacks:
+                # example inputs are only needed to trace the stack
+                setattr(model, name, prepare_fx(getattr(model, name), qconfig_mapping, (calibration[:1],)))
+            with torch.no_grad():  # observers collect ranges of activations
+                model(calibration)
+            for name in stacks:
+                setattr(model, name, convert_fx(getattr(model, name)))
+        return quantize_dynamic(model, {nn.LSTM, nn.Linear}, dtype=torch.qint8)
+    finally:
+        torch.backends.quantized.engine = previous
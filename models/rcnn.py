@@ -1,5 +1,8 @@
 import torch
 import torch.nn as nn
+from typing import Optional
+from torch.nn.utils.rnn import pack_padded_sequence, pad_packed_sequence
+from models.cnn_segmentator import preprocessing
 
 
 class EncodingCNN(nn.Module):
@@ -15,8 +18,13 @@ class EncodingCNN(nn.Module):
             nn.ReLU()
         )
 
-    def forward(self, x):
-        return self.encoding(x).transpose(2, 1)
+    def forward(self, x, mask: Optional[torch.Tensor] = None):  # annotated for TorchScript
+        if mask is None:
+            return self.encoding(x).transpose(2, 1)
+        # padding is zeroed after every layer: convolutions see the same zeros as at the end of unpadded signal
+        for layer in self.encoding:
+            x = layer(x) * mask
+        return x.transpose(2, 1)
 
 
 class RecurrentCNN(nn.Module):
@@ -29,23 +37,27 @@ class RecurrentCNN(nn.Module):
         self.classifier = nn.Linear(128, 2)
         self.integrator = nn.Linear(128, 2)
 
-    def _preprocessing(self, batch):
-        batch_size, _, n_points = batch.shape
-        processed_batch = batch.clone().view(batch_size, n_points)
-        # TO DO: rewrite without loop
-        for x in processed_batch:
-            x[x < 1e-4] = 0
-            pos = (x != 0)
-            x[pos] = torch.log10(x[pos])
-            x[pos] = x[pos] - torch.min(x[pos])
-            x[pos] = x[pos] / torch.max(x[pos])
-        return processed_batch.view(batch_size, 1, n_points)
-
-    def forward(self, x):
-        x = torch.cat((x, self._preprocessing(x)), dim=1)
-        x = self.encoding(x)
-        x, _ = self.biLSTM(x)
-        integrator_input, (classifier_input, _) = self.LSTM(x)
+    def forward(self, x, lengths: Optional[torch.Tensor] = None):  # annotated for TorchScript
+        """
+        :param x: a batch of signals (batch_size, 1, n_points)
+        :param lengths: torch.Tensor, lengths of signals if they are padded with zeros at the end (optional),
+            padding doesn't change the outputs for real points (LSTMs process packed sequences)
+        :return: classifier output (batch_size, 2) and integrator output (batch_size, 2, n_points)
+        """
+        if lengths is None:
+            x = torch.cat((x, preprocessing(x)), dim=1)
+            x = self.encoding(x)
+            x, _ = self.biLSTM(x)
+            integrator_input, (classifier_input, _) = self.LSTM(x)
+        else:
+            lengths = lengths.to(device=torch.device('cpu'), dtype=torch.int64)
+            n_points = x.shape[2]
+            mask = (torch.arange(n_points) < lengths.view(-1, 1)).to(x.device, x.dtype).unsqueeze(1)
+            x = torch.cat((x * mask, preprocessing(x * mask)), dim=1)
+            x = self.encoding(x, mask)
+            packed, _ = self.biLSTM(pack_padded_sequence(x, lengths, batch_first=True, enforce_sorted=False))
+            packed, (classifier_input, _) = self.LSTM(packed)
+            integrator_input, _ = pad_packed_sequence(packed, batch_first=True, total_length=n_points)
         classifier_output = self.classifier(classifier_input[0])
         integrator_output = self.integrator(integrator_input)
         return classifier_output, integrator_output.transpose(2, 1)
@@ -0,0 +1,132 @@
+import os
+import zipfile
+import importlib
+import threading
+import torch
+
+
+# modules of architectures are imported only to load weights (state dicts), exported models don't need them
+architectures = {'RecurrentCNN': 'models.rcnn', 'Classifier': 'models.cnn_classifier',
+                 'Segmentator': 'models.cnn_segmentator'}
+
+
+def is_scripted(path):
+    """
+    Check if file is a TorchScript model (see export.export_model), not a state dict
+    """
+    if not zipfile.is_zipfile(path):
+        return False
+    with zipfile.ZipFile(path) as archive:
+        return any('/code/' in name for name in archive.namelist())
+
+
+def load_scripted(path, device):
+    """
+    Load exported model (the code of the model is stored in file)
+    :param path: path to exported model
+    :param device: cpu or gpu
+    :return: a tuple (architecture, torch.jit.ScriptModule)
+    """
+    extra_files = {'architecture': ''}
+    model = torch.jit.load(path, map_location=device, _extra_files=extra_files)
+    architecture = extra_files['architecture']
+    if isinstance(architecture, bytes):
+        architecture = architecture.decode()
+    return architecture, model
+
+
+class ModelRegistry:
+    """
+    Process-wide storage of loaded models: a model is loaded once, switched to
+    eval mode and warmed up with a dummy batch, then it is reused by all runners.
+    Weights are either a state dict or an exported model (see export.export_model),
+    the latter is loaded as TorchScript without constructing the model in Python.
+    Models are keyed by (architecture, weights path, weights mtime, device), so
+    changed weights are reloaded.
+
+    Attributes
+    ----------
+    warmup_points : int
+        length of signals in the dummy batch
+    """
+    warmup_points = 256
+
+    def __init__(self):
+        self._models = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(architecture, path, device):
+        path = os.path.abspath(path)
+        return architecture, path, os.stat(path).st_mtime_ns, str(torch.device(device))
+
+    def get(self, architecture, path, device):
+        """
+        Get a loaded model
+        :param architecture: a name of model class ('RecurrentCNN', 'Classifier' or 'Segmentator')
+        :param path: path to weights (state dict or exported model)
+        :param device: cpu or gpu
+        :return: nn.Module in eval mode or torch.jit.ScriptModule
+        """
+        if architecture not in architectures:
+            raise ValueError(f'unknown architecture: {architecture}')
+        key = self.key(architecture, path, device)
+        with self._lock:
+            model = self._models.get(key)
+            if model is None:
+                # weights were changed: the old model isn't needed
+                self._evict(lambda other: other[:2] == key[:2] and other[3] == key[3])
+                model = self._load(architecture, path, device)
+                self._models[key] = model
+        return model
+
+    def _load(self, architecture, path, device):
+        if is_scripted(path):
+            scripted_architecture, model = load_scripted(path, device)
+            if scripted_architecture != architecture:
+                raise ValueError(f'{path} contains {scripted_architecture}, not {architecture}')
+            if torch.device(device).type == 'cpu':
+                model = torch.jit.optimize_for_inference(model)
+        else:
+            model = getattr(importlib.import_module(architectures[architecture]), architecture)().to(device)
+            model.load_state_dict(torch.load(path, map_location=device))
+            model.eval()
+            if hasattr(model, 'fused'):  # BatchNorm is folded into convolutions
+                model = model.fused()
+        with torch.no_grad():  # the first forward pass is slow (memory allocation, kernels choice)
+            model(torch.rand(2, 1, self.warmup_points, device=device))
+        return model
+
+    def evict(self, architecture=None, path=None, device=None):
+        """
+        Drop loaded models (all models matching the given parameters)
+        :return: number of dropped models
+        """
+        path = None if path is None else os.path.abspath(path)
+        device = None if device is None else str(torch.device(device))
+
+        def match(key):
+            return all(value is None or value == key_value
+                       for value, key_value in zip((architecture, path, device), (key[0], key[1], key[3])))
+
+        with self._lock:
+            return self._evict(match)
+
+    def _evict(self, match):
+        keys = [key for key in self._models if match(key)]
+        for key in keys:
+            del self._models[key]
+        return len(keys)
+
+    def __len__(self):
+        return len(self._models)
+
+
+registry = ModelRegistry()
+
+
+def load_model(architecture, path, device):
+    """
+    Get a loaded model from the process-wide registry (see ModelRegistry.get)
+    """
+    return registry.get(architecture, path, device)
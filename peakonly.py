@@ -7,6 +7,7 @@ import matplotlib.pyplot as plt
 from PyQt5 import QtWidgets, QtGui, QtCore
 from processing_utils.postprocess import ResultTable
 from processing_utils.run_utils import find_mzML
+from processing_utils.scan_store import ScanStore
 from gui_utils.abstract_main_window import AbtractMainWindow
 from gui_utils.auxilary_utils import ProgressBarsListItem
 from gui_utils.mining import AnnotationParameterWindow, ReAnnotationParameterWindow
@@ -371,10 +372,12 @@ class FileContextMenu(QtWidgets.QMenu):
 
         tic = QtWidgets.QAction('Plot TIC', parent)
         eic = QtWidgets.QAction('Plot EIC', parent)
+        store = QtWidgets.QAction('Convert to binary scan store', parent)
         close = QtWidgets.QAction('Close', parent)
 
         menu.addAction(tic)
         menu.addAction(eic)
+        menu.addAction(store)
         menu.addAction(close)
 
         action = menu.exec_(QtGui.QCursor.pos())
@@ -386,9 +389,18 @@ class FileContextMenu(QtWidgets.QMenu):
         elif action == eic:
             subwindow = EICParameterWindow(self.parent)
             subwindow.show()
+        elif action == store:
+            self.build_scan_stores()
         elif action == close:
             self.close_files()
 
+    def build_scan_stores(self):
+        # TIC, EIC, ROI detection and zero filling read the store instead of *.mzML file
+        for item in self.parent.get_selected_files():
+            file = item.text()
+            worker = Worker(ScanStore.build, self.parent._list_of_files.file2path[file])
+            self.parent.run_thread(f'Converting {file}:', worker)
+
     def close_files(self):
         for item in self.parent.get_selected_files():
             self.parent.close_file(item)
@@ -0,0 +1,333 @@
+import os
+import re
+import zlib
+import base64
+import numpy as np
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+_INDEX_LIST_OFFSET = re.compile(rb'<indexListOffset>\s*(\d+)\s*</indexListOffset>')
+_SPECTRUM_INDEX = re.compile(rb'<index\s+name="spectrum"\s*>(.*?)</index>', re.DOTALL)
+_OFFSET = re.compile(rb'<offset[^>]*>\s*(\d+)\s*</offset>')
+_CV_PARAM = re.compile(rb'<cvParam\s[^>]*?accession="(MS:1000511|MS:1000285|MS:1000016)"[^>]*>')
+_ATTRIBUTE = re.compile(rb'(\w+)="([^"]*)"')
+
+_DTYPES = {b'MS:1000521': '<f4', b'MS:1000523': '<f8', b'MS:1000519': '<i4', b'MS:1000522': '<i8'}
+
+_HEADER_END = (b'<binaryDataArrayList', b'</spectrum>')
+_READ_SIZE = 4096
+
+
+class Spectrum:
+    """
+    A decoded spectrum (has the same attributes as pymzml spectrum, which are used in peakonly)
+
+    Attributes
+    ----------
+    ms_level : int
+        -
+    mz : np.ndarray
+        m/z values
+    i : np.ndarray
+        intensities
+    scan_time : tuple
+        (retention time, unit)
+    TIC : float
+        total ion current
+    """
+    __slots__ = ('ms_level', 'mz', 'i', 'scan_time', 'TIC')
+
+    def __init__(self, ms_level, mz, i, scan_time, TIC):
+        self.ms_level = ms_level
+        self.mz = mz
+        self.i = i
+        self.scan_time = scan_time
+        self.TIC = TIC
+
+
+def spectrum_offsets(file):
+    """
+    Offsets of spectra from the index of indexed *.mzML file
+    :param file: file opened in binary mode
+    :return: sorted np.ndarray of offsets or None if file is not indexed
+    """
+    file.seek(0, 2)
+    size = file.tell()
+    file.seek(max(size - _READ_SIZE, 0))
+    match = _INDEX_LIST_OFFSET.search(file.read())
+    if match is None or int(match.group(1)) >= size:
+        return None
+    file.seek(int(match.group(1)))
+    index = _SPECTRUM_INDEX.search(file.read())
+    if index is None:
+        return None
+    return np.sort(np.array([int(offset) for offset in _OFFSET.findall(index.group(1))], dtype=np.int64))
+
+
+def _read_until(file, offset, markers):
+    """
+    Read file from offset until one of markers (the marker is not included)
+    """
+    file.seek(offset)
+    chunk = b''
+    size = _READ_SIZE
+    while True:
+        data = file.read(size)
+        size *= 2  # long spectra are read in a few steps
+        # a marker can be split between reads
+        start = max(len(chunk) - max(map(len, markers)), 0)
+        chunk += data
+        positions = [chunk.find(marker, start) for marker in markers]
+        positions = [position for position in positions if position != -1]
+        if positions:
+            return chunk[:min(positions)]
+        if not data:
+            return chunk
+
+
+def _spectrum_parameters(header):
+    """
+    ms level, TIC and scan time from the spectrum header (everything before binary data arrays)
+    :return: a tuple (ms level, TIC or None, (scan time, unit))
+    """
+    ms_level, tic, scan_time = None, None, (None, None)
+    for match in _CV_PARAM.finditer(header):
+        attributes = dict(_ATTRIBUTE.findall(match.group(0)))
+        value = attributes.get(b'value')
+        if match.group(1) == b'MS:1000511':
+            ms_level = int(value)
+        elif match.group(1) == b'MS:1000285':
+            tic = float(value)
+        elif scan_time[0] is None:  # MS:1000016, scan start time
+            scan_time = (float(value), attributes.get(b'unitName', b'unicorns').decode())
+    return ms_level, tic, scan_time
+
+
+def _binary_arrays(spectrum):
+    """
+    Split binary data arrays of the spectrum (str.find is used: regular expressions are slow on long base64 text)
+    :return: a generator of (parameters, binary) tuples, where parameters are bytes before <binary>
+    """
+    position = spectrum.find(b'<binaryDataArrayList')
+    while position != -1:
+        begin = spectrum.find(b'<binaryDataArray ', position + 1)
+        if begin == -1:
+            begin = spectrum.find(b'<binaryDataArray>', position + 1)
+        if begin == -1:
+            return
+        end = spectrum.find(b'</binaryDataArray>', begin)
+        binary_begin = spectrum.find(b'<binary>', begin, end)
+        if binary_begin == -1:  # an empty array: <binary/>
+            yield spectrum[begin:end], b''
+        else:
+            yield spectrum[begin:binary_begin], spectrum[binary_begin + 8:spectrum.find(b'</binary>', binary_begin)]
+        position = end
+
+
+def _decode_array(parameters, binary):
+    """
+    Decode binary data array (zlib or no compression, 32 or 64-bit float or integer)
+    """
+    if b'MS:1000574' in parameters:
+        decompress = zlib.decompress
+    elif b'MS:1000576' in parameters:
+        decompress = bytes
+    else:  # numpress and other compressions are not supported
+        raise ValueError('unsupported compression')
+    dtypes = [dtype for accession, dtype in _DTYPES.items() if accession in parameters]
+    if len(dtypes) != 1:
+        raise ValueError('unsupported binary data type')
+    dtype, = dtypes
+    return np.frombuffer(decompress(base64.b64decode(binary)), dtype=dtype)
+
+
+def decode_spectrum(spectrum):
+    """
+    Decode m/z and intensity arrays of the spectrum
+    :param spectrum: bytes of spectrum element
+    :return: a tuple of np.ndarray (mz, i)
+    """
+    mz, i = np.zeros(0), np.zeros(0, dtype=np.float32)
+    for parameters, binary in _binary_arrays(spectrum):
+        if b'MS:1000514' in parameters:
+            mz = _decode_array(parameters, binary)
+        elif b'MS:1000515' in parameters:
+            i = _decode_array(parameters, binary)
+    return mz, i
+
+
+def read_spectrum(file, offset):
+    """
+    Read and decode the spectrum at offset of *.mzML file
+    :param file: file opened in binary mode
+    :param offset: offset of spectrum (from the index)
+    :return: a tuple of np.ndarray (mz, i)
+    """
+    return decode_spectrum(_read_until(file, offset, (b'</spectrum>',)))
+
+
+def read_headers(path, progress_callback=None):
+    """
+    Read parameters of all spectra from indexed *.mzML file without parsing binary data arrays
+    :param path: path to mzml file
+    :param progress_callback: an pyQt5 signal to visualize progress
+    :return: a dict with 'offset', 'ms level', 'rt', 'tic' (nan if there is no TIC in header)
+        arrays and 'time unit' (of the first MS1 spectrum) or None if file can't be read this way
+    """
+    with open(path, 'rb') as file:
+        offsets = spectrum_offsets(file)
+        if offsets is None:
+            return None
+        ms_levels = np.zeros(len(offsets), dtype=np.int8)
+        rt = np.full(len(offsets), np.nan)
+        tic = np.full(len(offsets), np.nan)
+        t_measure = None
+        for k, offset in enumerate(offsets):
+            header = _read_until(file, offset, _HEADER_END)
+            if not header.startswith(b'<spectrum'):  # broken index
+                return None
+            ms_level, total, (t, measure) = _spectrum_parameters(header)
+            ms_levels[k] = ms_level or 0
+            if t is not None:
+                rt[k] = t
+            if total is not None:
+                tic[k] = total
+            if ms_level == 1 and not t_measure:
+                t_measure = measure
+            if progress_callback is not None and not k % 100:
+                progress_callback.emit(int(k * 100 / len(offsets)))
+    return {'offset': offsets, 'ms level': ms_levels, 'rt': rt, 'tic': tic, 'time unit': t_measure}
+
+
+def read_tic(path, progress_callback=None):
+    """
+    Read TIC of MS1 spectra from indexed *.mzML file without parsing binary data arrays:
+    only spectrum headers are read (intensities are decoded only if there is no TIC in header)
+    :param path: path to mzml file
+    :param progress_callback: an pyQt5 signal to visualize progress
+    :return: a tuple of lists (scan times, TIC, time unit) or None if file can't be read this way
+    """
+    headers = read_headers(path, progress_callback)
+    if headers is None:
+        return None
+    ms1 = headers['ms level'] == 1
+    tic = headers['tic'][ms1]
+    missing = np.flatnonzero(np.isnan(tic))
+    if len(missing):
+        with open(path, 'rb') as file:
+            try:
+                for k, offset in zip(missing, headers['offset'][ms1][missing]):
+                    _, i = read_spectrum(file, offset)
+                    tic[k] = np.sum(i, dtype=np.float64)
+            except (ValueError, zlib.error):
+                return None
+    return list(headers['rt'][ms1]), list(tic), headers['time unit']
+
+
+def parse_spectrum(spectrum):
+    """
+    Parse and decode the spectrum
+    :param spectrum: bytes of spectrum element
+    :return: Spectrum
+    """
+    ms_level, tic, scan_time = _spectrum_parameters(_read_header(spectrum))
+    mz, i = decode_spectrum(spectrum)
+    if tic is None:
+        tic = float(np.sum(i, dtype=np.float64))
+    return Spectrum(ms_level, mz, i, scan_time, tic)
+
+
+def _read_header(spectrum):
+    positions = [spectrum.find(marker) for marker in _HEADER_END]
+    positions = [position for position in positions if position != -1]
+    return spectrum[:min(positions)] if positions else spectrum
+
+
+class IndexedReader:
+    """
+    Reader of indexed *.mzML file: spectra are located by the index and read in
+    the calling thread, while base64 decoding and decompression (zlib releases
+    the GIL) are done by a pool of threads. Spectra are yielded in the order of file.
+
+    Parameters
+    ----------
+    path : str
+        -
+    offsets : np.ndarray
+        -
+    n_threads : int
+        -
+    prefetch : int
+        -
+
+    Attributes
+    ----------
+    path : str
+        path to *.mzML file
+    offsets : np.ndarray
+        sorted offsets of spectra
+    n_threads : int
+        number of threads for decoding
+    prefetch : int
+        maximal number of spectra read ahead of the consumer
+    """
+    def __init__(self, path, offsets, n_threads=None, prefetch=None):
+        self.path = path
+        self.offsets = offsets
+        self.n_threads = n_threads or min(4, os.cpu_count() or 1)
+        self.prefetch = prefetch or 4 * self.n_threads
+
+    @classmethod
+    def open(cls, path, n_threads=None, prefetch=None):
+        """
+        Open indexed *.mzML file
+        :param path: path to mzml file
+        :return: IndexedReader or None if file is not indexed or its arrays can't be decoded
+        """
+        with open(path, 'rb') as file:
+            offsets = spectrum_offsets(file)
+            if offsets is None or not len(offsets):
+                return None
+            first = _read_until(file, offsets[0], (b'</spectrum>',))
+        if not first.startswith(b'<spectrum'):  # broken index
+            return None
+        try:
+            parse_spectrum(first)
+        except (ValueError, zlib.error):  # unsupported compression
+            return None
+        return cls(path, offsets, n_threads, prefetch)
+
+    def get_spectrum_count(self):
+        return len(self.offsets)
+
+    def spectra(self, ms_level=None):
+        """
+        Iterate over spectra, the level of spectrum is checked in its header, so
+        arrays of other spectra are neither read nor decoded
+        :param ms_level: the required ms level (all spectra if None)
+        :return: a generator of (number of spectrum in file, Spectrum) tuples
+        """
+        with open(self.path, 'rb') as file, ThreadPoolExecutor(self.n_threads) as executor:
+            pending = deque()
+            for number, offset in enumerate(self.offsets):
+                if ms_level is not None:
+                    level, _, _ = _spectrum_parameters(_read_until(file, offset, _HEADER_END))
+                    if level != ms_level:
+                        continue
+                if number + 1 < len(self.offsets):
+                    file.seek(offset)
+                    chunk = file.read(self.offsets[number + 1] - offset)
+                else:
+                    chunk = _read_until(file, offset, (b'</spectrum>',))
+                pending.append((number, executor.submit(parse_spectrum, chunk)))
+                if len(pending) >= self.prefetch:
+                    number, future = pending.popleft()
+                    yield number, future.result()
+            while pending:
+                number, future = pending.popleft()
+                yield number, future.result()
+
+    def __iter__(self):
+        for _, spectrum in self.spectra():
+            yield spectrum
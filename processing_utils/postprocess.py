@@ -1,7 +1,8 @@
-import pymzml
 import numpy as np
 import pandas as pd
 from tqdm import tqdm
+from processing_utils.scan_store import ScanStore, open_run, iter_spectra
+from processing_utils.mzml_index import read_headers, read_spectrum
 
 
 class ResultTable:
@@ -24,26 +25,33 @@ class ResultTable:
     def fill_zeros(self, delta_mz):
         print('zero filling...')
         for file, k in tqdm(self.files.items()):
-            # read all scans in mzML file
-            run = pymzml.run.Reader(file)
-            scans = []
-            for scan in run:
-                scans.append(scan)
-
-            begin_time = scans[0].scan_time[0]
-            end_time = scans[-1].scan_time[0]
-            frequency = len(scans) / (end_time - begin_time)
-            for m, intensity in enumerate(self.intensities[k]):
-                if intensity == 0:
-                    mz = self.mz[m]
-                    begin = int((self.rtmin[m] - begin_time) * frequency) - 1
-                    end = int((self.rtmax[m] - begin_time) * frequency) + 1
-                    for scan in scans[begin:end]:
-                        pos = np.searchsorted(scan.mz, mz)
-                        if pos < len(scan.mz) and mz - delta_mz < scan.mz[pos] < mz + delta_mz:
-                            self.intensities[k, m] += scan.i[pos]
-                        if pos >= 1 and mz - delta_mz < scan.mz[pos - 1] < mz + delta_mz:
-                            self.intensities[k, m] += scan.i[pos - 1]
+            zeros = np.flatnonzero(self.intensities[k] == 0)
+            if not len(zeros):
+                continue
+            # features are sorted by m/z to be matched with scans
+            zeros = zeros[np.argsort(self.mz[zeros], kind='stable')]
+            mz = self.mz[zeros]
+            with _MS1Scans(file) as scans:
+                # windows of scans (with one additional scan at every side)
+                begin = np.maximum(np.searchsorted(scans.rt, self.rtmin[zeros], side='left') - 1, 0)
+                end = np.minimum(np.searchsorted(scans.rt, self.rtmax[zeros], side='right') + 1, len(scans.rt))
+                # only scans from the union of windows are decoded
+                coverage = np.zeros(len(scans.rt) + 1, dtype=np.int64)
+                np.add.at(coverage, begin, 1)
+                np.add.at(coverage, end, -1)
+                needed = np.flatnonzero(np.cumsum(coverage[:-1]) > 0)
+                filled = np.zeros(len(zeros))
+                for number, (scan_mz, scan_i) in zip(needed, scans.read(needed)):
+                    if not len(scan_mz):
+                        continue
+                    active = (begin <= number) & (number < end)
+                    pos = np.searchsorted(scan_mz, mz)
+                    for closest in (pos, pos - 1):  # neighbours from both sides
+                        matched = np.flatnonzero(active & (closest >= 0) & (closest < len(scan_mz)))
+                        point = closest[matched]
+                        near = (mz[matched] - delta_mz < scan_mz[point]) & (scan_mz[point] < mz[matched] + delta_mz)
+                        filled[matched[near]] += scan_i[point[near]]
+            self.intensities[k, zeros] += filled
 
     def to_csv(self, path):
         df = pd.DataFrame()
@@ -53,3 +61,66 @@ class ResultTable:
         for file, k in self.files.items():
             df[file] = self.intensities[k]
         df.to_csv(path)
+
+
+class _MS1Scans:
+    """
+    Random access to MS1 scans of *.mzML file: scan store, indexed *.mzML
+    or (if there is no index) two passes through file
+
+    Parameters
+    ----------
+    path : str
+        path to *.mzML file
+
+    Attributes
+    ----------
+    rt : np.ndarray
+        retention times of MS1 scans
+    """
+    def __init__(self, path):
+        self.path = path
+        self._store = ScanStore.open(path)
+        self._headers = None
+        self._file = None
+        if self._store is not None:
+            self._numbers = np.flatnonzero(self._store.ms_level == 1)
+            self.rt = self._store.rt[self._numbers]
+            return
+        self._headers = read_headers(path)
+        if self._headers is not None:
+            self._numbers = np.flatnonzero(self._headers['ms level'] == 1)
+            self.rt = self._headers['rt'][self._numbers]
+            self._file = open(path, 'rb')
+        else:
+            self.rt = np.array([scan.scan_time[0] for _, scan in iter_spectra(open_run(path), 1)])
+
+    def read(self, numbers):
+        """
+        Read the MS1 scans by their numbers (in increasing order)
+        :return: a generator of (mz, i) tuples
+        """
+        if self._store is not None:
+            for number in numbers:
+                scan = self._store[self._numbers[number]]
+                yield scan.mz, scan.i
+        elif self._headers is not None:
+            for number in numbers:
+                yield read_spectrum(self._file, self._headers['offset'][self._numbers[number]])
+        else:
+            numbers = iter(numbers)
+            wanted = next(numbers, None)
+            ms1 = (scan for _, scan in iter_spectra(open_run(self.path), 1))
+            for number, scan in enumerate(ms1):
+                if wanted is None:
+                    break
+                if number == wanted:
+                    yield scan.mz, scan.i
+                    wanted = next(numbers, None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        if self._file is not None:
+            self._file.close()
@@ -1,8 +1,11 @@
+import os
 import json
-import pymzml
 import numpy as np
 from tqdm import tqdm
-from bintrees import FastAVLTree
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from processing_utils.scan_store import ScanStore, open_run, iter_spectra
+from processing_utils.mzml_index import read_tic
 
 
 def construct_ROI(roi_dict):
@@ -53,10 +56,163 @@ class ROI:
             json.dump(roi, jsonfile)
 
 
-class ProcessROI(ROI):
-    def __init__(self, scan, rt, i, mz, mzmean):
-        super().__init__(scan, rt, i, mz, mzmean)
-        self.points = 1
+class ROIBatch:
+    """
+    Columnar storage of ROIs
+
+    Points of all ROIs lay one after another in contiguous float32 buffers,
+    the points of k-th ROI are i[offsets[k]:offsets[k + 1]]. Indexing by
+    integer returns a lightweight ROI object, which intensities and m/z are
+    views of the buffers (no copy).
+
+    Parameters
+    ----------
+    i : np.ndarray
+        intensities of all ROIs
+    mz : np.ndarray
+        m/z values of all ROIs
+    offsets : np.ndarray
+        an array of len(ROIBatch) + 1 positions of ROIs in buffers
+    scan : np.ndarray
+        an (len(ROIBatch), 2) array with the first and the last scans of ROIs
+    rt : np.ndarray
+        an (len(ROIBatch), 2) array with retention time borders of ROIs
+    mzmean : np.ndarray
+        mean m/z of ROIs
+
+    Attributes
+    ----------
+    i : np.ndarray
+        intensities of all ROIs (float32)
+    mz : np.ndarray
+        m/z values of all ROIs (float32)
+    offsets : np.ndarray
+        positions of ROIs in buffers (int64)
+    scan : np.ndarray
+        the first and the last scans of ROIs (int64)
+    rt : np.ndarray
+        retention time borders of ROIs (float64)
+    mzmean : np.ndarray
+        mean m/z of ROIs (float64)
+    """
+    columns = ('i', 'mz', 'offsets', 'scan', 'rt', 'mzmean')
+
+    def __init__(self, i, mz, offsets, scan, rt, mzmean):
+        self.i = np.asarray(i, dtype=np.float32)
+        self.mz = np.asarray(mz, dtype=np.float32)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.scan = np.asarray(scan, dtype=np.int64).reshape(-1, 2)
+        self.rt = np.asarray(rt, dtype=np.float64).reshape(-1, 2)
+        self.mzmean = np.asarray(mzmean, dtype=np.float64)
+
+    @classmethod
+    def from_rois(cls, rois):
+        """
+        Pack ROI objects into a batch
+        :param rois: an iterable of ROI objects
+        :return: ROIBatch
+        """
+        rois = list(rois)
+        if not rois:
+            return cls.empty()
+        lengths = [len(roi.i) for roi in rois]
+        return cls(np.concatenate([roi.i for roi in rois]),
+                   np.concatenate([roi.mz for roi in rois]),
+                   np.concatenate(([0], np.cumsum(lengths))),
+                   [roi.scan for roi in rois],
+                   [roi.rt for roi in rois],
+                   [roi.mzmean for roi in rois])
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty(0), np.empty(0), np.zeros(1), np.empty((0, 2)), np.empty((0, 2)), np.empty(0))
+
+    @classmethod
+    def concatenate(cls, batches):
+        """
+        Concatenate several batches
+        :param batches: a list of ROIBatch objects
+        :return: ROIBatch
+        """
+        batches = [batch for batch in batches if len(batch)]
+        if not batches:
+            return cls.empty()
+        sizes = np.cumsum([0] + [len(batch.i) for batch in batches[:-1]])
+        offsets = [batch.offsets[:-1] + size for batch, size in zip(batches, sizes)]
+        offsets.append([sizes[-1] + len(batches[-1].i)])
+        return cls(np.concatenate([batch.i for batch in batches]),
+                   np.concatenate([batch.mz for batch in batches]),
+                   np.concatenate(offsets),
+                   np.concatenate([batch.scan for batch in batches]),
+                   np.concatenate([batch.rt for batch in batches]),
+                   np.concatenate([batch.mzmean for batch in batches]))
+
+    def save(self, folder):
+        """
+        Save the batch as a folder of *.npy files (one file per column)
+        :param folder: path to folder
+        """
+        os.makedirs(folder, exist_ok=True)
+        for column in self.columns:
+            np.save(os.path.join(folder, column + '.npy'), getattr(self, column))
+
+    @classmethod
+    def load(cls, folder, mmap_mode='r'):
+        """
+        Load the batch saved by ROIBatch.save
+        :param folder: path to folder
+        :param mmap_mode: numpy memory-map mode (None to read the columns into memory)
+        :return: ROIBatch
+        """
+        return cls(*(np.load(os.path.join(folder, column + '.npy'), mmap_mode=mmap_mode) for column in cls.columns))
+
+    @property
+    def lengths(self):
+        """
+        Number of points in every ROI
+        """
+        return np.diff(self.offsets)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, column).nbytes for column in self.columns)
+
+    def take(self, indices):
+        """
+        Select a subset of ROIs
+        :param indices: integer indices or a boolean mask
+        :return: ROIBatch
+        """
+        indices = np.arange(len(self))[indices]
+        begins = self.offsets[indices]
+        lengths = self.offsets[indices + 1] - begins
+        offsets = np.concatenate(([0], np.cumsum(lengths)))
+        # positions of the selected points in the buffers
+        points = np.arange(offsets[-1]) + np.repeat(begins - offsets[:-1], lengths)
+        return ROIBatch(self.i[points], self.mz[points], offsets,
+                        self.scan[indices], self.rt[indices], self.mzmean[indices])
+
+    def __len__(self):
+        return len(self.mzmean)
+
+    def __getitem__(self, item):
+        if isinstance(item, (int, np.integer)):
+            if item < 0:
+                item += len(self)
+            if not 0 <= item < len(self):
+                raise IndexError('ROIBatch index out of range')
+            begin, end = self.offsets[item], self.offsets[item + 1]
+            return ROI((int(self.scan[item, 0]), int(self.scan[item, 1])),
+                       [float(self.rt[item, 0]), float(self.rt[item, 1])],
+                       self.i[begin:end], self.mz[begin:end], float(self.mzmean[item]))
+        return self.take(item)
+
+    def __iter__(self):
+        for item in range(len(self)):
+            yield self[item]
+
+    def __repr__(self):
+        return 'ROIBatch of {} ROIs ({} points)'.format(len(self), len(self.i))
 
 
 def get_closest(mzmean, mz, pos):
@@ -69,6 +225,567 @@ def get_closest(mzmean, mz, pos):
     return res
 
 
+def _iter_ms1_scans(path, progress_callback=None, share=100):
+    """
+    Iterate over MS1 scans of *.mzML file (spectra are read one by one)
+    :param path: path to mzml file
+    :param progress_callback: an pyQt5 signal to visualize progress of reading
+    :param share: progress (in percents) emitted when the whole file is read
+    :return: a generator of (mz, i, rt) tuples
+    """
+    run = open_run(path)
+    spectrum_count = run.get_spectrum_count() if progress_callback is not None else None
+    progress = 0
+    for number, scan in iter_spectra(run, 1):
+        yield scan.mz, scan.i, scan.scan_time[0]
+        if spectrum_count:
+            percent = int(share * (number + 1) / spectrum_count)
+            if percent != progress:
+                progress = percent
+                progress_callback.emit(progress)
+
+
+class _ScanState:
+    """
+    Points of the scan being processed and ROIs started in it
+    """
+    def __init__(self, mz, i, rt, ceiling, floor, lower, has_ceiling, has_floor):
+        self.mz = mz
+        self.i = i
+        self.rt = rt
+        # slots of the closest active ROIs: key >= m/z, key <= m/z and key < m/z (-1 if there is no such ROI)
+        self.ceiling = ceiling
+        self.floor = floor
+        self.lower = lower
+        self.has_ceiling = has_ceiling
+        self.has_floor = has_floor
+        self.extended = []  # slots of extended active ROIs
+        self.dead = []  # slots of active ROIs replaced by the new ones
+        # ROIs started in the scan (sorted by key)
+        self.new_key = np.empty(0)
+        self.new_mzmean = np.empty(0)
+        self.new_points = np.empty(0, dtype=np.int64)
+        self.new_i = np.empty(0, dtype=i.dtype)
+        self.new_mz = np.empty(0)
+
+
+class ROIDetector:
+    """
+    Scan-at-a-time ROI detection
+
+    The points of a scan are located among the sorted m/z keys of active ROIs
+    with np.searchsorted, so the nearest ROI is chosen for all points at once.
+    Only points whose result may depend on the preceding points of the same
+    scan (e.g. two points near one ROI) are resolved one by one, therefore the
+    result is identical to point-by-point ROI detection.
+
+    Active ROIs are stored in slots, which aren't moved between compactions:
+    retired ROIs are only marked as dead (tombstones) and new ROIs are appended
+    and indexed by a small sorted array, so a scan doesn't copy all active ROIs.
+
+    Parameters
+    ----------
+    delta_mz : float
+        -
+    required_points : int
+        -
+    dropped_points : int
+        -
+    mz_range : tuple, optional
+        if given, only ROIs which keys lay in [mz_range[0], mz_range[1]) are returned
+
+    Attributes
+    ----------
+    delta_mz : float
+        a parameters for mz window in ROI detection
+    required_points : int
+        minimum ROI length in points
+    dropped_points : int
+        maximal number of zero points in a row
+    mz_range : tuple
+        m/z range of the returned ROIs (optional)
+    number : int
+        number of processed scans
+    """
+    # number of logged points which triggers the assembling of finished ROIs
+    collect_size = 1 << 21
+    # minimal number of ROIs started since the last compaction of active ROIs, which triggers it
+    compact_size = 4096
+
+    def __init__(self, delta_mz=0.005, required_points=15, dropped_points=3, mz_range=None):
+        self.delta_mz = delta_mz
+        self.required_points = required_points
+        self.dropped_points = dropped_points
+        self.mz_range = mz_range
+        self.number = 0
+        self._next_uid = 0
+        # slots of active ROIs, the columns are the rows of two arrays: key (m/z of
+        # the first point of ROI), mzmean, rt_begin, rt_end and uid, points, scan_begin, scan_end
+        self._size = 0  # number of used slots
+        self._float = np.empty((4, 16))
+        self._int = np.empty((4, 16), dtype=np.int64)
+        self._alive = np.zeros(16, dtype=bool)
+        # intensity and m/z of the last point of ROIs extended in the current scan
+        self._current_i = np.zeros(16)
+        self._current_mz = np.zeros(16)
+        self._bind_columns()
+        # slots [0, _main) are sorted by key, dead ones are kept as tombstones and skipped
+        # with pointers to the next (previous) candidates, the later slots are indexed by delta
+        self._main = 0
+        self._dead = 0
+        self._next = np.empty(0, dtype=np.int64)
+        self._prev = np.empty(0, dtype=np.int64)
+        self._delta_key = np.empty(0)
+        self._delta_slot = np.empty(0, dtype=np.int64)
+        # expiry index: scan number -> slots of ROIs, which expire at this scan
+        # if they are not extended (the stale entries are skipped)
+        self._expiry = {}
+        # points of all ROIs as (uid, scan, intensity, m/z, mzmean) chunks in order of scans
+        self._log = []
+        self._log_size = 0
+        self._retired = []  # uids of inactive ROIs, which points are still in log
+        self._completed = []  # columns of finished ROIs, which should be assembled
+        self._batches = []  # assembled ROIs
+        self._batch_keys = []  # keys of assembled ROIs
+
+    def process_scan(self, mz, i, rt, below=False, above=False):
+        """
+        Extend active ROIs with the points of the next scan
+        :param mz: m/z values of the scan
+        :param i: intensities of the scan
+        :param rt: retention time of the scan
+        :param below: there are active ROIs below the processed m/z range (for detection in slabs)
+        :param above: there are active ROIs above the processed m/z range (for detection in slabs)
+        """
+        mz = np.asarray(mz)
+        i = np.asarray(i)
+        nonzero = i != 0
+        mz = mz[nonzero].astype(np.float64, copy=False)
+        i = i[nonzero]
+        self.number += 1
+        if self._current_i.dtype != i.dtype:
+            self._current_i = self._current_i.astype(i.dtype)
+
+        min_mz, max_mz = self._bounds()
+        if below:
+            min_mz = -np.inf
+        if above:
+            max_mz = np.inf
+        # the closest active ROIs of every point
+        ceiling, lower = self._locate(mz)
+        floor = np.where((ceiling >= 0) & (self._key[ceiling] == mz), ceiling, lower)
+        scan = _ScanState(mz, i, rt, ceiling, floor, lower, mz < max_mz, mz > min_mz)
+        pending = np.arange(len(mz))
+        ordered = len(mz) < 2 or np.all(mz[1:] >= mz[:-1])
+        while len(pending):
+            # the points are processed in 'waves': every point, which can't be affected
+            # by a preceding unprocessed point of the same scan, is processed at once
+            target, is_new, extend = self._closest(scan, pending)
+            if ordered:
+                ready = self._independent(scan, pending, target, is_new, extend)
+            else:
+                ready = np.zeros(len(pending), dtype=bool)
+                ready[0] = True
+            self._apply(scan, pending[ready], target[ready], is_new[ready], extend[ready])
+            pending = pending[~ready]
+        self._close_scan(scan)
+
+    def _next_alive(self, position):
+        """
+        Find the first alive ROI among the sorted slots starting from position (_main if there is no such ROI)
+        """
+        position = np.array(position, dtype=np.int64)
+        start = position.copy()
+        dead = position < self._main
+        dead[dead] = ~self._alive[position[dead]]
+        visited = dead.copy()
+        while np.any(dead):
+            position[dead] = self._next[position[dead]]
+            dead[dead] = position[dead] < self._main
+            dead[dead] = ~self._alive[position[dead]]
+        self._next[start[visited]] = position[visited]  # the pointers are shortcut
+        return position
+
+    def _prev_alive(self, position):
+        """
+        Find the last alive ROI among the sorted slots up to position (-1 if there is no such ROI)
+        """
+        position = np.array(position, dtype=np.int64)
+        start = position.copy()
+        dead = position >= 0
+        dead[dead] = ~self._alive[position[dead]]
+        visited = dead.copy()
+        while np.any(dead):
+            position[dead] = self._prev[position[dead]]
+            dead[dead] = position[dead] >= 0
+            dead[dead] = ~self._alive[position[dead]]
+        self._prev[start[visited]] = position[visited]
+        return position
+
+    def _bounds(self):
+        """
+        The minimal and the maximal keys of active ROIs
+        """
+        min_mz, max_mz = np.inf, -np.inf
+        if self._main:
+            first = self._next_alive([0])[0]
+            last = self._prev_alive([self._main - 1])[0]
+            if first < self._main:
+                min_mz, max_mz = self._key[first], self._key[last]
+        if len(self._delta_key):
+            min_mz, max_mz = min(min_mz, self._delta_key[0]), max(max_mz, self._delta_key[-1])
+        return min_mz, max_mz
+
+    def _locate(self, mz):
+        """
+        Find the closest active ROIs around m/z values
+        :return: slots of ROIs with the smallest key >= m/z and the largest key < m/z (-1 if there is no such ROI)
+        """
+        position = np.searchsorted(self._key[:self._main], mz, side='left')
+        ceiling = self._next_alive(position)
+        ceiling[ceiling == self._main] = -1
+        lower = self._prev_alive(position - 1)
+        m = len(self._delta_key)
+        if m:
+            position = np.searchsorted(self._delta_key, mz, side='left')
+            delta_ceiling = np.where(position < m, self._delta_slot[np.minimum(position, m - 1)], -1)
+            delta_lower = np.where(position > 0, self._delta_slot[np.maximum(position - 1, 0)], -1)
+            # slot -1 refers to the last slot of columns, so keys are compared only for existing ROIs
+            ceiling = np.where((delta_ceiling >= 0) & ((ceiling < 0) | (self._key[delta_ceiling] < self._key[ceiling])),
+                               delta_ceiling, ceiling)
+            lower = np.where((delta_lower >= 0) & ((lower < 0) | (self._key[delta_lower] > self._key[lower])),
+                             delta_lower, lower)
+        return ceiling, lower
+
+    def _closest(self, scan, points):
+        """
+        Find the closest ROI (active or started in the current scan) for the points
+        :return: target (slot or index of ROI), is_new (ROI was started in the current scan), extend (ROI is close enough)
+        """
+        mz = scan.mz[points]
+        has_ceiling = scan.has_ceiling[points]
+        has_floor = scan.has_floor[points]
+        ceiling = scan.ceiling[points]
+        floor = scan.floor[points]
+        # there are no active ROIs around the point, but they may exist out of the processed m/z range
+        no_ceiling, no_floor = ceiling < 0, floor < 0
+        ceiling_key = np.where(no_ceiling, np.inf, self._key[ceiling])
+        ceiling_mzmean = np.where(no_ceiling, np.inf, self._mzmean[ceiling])
+        floor_key = np.where(no_floor, -np.inf, self._key[floor])
+        floor_mzmean = np.where(no_floor, -np.inf, self._mzmean[floor])
+        new_ceiling = np.zeros(len(points), dtype=bool)
+        new_floor = np.zeros(len(points), dtype=bool)
+        m = len(scan.new_key)
+        if m:
+            # ROI started in the current scan replaces active one with the same key
+            new_ceiling_position = np.searchsorted(scan.new_key, mz, side='left')
+            new_floor_position = np.searchsorted(scan.new_key, mz, side='right') - 1
+            new_ceiling_key = scan.new_key[np.minimum(new_ceiling_position, m - 1)]
+            new_floor_key = scan.new_key[np.maximum(new_floor_position, 0)]
+            new_ceiling = has_ceiling & (new_ceiling_position < m) & (new_ceiling_key <= ceiling_key)
+            new_floor = has_floor & (new_floor_position >= 0) & (new_floor_key >= floor_key)
+            ceiling = np.where(new_ceiling, new_ceiling_position, ceiling)
+            floor = np.where(new_floor, new_floor_position, floor)
+            ceiling_mzmean = np.where(new_ceiling, scan.new_mzmean[np.minimum(new_ceiling_position, m - 1)],
+                                      ceiling_mzmean)
+            floor_mzmean = np.where(new_floor, scan.new_mzmean[np.maximum(new_floor_position, 0)], floor_mzmean)
+        # choose closest
+        to_floor = has_floor & (~has_ceiling | (ceiling_mzmean - mz > mz - floor_mzmean))
+        target = np.where(to_floor, floor, ceiling)
+        is_new = np.where(to_floor, new_floor, new_ceiling)
+        closest_mzmean = np.where(to_floor, floor_mzmean, ceiling_mzmean)
+        extend = (has_ceiling | has_floor) & (np.abs(closest_mzmean - mz) < self.delta_mz)
+        return target, is_new, extend
+
+    def _independent(self, scan, points, target, is_new, extend):
+        """
+        Find the points, which are not affected by the preceding points (points should be sorted by m/z)
+        """
+        ready = np.ones(len(points), dtype=bool)
+        if len(points) > 1:
+            ceiling = scan.ceiling[points]
+            # two points between the same active ROIs or around the same active ROI
+            same = ceiling[1:] == ceiling[:-1]
+            adjacent = (ceiling[:-1] >= 0) & (scan.lower[points[1:]] == ceiling[:-1])
+            # the ceiling is modified by an extension of the active ROI or of the new ROI with the same key
+            # (a point with the same m/z as the key started it), the next point may be closer to it
+            modified_ceiling = extend[:-1] & (ceiling[:-1] >= 0)
+            old, new = modified_ceiling & ~is_new[:-1], modified_ceiling & is_new[:-1]
+            modified_ceiling[old] = target[:-1][old] == ceiling[:-1][old]
+            modified_ceiling[new] = scan.new_key[target[:-1][new]] == self._key[ceiling[:-1][new]]
+            # a new ROI replaces the active one if their keys are the same
+            # (e.g. rounded m/z), points with the same m/z get the same new ROI
+            mz = scan.mz[points]
+            replaced_ceiling = ~extend[:-1] & (ceiling[:-1] >= 0)
+            replaced = ceiling[:-1][replaced_ceiling]
+            replaced_ceiling[replaced_ceiling] = self._key[replaced] == mz[:-1][replaced_ceiling]
+            dependent = (same & (extend[:-1] | scan.has_floor[points[1:]] | (mz[1:] == mz[:-1]))) | \
+                (adjacent & (modified_ceiling | replaced_ceiling))
+            # a point depends on all the preceding linked points
+            position = np.arange(1, len(points))
+            last_dependent = np.maximum.accumulate(np.where(dependent, position, 0))
+            run_begin = np.maximum.accumulate(np.where(same | adjacent, 0, position))
+            ready[1:] = ~dependent & (last_dependent <= run_begin)
+        return ready
+
+    def _apply(self, scan, points, target, is_new, extend):
+        number = self.number
+        mz, i = scan.mz[points], scan.i[points]
+
+        # extension of ROIs which weren't extended in the current scan
+        fresh = extend & ~is_new
+        fresh[fresh] = self._scan_end[target[fresh]] != number
+        roi = target[fresh]
+        roi_points = self._points[roi]
+        self._mzmean[roi] = (self._mzmean[roi] * roi_points + mz[fresh]) / (roi_points + 1)
+        self._points[roi] = roi_points + 1
+        self._current_i[roi] = i[fresh]
+        self._current_mz[roi] = mz[fresh]
+        scan.extended.append(roi)
+        self._scan_end[roi] = number
+        self._rt_end[roi] = scan.rt
+
+        # ROIs are already extended (two peaks in one mz window)
+        for new, (mzmean, points_number, last_i, last_mz) in [
+                (False, (self._mzmean, self._points, self._current_i, self._current_mz)),
+                (True, (scan.new_mzmean, scan.new_points, scan.new_i, scan.new_mz))]:
+            merged = extend & ~fresh & (is_new == new)
+            roi = target[merged]
+            roi_points = points_number[roi]
+            mzmean[roi] = (mzmean[roi] * roi_points + mz[merged]) / (roi_points + 1)
+            points_number[roi] = roi_points + 1
+            last_mz[roi] = (last_i[roi] * last_mz[roi] + i[merged] * mz[merged]) / (last_i[roi] + i[merged])
+            last_i[roi] = last_i[roi] + i[merged]
+
+        # new ROIs (the last one wins if keys are the same)
+        created = ~extend
+        if np.any(created):
+            key, i = mz[created], i[created]
+            unique = np.ones(len(key), dtype=bool)
+            unique[:-1] = key[1:] != key[:-1]
+            key, i = key[unique], i[unique]
+            ceiling = scan.ceiling[points[created][unique]]
+            scan.dead.append(ceiling[(ceiling >= 0) & (self._key[ceiling] == key)])
+            position = np.searchsorted(scan.new_key, key, side='left')
+            exists = position < len(scan.new_key)
+            exists[exists] = scan.new_key[position[exists]] == key[exists]
+            existing = position[exists]
+            scan.new_mzmean[existing] = key[exists]
+            scan.new_points[existing] = 1
+            scan.new_i[existing] = i[exists]
+            scan.new_mz[existing] = key[exists]
+            key, i, position = key[~exists], i[~exists], position[~exists]
+            scan.new_key = np.insert(scan.new_key, position, key)
+            scan.new_mzmean = np.insert(scan.new_mzmean, position, key)
+            scan.new_points = np.insert(scan.new_points, position, 1)
+            scan.new_i = np.insert(scan.new_i, position, i)
+            scan.new_mz = np.insert(scan.new_mz, position, key)
+
+    def _bind_columns(self):
+        self._key, self._mzmean, self._rt_begin, self._rt_end = self._float
+        self._uid, self._points, self._scan_begin, self._scan_end = self._int
+
+    def _allocate(self, m):
+        """
+        Reserve m slots for new ROIs (the capacity of columns is doubled if it is exceeded)
+        :return: the slots
+        """
+        capacity = len(self._alive)
+        if self._size + m > capacity:
+            capacity = max(2 * capacity, self._size + m)
+            self._float = np.concatenate((self._float, np.empty((4, capacity - self._float.shape[1]))), axis=1)
+            self._int = np.concatenate((self._int, np.empty((4, capacity - self._int.shape[1]), dtype=np.int64)),
+                                       axis=1)
+            self._bind_columns()
+            for name in ('_alive', '_current_i', '_current_mz'):
+                column = getattr(self, name)
+                setattr(self, name, np.concatenate((column, np.zeros(capacity - len(column), dtype=column.dtype))))
+        slots = np.arange(self._size, self._size + m)
+        self._size += m
+        return slots
+
+    def _remove(self, slots):
+        """
+        Mark ROIs as inactive: sorted slots become tombstones, others are dropped from delta
+        """
+        self._alive[slots] = False
+        in_main = slots < self._main
+        self._dead += np.count_nonzero(in_main)
+        if not np.all(in_main):
+            keep = ~np.isin(self._delta_slot, slots[~in_main])
+            self._delta_key, self._delta_slot = self._delta_key[keep], self._delta_slot[keep]
+
+    def _compact(self):
+        """
+        Move alive ROIs to the beginning of columns in order of keys (tombstones and delta are dropped)
+        """
+        alive = np.flatnonzero(self._alive[:self._size])
+        order = alive[np.argsort(self._key[alive], kind='stable')]
+        slot = np.full(self._size, -1, dtype=np.int64)
+        slot[order] = np.arange(len(order))
+        n = len(order)
+        self._float[:, :n] = self._float[:, order]
+        self._int[:, :n] = self._int[:, order]
+        self._bind_columns()
+        self._alive[:] = False
+        self._alive[:n] = True
+        for number, bucket in self._expiry.items():
+            bucket = slot[np.concatenate(bucket)]
+            self._expiry[number] = [bucket[bucket >= 0]]
+        self._size = self._main = n
+        self._dead = 0
+        self._next = np.arange(1, n + 1)
+        self._prev = np.arange(-1, n - 1)
+        self._delta_key = np.empty(0)
+        self._delta_slot = np.empty(0, dtype=np.int64)
+
+    def _schedule(self, number, slots):
+        if len(slots):
+            self._expiry.setdefault(number, []).append(slots)
+
+    def _expired(self, number):
+        """
+        Find active ROIs, which weren't extended in the last 'dropped_points' scans
+        :return: slots of ROIs in order of keys
+        """
+        bucket = self._expiry.pop(number, None)
+        if bucket is None:
+            return np.empty(0, dtype=np.int64)
+        slots = np.concatenate(bucket)
+        slots = slots[self._alive[slots]]
+        slots = slots[self._scan_end[slots] + self.dropped_points + 1 == number]
+        return slots[np.argsort(self._key[slots], kind='stable')]
+
+    def _close_scan(self, scan):
+        number = self.number
+        # log the points of extended ROIs
+        extended = np.concatenate([np.empty(0, dtype=np.int64)] + scan.extended)
+        uid = self._uid[extended]
+        self._log.append((uid, np.full(len(uid), number), self._current_i[extended].astype(np.float32),
+                          self._current_mz[extended].astype(np.float32), self._mzmean[extended]))
+        self._log_size += len(uid)
+        self._schedule(number + self.dropped_points + 1, extended)
+
+        # check and cleanup: only expired and replaced ROIs are touched
+        expired = self._expired(number)
+        dead = np.unique(np.concatenate([np.empty(0, dtype=np.int64)] + scan.dead))
+        if len(dead):
+            # replaced ROIs are dropped without output
+            expired = expired[~np.isin(expired, dead)]
+        self._complete(expired[self._points[expired] >= self.required_points])
+        removed = np.concatenate((dead, expired))
+        if len(removed):
+            self._retired.append(self._uid[removed])
+            self._remove(removed)
+
+        m = len(scan.new_key)
+        if m:
+            slots = self._allocate(m)
+            uid = np.arange(self._next_uid, self._next_uid + m)
+            self._next_uid += m
+            self._float[:, slots] = [scan.new_key, scan.new_mzmean, np.full(m, scan.rt), np.full(m, scan.rt)]
+            self._int[:, slots] = [uid, scan.new_points, np.full(m, number), np.full(m, number)]
+            self._alive[slots] = True
+            position = np.searchsorted(self._delta_key, scan.new_key)
+            self._delta_key = np.insert(self._delta_key, position, scan.new_key)
+            self._delta_slot = np.insert(self._delta_slot, position, slots)
+            self._log.append((uid, np.full(m, number), scan.new_i.astype(np.float32),
+                              scan.new_mz.astype(np.float32), scan.new_mzmean))
+            self._log_size += m
+            self._schedule(number + self.dropped_points + 1, slots)
+        # the cost of compaction is spread over the scans since the previous one
+        if self._size - self._main > max(self.compact_size, 16 * int(np.sqrt(self._main))) or \
+                self._dead > self._main // 2:
+            self._compact()
+        if self._log_size > self.collect_size:
+            self._collect()
+
+    def _complete(self, positions):
+        if self.mz_range is not None:
+            key = self._key[positions]
+            positions = positions[(key >= self.mz_range[0]) & (key < self.mz_range[1])]
+        if len(positions):
+            self._completed.append((self._uid[positions], self._scan_begin[positions], self._scan_end[positions],
+                                    self._rt_begin[positions], self._rt_end[positions], self._mzmean[positions],
+                                    self._key[positions]))
+
+    def _collect(self):
+        """
+        Assemble completed ROIs from the log and drop the points of inactive ROIs
+        """
+        if not self._log:
+            return
+        uid, scan, i, mz, mzmean = (np.concatenate(column) for column in zip(*self._log))
+        order = np.argsort(uid, kind='stable')
+        uid, scan, i, mz, mzmean = uid[order], scan[order], i[order], mz[order], mzmean[order]
+        if self._completed:
+            completed = [np.concatenate(column) for column in zip(*self._completed)]
+            begins = np.searchsorted(uid, completed[0], side='left')
+            ends = np.searchsorted(uid, completed[0], side='right')
+            dropped_points = self.dropped_points
+            scan_begin, scan_end, rt_begin, rt_end, final_mzmean, key = completed[1:]
+            self._batch_keys.append(key)
+            # every ROI starts and ends with 'dropped_points' zeros
+            lengths = scan_end - scan_begin + 1 + 2 * dropped_points
+            offsets = np.concatenate(([0], np.cumsum(lengths)))
+            # positions of logged points
+            logged = ends - begins
+            shift = np.repeat(np.cumsum(logged) - logged, logged)
+            sources = np.arange(len(shift)) - shift + np.repeat(begins, logged)
+            points = np.repeat(offsets[:-1] + dropped_points - scan_begin, logged) + scan[sources]
+            roi_i = np.zeros(offsets[-1], dtype=np.float32)
+            roi_i[points] = i[sources]
+            # m/z of zero point is mzmean of ROI at the moment (after the last point)
+            last = np.zeros(offsets[-1], dtype=np.int64)
+            last[points] = points
+            last = np.maximum.accumulate(last)
+            roi_mz = np.zeros(offsets[-1])
+            roi_mz[points] = mzmean[sources]
+            roi_mz = roi_mz[last].astype(np.float32)
+            roi_mz[points] = mz[sources]
+            # leading zeros get the final mzmean
+            leading = (offsets[:-1, np.newaxis] + np.arange(dropped_points)).ravel()
+            roi_mz[leading] = np.repeat(final_mzmean, dropped_points)
+            self._batches.append(ROIBatch(roi_i, roi_mz, offsets,
+                                          np.stack((scan_begin - dropped_points, scan_end + dropped_points), axis=1),
+                                          np.stack((rt_begin, rt_end), axis=1), final_mzmean))
+            self._completed = []
+        if self._retired:
+            keep = ~np.isin(uid, np.concatenate(self._retired))
+            uid, scan, i, mz, mzmean = uid[keep], scan[keep], i[keep], mz[keep], mzmean[keep]
+            self._retired = []
+        self._log = [(uid, scan, i, mz, mzmean)]
+        self._log_size = len(uid)
+
+    @property
+    def finished_count(self):
+        """
+        Number of finished ROIs, which weren't popped yet
+        """
+        return sum(len(columns[0]) for columns in self._completed) + sum(len(batch) for batch in self._batches)
+
+    def pop_finished(self):
+        """
+        Assemble the ROIs finished so far, they aren't returned by 'finish'
+        :return: ROIs - ROIBatch with finished ROIs (in the same order as in the result of 'finish')
+        """
+        self._collect()
+        batches, self._batches, self._batch_keys = self._batches, [], []
+        return ROIBatch.concatenate(batches)
+
+    def finish(self):
+        """
+        Finish the detection
+        :return: ROIs - ROIBatch with detected ROIs
+        """
+        alive = np.flatnonzero(self._alive[:self._size])
+        alive = alive[np.argsort(self._key[alive], kind='stable')]
+        self._complete(alive[self._points[alive] >= self.required_points])
+        self._retired.append(self._uid[alive])
+        self._collect()
+        return ROIBatch.concatenate(self._batches)
+
+
 def get_ROIs(path, delta_mz=0.005, required_points=15, dropped_points=3, progress_callback=None):
     '''
     :param path: path to mzml file
@@ -76,184 +793,297 @@ def get_ROIs(path, delta_mz=0.005, required_points=15, dropped_points=3, progres
     :param required_points:
     :param dropped_points: can be zero points
     :param pbar: an pyQt5 progress bar to visualize
-    :return: ROIs - a list of ROI objects found in current file
+    :return: ROIs - ROIBatch of ROIs found in current file
     '''
-    # read all scans in mzML file
-    run = pymzml.run.Reader(path)
-    scans = []
-    for scan in run:
-        if scan.ms_level == 1:
-            scans.append(scan)
-
-    ROIs = []  # completed ROIs
-    process_ROIs = FastAVLTree()  # processed ROIs
-
-    # initialize a processed data
-    number = 1  # number of processed scan
-    init_scan = scans[0]
-    start_time = init_scan.scan_time[0]
-
-    min_mz = max(init_scan.mz)
-    max_mz = min(init_scan.mz)
-    for mz, i in zip(init_scan.mz, init_scan.i):
-        if i != 0:
-            process_ROIs[mz] = ProcessROI([1, 1],
-                                          [start_time, start_time],
-                                          [i],
-                                          [mz],
-                                          mz)
-            min_mz = min(min_mz, mz)
-            max_mz = max(max_mz, mz)
-
-    for scan in tqdm(scans):
-        if number == 1:  # already processed scan
-            number += 1
+    run = open_run(path)
+    spectrum_count = run.get_spectrum_count()  # from the index (MS1 and MS2 spectra)
+    detector = ROIDetector(delta_mz, required_points, dropped_points)
+    # every scan is dropped after processing, so only active ROIs are kept in memory
+    previous = -1
+    with tqdm(total=spectrum_count) as pbar:
+        for number, scan in iter_spectra(run, 1):  # MS2 spectra aren't decoded
+            detector.process_scan(scan.mz, scan.i, scan.scan_time[0])
+            previous = _emit_progress(progress_callback, spectrum_count, previous, number)
+            pbar.update(number + 1 - pbar.n)
+        _emit_progress(progress_callback, spectrum_count, previous, spectrum_count - 1)
+        pbar.update(spectrum_count - pbar.n)
+    return detector.finish()
+
+
+def iter_ROIs(path, delta_mz=0.005, required_points=15, dropped_points=3, chunk_size=1024,
+              progress_callback=None):
+    '''
+    ROI detection, which yields ROIs as soon as they are finished (e.g. to process them while the file is scanned)
+    :param path: path to mzml file
+    :param delta_mz:
+    :param required_points:
+    :param dropped_points: can be zero points
+    :param chunk_size: minimal number of ROIs in yielded batches (the last one may be smaller)
+    :param progress_callback: an pyQt5 signal to visualize progress
+    :return: a generator of ROIBatch, concatenated batches are the same as the result of get_ROIs
+    '''
+    run = open_run(path)
+    spectrum_count = run.get_spectrum_count()
+    detector = ROIDetector(delta_mz, required_points, dropped_points)
+    previous = -1
+    for number, scan in iter_spectra(run, 1):
+        detector.process_scan(scan.mz, scan.i, scan.scan_time[0])
+        previous = _emit_progress(progress_callback, spectrum_count, previous, number)
+        if detector.finished_count >= chunk_size:
+            yield detector.pop_finished()
+    _emit_progress(progress_callback, spectrum_count, previous, spectrum_count - 1)
+    rois = detector.finish()
+    if len(rois):
+        yield rois
+
+
+def _emit_progress(progress_callback, spectrum_count, previous, number):
+    """
+    Emit progress for every 10th spectrum in (previous, number] (skipped spectra are counted too)
+    :return: number
+    """
+    if progress_callback is not None:
+        for mark in range((previous // 10 + 1) * 10, number + 1, 10):
+            progress_callback.emit(int(mark * 100 / spectrum_count))
+    return number
+
+
+def _split_mz(scans, n_slabs, delta_mz):
+    """
+    Choose m/z borders of slabs with nearly equal number of points
+    :param scans: an iterable of (mz, i, rt) tuples (it is iterated once)
+    :param n_slabs: number of slabs
+    :param delta_mz: a parameters for mz window in ROI detection
+    :return: a list of n_slabs - 1 borders, number of scans
+    """
+    # histogram of points with delta_mz wide bins, counts[0] is the bin 'first' from 'low'
+    low, first = None, 0
+    counts = np.zeros(0, dtype=np.int64)
+    n_scans = 0
+    for mz, i, _ in scans:
+        n_scans += 1
+        mz = mz[i != 0]
+        if not len(mz):
             continue
-        # expand ROI
-        for n, mz in enumerate(scan.mz):
-            if scan.i[n] != 0:
-                ceiling_mz, ceiling_item = None, None
-                floor_mz, floor_item = None, None
-                if mz < max_mz:
-                    _, ceiling_item = process_ROIs.ceiling_item(mz)
-                    ceiling_mz = ceiling_item.mzmean
-                if mz > min_mz:
-                    _, floor_item = process_ROIs.floor_item(mz)
-                    floor_mz = floor_item.mzmean
-                # choose closest
-                if ceiling_mz is None and floor_mz is None:
-                    time = scan.scan_time[0]
-                    process_ROIs[mz] = ProcessROI([number, number],
-                                                  [time, time],
-                                                  [scan.i[n]],
-                                                  [mz],
-                                                  mz)
+        if low is None:
+            low = np.min(mz)
+        bins = ((mz - low) // delta_mz).astype(np.int64) - first
+        shift = max(-np.min(bins), 0)
+        if shift:  # the bins below the histogram are added
+            counts = np.concatenate((np.zeros(shift, dtype=np.int64), counts))
+            first -= shift
+            bins += shift
+        bins = np.bincount(bins)
+        if len(bins) > len(counts):
+            bins[:len(counts)] += counts
+            counts = bins
+        else:
+            counts[:len(bins)] += bins
+    if not len(counts):
+        return [], n_scans
+    cumulative = np.cumsum(counts)
+    window = max(len(counts) // (4 * n_slabs), 1)
+    borders = []
+    for k in range(1, n_slabs):
+        position = np.searchsorted(cumulative, cumulative[-1] * k / n_slabs)
+        # the emptiest bin near the quantile: an empty bin separates
+        # independent ROIs, so the cut doesn't change the result
+        begin = max(position - window, 0)
+        position = begin + np.argmin(counts[begin:position + window + 1])
+        border = low + (first + position + 0.5) * delta_mz
+        if not borders or border > borders[-1]:
+            borders.append(border)
+    return borders, n_scans
+
+
+def _slab_scans(scans, begin, end, dropped_points):
+    """
+    Select the points of m/z slab
+    :param scans: an iterable of (mz, i, rt) tuples
+    :param begin: the lower border of the slab
+    :param end: the upper border of the slab
+    :param dropped_points: maximal number of zero points in a row
+    :return: a generator of (mz, i, rt, below, above) tuples, where below (above) shows
+             that there are active ROIs below (above) the slab
+    """
+    # ROIs out of the slab are active for 'dropped_points' scans after their last point
+    window = deque(maxlen=dropped_points + 1)
+    for mz, i, rt in scans:
+        inside = (mz >= begin) & (mz < end)
+        yield mz[inside], i[inside], rt, any(below for below, _ in window), any(above for _, above in window)
+        window.append((np.any((mz < begin) & (i != 0)), np.any((mz >= end) & (i != 0))))
+
+
+def _detect_slab(path, slab, mz_range, delta_mz, required_points, dropped_points):
+    """
+    ROI detection in m/z slab (the slab is read from file, so scans aren't passed between processes)
+    :param path: path to mzml file
+    :param slab: (begin, end) m/z range of processed points
+    :param mz_range: (begin, end) m/z range of returned ROIs
+    :return: ROIs - ROIBatch, keys of ROIs
+    """
+    detector = ROIDetector(delta_mz, required_points, dropped_points, mz_range)
+    for mz, i, rt, below, above in _slab_scans(_iter_ms1_scans(path), slab[0], slab[1], dropped_points):
+        detector.process_scan(mz, i, rt, below, above)
+    rois = detector.finish()
+    return rois, np.concatenate([np.empty(0)] + detector._batch_keys)
+
+
+def _same_batches(one, two):
+    return all(np.array_equal(getattr(one, column), getattr(two, column)) for column in ROIBatch.columns)
+
+
+def get_ROIs_parallel(path, delta_mz=0.005, required_points=15, dropped_points=3,
+                      n_jobs=None, overlap=3, progress_callback=None):
+    """
+    ROI detection in m/z slabs processed by separate processes
+
+    Every slab is processed with margins of 'overlap' * delta_mz, the ROIs laying
+    near a border are detected by both neighbouring slabs. If they are not the
+    same (the border crosses dependent ROIs), the slabs are merged and processed
+    again, so the result is the same as the result of get_ROIs. The file is read
+    once to choose the slabs, then every process reads the points of its slab,
+    so scans aren't kept in memory.
+    :param path: path to mzml file
+    :param delta_mz:
+    :param required_points:
+    :param dropped_points: can be zero points
+    :param n_jobs: number of processes (number of CPU by default)
+    :param overlap: overlap of neighbouring slabs in delta_mz
+    :param progress_callback: an pyQt5 signal to visualize progress
+    :return: ROIs - ROIBatch of ROIs found in current file
+    """
+    n_jobs = os.cpu_count() if n_jobs is None else n_jobs
+    borders, n_scans, read = [], None, 0
+    if n_jobs > 1:
+        # the first half of progress is reading of file
+        read = 50
+        borders, n_scans = _split_mz(_iter_ms1_scans(path, progress_callback, read), n_jobs, delta_mz)
+    margin = overlap * delta_mz
+    slabs = [[begin, end, None] for begin, end in zip([-np.inf] + borders, borders + [np.inf])]
+    with ProcessPoolExecutor(max_workers=len(slabs)) as executor:
+        done, total = 0, len(slabs)
+        while True:
+            futures = {}
+            for slab in slabs:
+                if slab[2] is None:
+                    # ROIs near borders are returned for reconciliation
+                    future = executor.submit(_detect_slab, path, (slab[0] - margin, slab[1] + margin),
+                                             (slab[0] - margin / 2, slab[1] + margin / 2),
+                                             delta_mz, required_points, dropped_points)
+                    futures[future] = slab
+            for future in as_completed(futures):
+                futures[future][2] = future.result()
+                done += 1
+                if progress_callback is not None:
+                    progress_callback.emit(read + int(min(done / total, 1) * (100 - read)))
+            # reconciliation: neighbouring slabs should detect the same ROIs near the border
+            merged = [slabs[0]]
+            for slab in slabs[1:]:
+                if merged[-1][2] is None:  # will be checked after the next run
+                    merged.append(slab)
                     continue
-                elif ceiling_mz is None:
-                    closest_mz, closest_item = floor_mz, floor_item
-                elif floor_mz is None:
-                    closest_mz, closest_item = ceiling_mz, ceiling_item
-                else:
-                    if ceiling_mz - mz > mz - floor_mz:
-                        closest_mz, closest_item = floor_mz, floor_item
-                    else:
-                        closest_mz, closest_item = ceiling_mz, ceiling_item
-
-                if abs(closest_item.mzmean - mz) < delta_mz:
-                    roi = closest_item
-                    if roi.scan[1] == number:
-                        # ROIs is already extended (two peaks in one mz window)
-                        roi.mzmean = (roi.mzmean * roi.points + mz) / (roi.points + 1)
-                        roi.points += 1
-                        roi.mz[-1] = (roi.i[-1]*roi.mz[-1] + scan.i[n]*mz) / (roi.i[-1] + scan.i[n])
-                        roi.i[-1] = (roi.i[-1] + scan.i[n])
-                    else:
-                        roi.mzmean = (roi.mzmean * roi.points + mz) / (roi.points + 1)
-                        roi.points += 1
-                        roi.mz.append(mz)
-                        roi.i.append(scan.i[n])
-                        roi.scan[1] = number  # show that we extended the roi
-                        roi.rt[1] = scan.scan_time[0]
+                (lower_rois, lower_keys), (upper_rois, upper_keys) = merged[-1][2], slab[2]
+                border = slab[0]
+                lower_zone = lower_rois.take((lower_keys >= border - margin / 2) & (lower_keys < border + margin / 2))
+                upper_zone = upper_rois.take((upper_keys >= border - margin / 2) & (upper_keys < border + margin / 2))
+                if _same_batches(lower_zone, upper_zone):
+                    merged.append(slab)
                 else:
-                    time = scan.scan_time[0]
-                    process_ROIs[mz] = ProcessROI([number, number],
-                                                  [time, time],
-                                                  [scan.i[n]],
-                                                  [mz],
-                                                  mz)
-        # Check and cleanup
-        to_delete = []
-        for mz, roi in process_ROIs.items():
-            if roi.scan[1] < number <= roi.scan[1] + dropped_points:
-                # insert 'zero' in the end
-                roi.mz.append(roi.mzmean)
-                roi.i.append(0)
-            elif roi.scan[1] != number:
-                to_delete.append(mz)
-                if roi.points >= required_points:
-                    ROIs.append(ROI(
-                        roi.scan,
-                        roi.rt,
-                        roi.i,
-                        roi.mz,
-                        roi.mzmean
-                    ))
-        process_ROIs.remove_items(to_delete)
-        try:
-            min_mz, _ = process_ROIs.min_item()
-            max_mz, _ = process_ROIs.max_item()
-        except ValueError:
-            min_mz = float('inf')
-            max_mz = 0
-        number += 1
-        if progress_callback is not None and not number % 10:
-            progress_callback.emit(int(number * 100 / len(scans)))
-    # add final rois
-    for mz, roi in process_ROIs.items():
-        if roi.points >= required_points:
-            for n in range(dropped_points - (number - 1 - roi.scan[1])):
-                # insert 'zero' in the end
-                roi.mz.append(roi.mzmean)
-                roi.i.append(0)
-            ROIs.append(ROI(
-                        roi.scan,
-                        roi.rt,
-                        roi.i,
-                        roi.mz,
-                        roi.mzmean
-                        ))
-    # expand constructed roi
-    for roi in ROIs:
-        for n in range(dropped_points):
-            # insert in the begin
-            roi.i.insert(0, 0)
-            roi.mz.insert(0, roi.mzmean)
-        # change scan numbers (necessary for future matching)
-        roi.scan = (roi.scan[0] - dropped_points, roi.scan[1] + dropped_points)
-        assert roi.scan[1] - roi.scan[0] == len(roi.i) - 1
-    return ROIs
+                    merged[-1] = [merged[-1][0], slab[1], None]
+            if all(slab[2] is not None for slab in merged):
+                break
+            slabs = merged
+            total += sum(slab[2] is None for slab in slabs)
+
+    # every ROI belongs to a slab with its key, ROIs are ordered as in serial
+    # run: by the scan of completion and then by key
+    batches = []
+    for begin, end, (rois, keys) in slabs:
+        batches.append(rois.take((keys >= begin) & (keys < end)))
+    rois = ROIBatch.concatenate(batches)
+    if n_scans is None:  # a single slab is already in order
+        return rois
+    completion = np.minimum(rois.scan[:, 1], n_scans)
+    return rois.take(np.argsort(completion, kind='stable'))
 
 
 def construct_tic(path, label, progress_callback=None):
-    run = pymzml.run.Reader(path)
+    run = open_run(path)
+    if isinstance(run, ScanStore):
+        ms1 = run.ms_level == 1
+        time, tic, t_measure = run.rt[ms1], run.tic[ms1], run.time_unit
+        if t_measure == 'second':
+            time = time / 60
+        return {'x': time, 'y': tic, 'label': label}
+    fast = read_tic(path, progress_callback)  # only headers of spectra are read
+    if fast is not None:
+        time, tic, t_measure = fast
+        if t_measure == 'second':
+            time = np.array(time) / 60
+        return {'x': time, 'y': tic, 'label': label}
+
     t_measure = None
     time = []
     tic = []
     spectrum_count = run.get_spectrum_count()
-    for i, scan in enumerate(run):
-        if scan.ms_level == 1:
+    for i, scan in iter_spectra(run, 1):
+        try:
             tic.append(scan.TIC)  # get total ion of scan
-            t, measure = scan.scan_time  # get scan time
-            time.append(t)
-            if not t_measure:
-                t_measure = measure
-            if progress_callback is not None and not i % 10:
-                progress_callback.emit(int(i * 100 / spectrum_count))
+        except (AttributeError, TypeError, ValueError):  # there is no TIC in *.mzML
+            tic.append(float(np.sum(scan.i)))
+        t, measure = scan.scan_time  # get scan time
+        time.append(t)
+        if not t_measure:
+            t_measure = measure
+        if progress_callback is not None and not i % 10:
+            progress_callback.emit(int(i * 100 / spectrum_count))
     if t_measure == 'second':
         time = np.array(time) / 60
     return {'x': time, 'y': tic, 'label': label}
 
 
 def construct_eic(path, label, mz, delta, progress_callback=None):
-    run = pymzml.run.Reader(path)
+    return construct_eics(path, [label], [mz], [delta], progress_callback)[0]
+
+
+def construct_eics(path, labels, mzs, deltas, progress_callback=None):
+    """
+    Construct EICs for a few m/z values in one pass through file
+    :param path: path to mzml file
+    :param labels: labels of EICs
+    :param mzs: array of m/z values
+    :param deltas: array of tolerances (or a single tolerance for all m/z)
+    :param progress_callback: an pyQt5 signal to visualize progress
+    :return: a list of dicts with 'x', 'y' and 'label' (one dict for every m/z)
+    """
+    mzs = np.asarray(mzs, dtype=np.float64)
+    deltas = np.broadcast_to(np.asarray(deltas, dtype=np.float64), mzs.shape)
+    run = open_run(path)
     t_measure = None
     time = []
-    eic = []
+    eics = []
     spectrum_count = run.get_spectrum_count()
-    for i, scan in enumerate(run):
-        if scan.ms_level == 1:
-            t, measure = scan.scan_time  # get scan time
-            time.append(t)
-            pos = np.searchsorted(scan.mz, mz)
-            closest = get_closest(scan.mz, mz, pos)
-            if abs(scan.mz[closest] - mz) < delta:
-                eic.append(scan.i[closest])
-            else:
-                eic.append(0)
-            if not t_measure:
-                t_measure = measure
-            if progress_callback is not None and not i % 10:
-                progress_callback.emit(int(i * 100 / spectrum_count))
+    for i, scan in iter_spectra(run, 1):
+        t, measure = scan.scan_time  # get scan time
+        time.append(t)
+        eic = np.zeros(len(mzs))
+        n = len(scan.mz)
+        if n:
+            # the closest point for every m/z (as in get_closest)
+            pos = np.searchsorted(scan.mz, mzs)
+            right = np.minimum(pos, n - 1)
+            left = np.maximum(pos - 1, 0)
+            closest = np.where((pos == 0) | ((pos < n) & (scan.mz[right] - mzs < mzs - scan.mz[left])),
+                               right, left)
+            found = np.abs(scan.mz[closest] - mzs) < deltas
+            eic[found] = scan.i[closest[found]]
+        eics.append(eic)
+        if not t_measure:
+            t_measure = measure
+        if progress_callback is not None and not i % 10:
+            progress_callback.emit(int(i * 100 / spectrum_count))
     if t_measure == 'second':
         time = np.array(time) / 60
-    return {'x': time, 'y': eic, 'label': label}
+    eics = np.array(eics).reshape(len(time), len(mzs))
+    return [{'x': time, 'y': eics[:, k], 'label': label} for k, label in enumerate(labels)]
@@ -0,0 +1,135 @@
+import os
+import shutil
+import hashlib
+from processing_utils.roi import ROIBatch
+
+
+def file_fingerprint(path, sample_size=1 << 20):
+    """
+    Fingerprint of file: size, modification time and hash of the first and the last
+    sample_size bytes (the whole file isn't read, so it is cheap for large files)
+    :param path: path to file
+    :param sample_size: size of the hashed head and tail of the file
+    :return: a tuple (size, mtime, content hash)
+    """
+    stat = os.stat(path)
+    content_hash = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as file:
+        content_hash.update(file.read(sample_size))
+        if stat.st_size > sample_size:
+            file.seek(max(stat.st_size - sample_size, sample_size))
+            content_hash.update(file.read(sample_size))
+    return stat.st_size, stat.st_mtime_ns, content_hash.hexdigest()
+
+
+def implementation_name(function):
+    """
+    Name of ROI detection function: implementations (e.g. Cython get_ROIs and
+    get_ROIs_parallel) detect slightly different ROIs, so they don't share cache entries
+    """
+    name = getattr(function, '__qualname__', type(function).__qualname__)
+    return f'{function.__module__}.{name}'
+
+
+class ROICache:
+    """
+    On-disk cache of detected ROIs
+
+    Every entry is a folder with ROIBatch columns saved as *.npy files, which
+    are memory-mapped on load. The key of entry is a fingerprint of *.mzML file
+    and parameters of ROI detection. The least recently used entries are
+    removed when the total size of cache exceeds max_size.
+
+    Parameters
+    ----------
+    folder : str
+        -
+    max_size : int
+        -
+
+    Attributes
+    ----------
+    folder : str
+        a folder, where cache is stored
+    max_size : int
+        maximal size of cache in bytes
+    """
+    version = 2  # should be increased if ROI detection changes
+
+    def __init__(self, folder=os.path.join('data', 'roi_cache'), max_size=2 << 30):
+        self.folder = folder
+        self.max_size = max_size
+
+    def key(self, path, delta_mz, required_points, dropped_points, implementation=''):
+        size, mtime, content_hash = file_fingerprint(path)
+        description = f'{self.version}-{size}-{mtime}-{content_hash}-{implementation}-' \
+                      f'{delta_mz!r}-{required_points}-{dropped_points}'
+        return hashlib.blake2b(description.encode(), digest_size=16).hexdigest()
+
+    def load(self, path, delta_mz, required_points, dropped_points, implementation=''):
+        """
+        Load ROIs from cache
+        :param path: path to mzml file
+        :param implementation: name of ROI detection function (see implementation_name)
+        :return: ROIBatch (memory-mapped) or None if there is no such entry
+        """
+        entry = os.path.join(self.folder, self.key(path, delta_mz, required_points, dropped_points, implementation))
+        if not os.path.isdir(entry):
+            return None
+        try:
+            rois = ROIBatch.load(entry)
+        except (OSError, ValueError):  # incomplete or broken entry
+            return None
+        os.utime(entry)  # the entry was used
+        return rois
+
+    def save(self, rois, path, delta_mz, required_points, dropped_points, implementation=''):
+        """
+        Save ROIs into cache and evict the least recently used entries
+        :param rois: ROIBatch
+        :param path: path to mzml file
+        :param implementation: name of ROI detection function (see implementation_name)
+        """
+        key = self.key(path, delta_mz, required_points, dropped_points, implementation)
+        entry = os.path.join(self.folder, key)
+        # an entry appears at once (another process can use the same cache)
+        tmp = os.path.join(self.folder, f'.{key}.{os.getpid()}.tmp')
+        rois.save(tmp)
+        try:
+            os.replace(tmp, entry)
+        except OSError:  # the entry is already saved
+            shutil.rmtree(tmp, ignore_errors=True)
+        self._evict()
+
+    def detect(self, function, path, delta_mz, required_points, dropped_points, *args, **kwargs):
+        """
+        Load ROIs from cache or detect them and save into cache
+        :param function: ROI detection function (get_ROIs or get_ROIs_parallel)
+        :param path: path to mzml file
+        :return: ROIBatch
+        """
+        name = implementation_name(function)
+        rois = self.load(path, delta_mz, required_points, dropped_points, name)
+        if rois is None:
+            rois = ROIBatch.concatenate([function(path, delta_mz, required_points, dropped_points, *args, **kwargs)])
+            self.save(rois, path, delta_mz, required_points, dropped_points, name)
+        return rois
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.folder):
+            entry = os.path.join(self.folder, name)
+            if name.startswith('.') or not os.path.isdir(entry):
+                continue
+            size = sum(os.path.getsize(os.path.join(entry, file)) for file in os.listdir(entry))
+            entries.append((os.path.getmtime(entry), size, entry))
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_size:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        if os.path.isdir(self.folder):
+            shutil.rmtree(self.folder)
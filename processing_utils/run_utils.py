@@ -2,7 +2,6 @@ import os
 import torch
 import numpy as np
 from collections import defaultdict
-from scipy.interpolate import interp1d
 from processing_utils.matching import intersected, conv2correlation
 from itertools import permutations
 
@@ -19,6 +18,57 @@ def find_mzML(path, array=None):
     return array
 
 
+def resample(i, offsets, length, out=None):
+    """
+    Linear resampling of a ragged batch of signals to a fixed length (all signals at once)
+    :param i: concatenated intensities of signals
+    :param offsets: starts of signals in i and the total number of points
+    :param length: number of points after resampling
+    :param out: an array (number of signals, length) to write the result (optional)
+    :return: resampled signals (float64 if out is None)
+    """
+    i = np.asarray(i)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    n_points = np.diff(offsets)
+    if out is None:
+        out = np.empty((len(n_points), length))
+    # positions of new points in every signal, the same as in interp1d(...)(np.arange(length) / (length - 1) * (n - 1))
+    positions = np.arange(length) / (length - 1) * (n_points[:, np.newaxis] - 1.)
+    left = np.minimum(positions.astype(np.int64), np.maximum(n_points[:, np.newaxis] - 2, 0))
+    fraction = positions - left
+    left += offsets[:-1, np.newaxis]
+    right = np.minimum(left + 1, len(i) - 1)
+    np.add(i[left] * (1 - fraction), i[right] * fraction, out=out, casting='unsafe')
+    return out
+
+
+def preprocess_batch(i, offsets, device, interpolate=False, length=None):
+    """
+    Preprocessing of a ragged batch of signals for CNN: signals are resampled
+    to a fixed length or padded with zeros and normalized by their maximums
+    :param i: concatenated intensities of signals
+    :param offsets: starts of signals in i and the total number of points
+    :param device: cpu or gpu
+    :param interpolate: if signals should be resampled to length points (otherwise they are padded)
+    :param length: number of points after resampling (the length of the longest signal if None)
+    :return: torch.Tensor (number of signals, 1, length)
+    """
+    i = np.asarray(i)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    n_points = np.diff(offsets)
+    if length is None:
+        length = int(np.max(n_points, initial=0))
+    batch = torch.zeros((len(n_points), 1, length), dtype=torch.float32)
+    signals = batch.numpy()[:, 0, :]
+    if interpolate:
+        resample(i, offsets, length, out=signals)
+    else:
+        rows = np.repeat(np.arange(len(n_points)), n_points)
+        signals[rows, np.arange(len(i)) - np.repeat(offsets[:-1], n_points)] = i
+    signals /= np.max(signals, axis=1, keepdims=True)
+    return batch.to(device)
+
+
 def preprocess(signal, device, interpolate=False, length=None):
     """
     :param signal: intensities in roi
@@ -26,11 +76,59 @@ def preprocess(signal, device, interpolate=False, length=None):
     :param points: number of point needed for CNN
     :return: preprocessed intensities which can be used in CNN
     """
-    if interpolate:
-        interpolate = interp1d(np.arange(len(signal)), signal, kind='linear')
-        signal = interpolate(np.arange(length) / (length - 1) * (len(signal) - 1))
-    signal = torch.tensor(signal / np.max(signal), dtype=torch.float32, device=device)
-    return signal.view(1, 1, -1)
+    return preprocess_batch(signal, [0, len(signal)], device, interpolate, length)
+
+
+def roi_descriptors(i, offsets):
+    """
+    Cheap descriptors of a ragged batch of signals (all signals are processed at once)
+    :param i: concatenated intensities of signals
+    :param offsets: starts of signals in i and the total number of points (signals aren't empty)
+    :return: a tuple of arrays (number of non-zero points, ratio of maximum to median of non-zero
+        points, ratio of maximum of 3-point moving average to maximum), the last one is
+        1 + smoothed second derivative at the apex and is about 1 / 3 for single spikes
+    """
+    i = np.asarray(i, dtype=np.float64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    n_points = np.diff(offsets)
+    if not len(n_points):
+        return np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0)
+    begins, ends = offsets[:-1], offsets[1:]
+    rows = np.repeat(np.arange(len(n_points)), n_points)
+    points = np.bincount(rows, weights=i > 0, minlength=len(n_points)).astype(np.int64)
+    maximum = np.maximum.reduceat(i, begins)
+    # zeros are at the beginning of sorted signals, medians are taken over the rest
+    sorted_i = i[np.lexsort((i, rows))]
+    first = ends - points
+    lower = np.minimum(first + (points - 1) // 2, ends - 1)
+    upper = np.minimum(first + points // 2, ends - 1)
+    median = np.where(points > 0, (sorted_i[lower] + sorted_i[upper]) / 2, 0)
+    ratio = np.divide(maximum, median, out=np.zeros(len(n_points)), where=median > 0)
+    # neighbours outside of a signal are replaced by its edge points
+    left = np.empty_like(i)
+    left[1:] = i[:-1]
+    left[begins] = i[begins]
+    right = np.empty_like(i)
+    right[:-1] = i[1:]
+    right[ends - 1] = i[ends - 1]
+    smoothed = np.maximum.reduceat((left + i + right) / 3, begins)
+    smoothness = np.divide(smoothed, maximum, out=np.zeros(len(n_points)), where=maximum > 0)
+    return points, ratio, smoothness
+
+
+def noise_mask(i, offsets, min_points, min_ratio, min_smoothness):
+    """
+    Find signals which definitely don't contain peaks (see roi_descriptors): too short,
+    flat (the maximum is close to the median) or single spikes
+    :param i: concatenated intensities of signals
+    :param offsets: starts of signals in i and the total number of points
+    :param min_points: minimal number of non-zero points
+    :param min_ratio: minimal ratio of maximum to median
+    :param min_smoothness: minimal ratio of maximum of smoothed signal to maximum
+    :return: a boolean array (True for noise)
+    """
+    points, ratio, smoothness = roi_descriptors(i, offsets)
+    return (points < min_points) | (ratio < min_ratio) | (smoothness < min_smoothness)
 
 
 def classifier_prediction(roi, classifier, device, points=256):
@@ -75,26 +173,15 @@ def border_prediction(roi, integrator, device, peak_minimum_points, points=256,
     splitter = logits[0, 0, :].cpu().detach().numpy()
     domain = (1 - splitter) * logits[0, 1, :].cpu().detach().numpy() > threshold
 
-    borders_signal = []
-    borders_roi = []
-    begin = 0 if domain[0] else -1
-    peak_wide = 1 if domain[0] else 0
-    number_of_peaks = 0
-    for n in range(len(domain) - 1):
-        if domain[n + 1] and not domain[n]:  # peak begins
-            begin = n + 1
-            peak_wide = 1
-        elif domain[n + 1] and begin != -1:  # peak continues
-            peak_wide += 1
-        elif not domain[n + 1] and begin != -1:  # peak ends
-            if peak_wide / points * len(roi.i) > peak_minimum_points:
-                number_of_peaks += 1
-                borders_signal.append([begin, n + 2])  # to do: why n+2?
-                borders_roi.append([np.max((int((begin + 1) * len(roi.i) // points - 1), 0)),
-                                    int((n + 2) * len(roi.i) // points - 1) + 1])
-            begin = -1
-            peak_wide = 0
+    _, begins, ends = find_runs(domain[np.newaxis, :])
     # to do: if the peak doesn't end?
+    not_last = ends < len(domain)
+    begins, ends = begins[not_last], ends[not_last]
+    long = (ends - begins) / points * len(roi.i) > peak_minimum_points
+    borders_signal = [[b, e + 1] for b, e in zip(begins[long].tolist(), ends[long].tolist())]  # to do: why n+2?
+    borders_roi = [[np.max((int((b + 1) * len(roi.i) // points - 1), 0)), int(e * len(roi.i) // points - 1) + 1]
+                   for b, e in borders_signal]
+    number_of_peaks = len(borders_signal)
     # delete the smallest peak if there is no splitter between them
     n = 0
     while n < number_of_peaks - 1:
@@ -121,6 +208,55 @@ def border_intersection(border, avg_border):
     return intersected(border[0], border[1], avg_border[0], avg_border[1], 0.6)
 
 
+def find_runs(domain):
+    """
+    Find runs of True values in every row of 2-D boolean array
+    :param domain: np.ndarray (n_rows, n_points)
+    :return: a tuple of np.ndarray (rows, begins, ends) sorted by rows and begins, ends are exclusive
+    """
+    domain = np.asarray(domain, dtype=bool)
+    padded = np.zeros((domain.shape[0], domain.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = domain
+    changes = np.diff(padded, axis=1)
+    rows, begins = np.nonzero(changes == 1)
+    _, ends = np.nonzero(changes == -1)
+    return rows, begins, ends
+
+
+def get_borders_batch(integration_mask, intersection_mask, peak_minimum_points=5,
+                      threshold=0.5, interpolation_factor=1, lengths=None):
+    """
+    Extract borders of peaks from a batch of predicted masks at once
+    :param integration_mask: np.ndarray (n_rows, n_points)
+    :param intersection_mask: np.ndarray (n_rows, n_points)
+    :param peak_minimum_points: minimum number of points in peak (in ROI)
+    :param threshold: threshold for probability of peak
+    :param interpolation_factor: a ratio of the length of masks to the length of ROI (a number or for every row)
+    :param lengths: lengths of masks in rows if they are padded (optional)
+    :return: a list of borders (n_peaks x 2 lists) for every row
+    """
+    domain = integration_mask * (1 - intersection_mask) > threshold
+    n_rows, n_points = domain.shape
+    lengths = np.full(n_rows, n_points) if lengths is None else np.asarray(lengths)
+    domain &= np.arange(n_points) < lengths[:, np.newaxis]
+    interpolation_factor = np.broadcast_to(np.asarray(interpolation_factor, dtype=np.float64), (n_rows,))
+
+    rows, begins, ends = find_runs(domain)
+    factor = interpolation_factor[rows]
+    last = ends == lengths[rows]  # a peak which doesn't end in the mask
+    wide = ends - begins
+    # to do: the last peak is filtered by wide * interpolation_factor (as before)
+    keep = np.where(last, wide * factor > peak_minimum_points, wide / factor > peak_minimum_points)
+    b = begins // factor
+    e = np.where(last, lengths[rows] // factor, (ends + 1) // factor)  # to do: why n+2?
+
+    borders = [[] for _ in range(n_rows)]
+    for row, border_begin, border_end in zip(rows[keep].tolist(), b[keep].astype(np.int64).tolist(),
+                                             e[keep].astype(np.int64).tolist()):
+        borders[row].append([border_begin, border_end])
+    return borders
+
+
 def get_borders(integration_mask, intersection_mask, peak_minimum_points=5,
                 threshold=0.5, interpolation_factor=1):
     """
@@ -137,31 +273,8 @@ def get_borders(integration_mask, intersection_mask, peak_minimum_points=5,
     -------
 
     """
-    domain = integration_mask * (1 - intersection_mask) > threshold
-    borders_roi = []
-    begin = 0 if domain[0] else -1
-    peak_wide = 1 if domain[0] else 0
-    number_of_peaks = 0
-    for n in range(len(domain) - 1):
-        if domain[n + 1] and not domain[n]:  # peak begins
-            begin = n + 1
-            peak_wide = 1
-        elif domain[n + 1] and begin != -1:  # peak continues
-            peak_wide += 1
-        elif not domain[n + 1] and begin != -1:  # peak ends
-            if peak_wide / interpolation_factor > peak_minimum_points:
-                number_of_peaks += 1
-                b = int(begin // interpolation_factor)
-                e = int((n + 2) // interpolation_factor)  # to do: why n+2?
-                borders_roi.append([b, e])
-            begin = -1
-            peak_wide = 0
-    if begin != -1 and peak_wide * interpolation_factor > peak_minimum_points:
-        number_of_peaks += 1
-        b = int(begin // interpolation_factor)
-        e = int(len(domain) // interpolation_factor)
-        borders_roi.append([b, e])
-    return borders_roi
+    return get_borders_batch(np.asarray(integration_mask)[np.newaxis, :], np.asarray(intersection_mask)[np.newaxis, :],
+                             peak_minimum_points, threshold, interpolation_factor)[0]
 
 
 def intersection(begin1, end1, begin2, end2):
@@ -304,23 +417,11 @@ def border_correction(component, borders):
 
         # calculate number of peaks within similarity group
         averaged_domain = averaged_domain > 0.5  # to do: adjustable parameter?
-        number_of_peaks = 0
-        averaged_borders = []
-        begin = 0 if averaged_domain[0] else - 1
         # to do: think about peak wide and peak minimum points
-        # to do: the following code is almost the exact copy
-        # of the part of border_prediction function. Separate function?
-        for n in range(len(averaged_domain) - 1):
-            if averaged_domain[n + 1] and not averaged_domain[n]:  # peak begins
-                begin = n + 1
-            elif not averaged_domain[n + 1] and begin != -1:  # peak ends
-                number_of_peaks += 1
-                averaged_borders.append([begin + total_begin, n + 2 + total_begin])  # to do: why n+2?
-                begin = -1
-        if begin != -1:
-            number_of_peaks += 1
-            averaged_borders.append([begin + total_begin, len(averaged_domain) + 1 + total_begin])  # to do: why n+2?
-            begin = -1
+        _, begins, ends = find_runs(averaged_domain[np.newaxis, :])
+        averaged_borders = [[b + total_begin, e + 1 + total_begin]  # to do: why n+2?
+                            for b, e in zip(begins.tolist(), ends.tolist())]
+        number_of_peaks = len(averaged_borders)
 
         while number_of_peaks > max_number_of_peaks:  # need to merge some borders
             # to do: rethink this idea
@@ -1,14 +1,129 @@
 import os
+import queue
+import torch
+import threading
 import numpy as np
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from processing_utils.roi import ROIBatch, get_ROIs_parallel, iter_ROIs, get_ROIs as python_get_ROIs
 try:
     from cython_utils.roi import get_ROIs
 except ImportError:
-    from processing_utils.roi import get_ROIs
+    get_ROIs = python_get_ROIs
+from processing_utils.roi_cache import implementation_name
 from processing_utils.matching import construct_mzregions, rt_grouping, align_component
-from processing_utils.run_utils import preprocess, get_borders, Feature, \
+from models.quantization import quantize_model
+from processing_utils.run_utils import preprocess_batch, get_borders_batch, noise_mask, Feature, \
     border_correction, build_features, feature_collapsing
 
 
+def detect_ROIs(file, delta_mz, required_points, dropped_points, n_jobs=1, cache=None, progress_callback=None):
+    """
+    ROI detection in a single file (in m/z slabs if n_jobs != 1 and through cache if it is given)
+    :param file: path to mzml file
+    :param n_jobs: number of processes for ROI detection in m/z slabs
+    :param cache: ROICache or None
+    :param progress_callback: an pyQt5 signal to visualize progress
+    :return: ROIs found in file
+    """
+    function, args = (get_ROIs_parallel, (n_jobs,)) if n_jobs != 1 else (get_ROIs, ())
+    if cache is not None:
+        return cache.detect(function, file, delta_mz, required_points, dropped_points,
+                            *args, progress_callback=progress_callback)
+    return function(file, delta_mz, required_points, dropped_points, *args, progress_callback=progress_callback)
+
+
+def available_memory():
+    """
+    Amount of free physical memory in bytes (None if it is unknown)
+    """
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def required_memory(file):
+    """
+    Rough estimation of memory required for ROI detection in file (decoded scans and ROIs)
+    """
+    return 3 * os.path.getsize(file)
+
+
+class _QueueCallback:
+    """
+    Replacement of progress signal in worker processes: progress is sent to the main process
+    """
+    def __init__(self, progress_queue, index):
+        self.progress_queue = progress_queue
+        self.index = index
+
+    def emit(self, value):
+        self.progress_queue.put((self.index, value))
+
+
+def _put(buffer, item, stop):
+    """
+    Put item into a bounded queue, waiting while it is full (until stop is set)
+    :return: True if item was put
+    """
+    while not stop.is_set():
+        try:
+            buffer.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _produce(iterator, buffer, stop):
+    try:
+        for item in iterator:
+            if not _put(buffer, (True, item), stop):
+                return
+    except BaseException as exception:  # re-raised in the consumer thread
+        _put(buffer, (False, exception), stop)
+    else:
+        _put(buffer, (False, None), stop)
+
+
+def prefetch(iterator, queue_size):
+    """
+    Run iterator in a separate thread: items are passed through a bounded queue,
+    so the producer is paused when the consumer lags behind (memory stays bounded)
+    :param iterator: an iterator (e.g. ROI detection)
+    :param queue_size: maximal number of items waiting in the queue
+    :return: a generator of items of iterator (exceptions are re-raised)
+    """
+    buffer = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    producer = threading.Thread(target=_produce, args=(iterator, buffer, stop), daemon=True)
+    producer.start()
+    try:
+        while True:
+            is_item, item = buffer.get()
+            if not is_item:
+                if item is not None:
+                    raise item
+                return
+            yield item
+    finally:
+        stop.set()
+        producer.join()
+
+
+_progress_queue = None
+
+
+def _init_worker(progress_queue):
+    global _progress_queue
+    _progress_queue = progress_queue
+
+
+def _detect_ROIs_in_worker(index, file, *args):
+    return detect_ROIs(file, *args, progress_callback=_QueueCallback(_progress_queue, index))
+
+
 class BasicRunner:
     """
     A runner to process single roi
@@ -21,6 +136,12 @@ class BasicRunner:
         a list of models
     peak_minimum_points : int
         -
+    batch_size : int
+        -
+    quantization : str
+        -
+    calibration : list
+        -
 
     Attributes
     ----------
@@ -34,18 +155,30 @@ class BasicRunner:
         an ANN model for segmentation (optional)
     peak_minimum_points : int
         minimum peak length in points
+    batch_size : int
+        number of ROIs processed by models at once
+    quantization : str
+        int8 inference on cpu: 'dynamic' (LSTM and Linear layers), 'static' (conv stacks
+        are also quantized, calibration ROIs are required) or None (float32 models)
 
     """
-    def __init__(self, mode, models, peak_minimum_points, device):
+    def __init__(self, mode, models, peak_minimum_points, device, batch_size=64,
+                 quantization=None, calibration=None):
         self.mode = mode
         if self.mode == 'all in one':
             self.model = models[0]
         elif self.mode == 'sequential':
             self.classifier, self.segmentator = models
+            if hasattr(self.segmentator, 'fused'):  # an eval copy with BatchNorm folded into convolutions
+                self.segmentator = self.segmentator.fused()
         else:
             assert False, mode
         self.peak_minimum_points = peak_minimum_points
         self.device = device
+        self.batch_size = batch_size
+        self.quantization = quantization
+        if quantization is not None:
+            self._quantize(quantization, calibration)
 
     def __call__(self, roi, sample_name, progress_callback=None, operation_callback=None):
         """
@@ -62,35 +195,141 @@ class BasicRunner:
         feature : list
             a list of  'Feature' objects
         """
+        return self.process_rois([roi], [sample_name])[0]
+
+    def process_rois(self, rois, sample_names, progress_callback=None):
+        """
+        Processing a list of rois (models process them in batches)
+
+        Parameters
+        ----------
+        rois : list
+            a list of ROIs
+        sample_names : list
+            sample names of ROIs
+        progress_callback : QtCore.pyqtSignal
+            -
+        Returns
+        -------
+        features : list
+            a list of 'Feature' objects for every ROI
+        """
+        borders = self.predict_borders(rois, progress_callback)
+        return [self._build_features(roi, sample_name, roi_borders)
+                for roi, sample_name, roi_borders in zip(rois, sample_names, borders)]
+
+    def predict_borders(self, rois, progress_callback=None):
+        """
+        Predict peaks in ROIs, models process ROIs in batches. In 'sequential' mode
+        all ROIs are classified first and only ROIs with peaks are segmented.
+
+        Parameters
+        ----------
+        rois : list
+            a list of ROIs
+        progress_callback : QtCore.pyqtSignal
+            -
+        Returns
+        -------
+        borders : list
+            borders of peaks for every ROI (None if ROI doesn't contain a peak)
+        """
+        borders = [None] * len(rois)
         if self.mode == 'all in one':
-            signal = preprocess(roi.i, self.device)
-            classifier_output, segmentator_output = self.model(signal)
+            # signals aren't interpolated: ROIs of similar length are padded to a batch
+            order = np.argsort([len(roi.i) for roi in rois], kind='stable')
+            predicted = self._run_batches(self._predict_batch, rois, order, progress_callback)
         elif self.mode == 'sequential':
-            signal = preprocess(roi.i, self.device, interpolate=True, length=256)
-            classifier_output, _ = self.classifier(signal)
-            # to do: second step should be only for peaks
-            _, segmentator_output = self.segmentator(signal)
+            labels = self._run_batches(self._classify_batch, rois, np.arange(len(rois)), progress_callback, (0, 50))
+            order = np.flatnonzero(np.array(labels, dtype=np.int64) == 1)
+            predicted = self._run_batches(self._segment_batch, rois, order, progress_callback, (50, 100))
         else:
             assert False, self.mode
-        classifier_output = classifier_output.data.cpu().numpy()
+        for index, roi_borders in zip(order, predicted):
+            borders[index] = roi_borders
+        return borders
+
+    def _run_batches(self, function, rois, indexes, progress_callback=None, progress_range=(0, 100)):
+        """
+        Apply function to batches of rois[indexes] and concatenate the results
+        """
+        results = []
+        begin, end = progress_range
+        percentage = -1
+        for k in range(0, len(indexes), self.batch_size):
+            batch = indexes[k:k + self.batch_size]
+            results.extend(function([rois[index] for index in batch]))
+            new_percentage = begin + int((k + len(batch)) * (end - begin) / len(indexes))
+            if progress_callback is not None and new_percentage > percentage:
+                percentage = new_percentage
+                progress_callback.emit(percentage)
+        if progress_callback is not None and not len(indexes):
+            progress_callback.emit(end)
+        return results
+
+    def _predict_batch(self, rois):
+        with torch.no_grad():
+            lengths = torch.tensor([len(roi.i) for roi in rois])
+            signal = self._preprocess(rois)
+            classifier_output, segmentator_output = self.model(signal, lengths)
+        labels = np.argmax(classifier_output.data.cpu().numpy().reshape(len(rois), -1), axis=1)
         segmentator_output = segmentator_output.data.sigmoid().cpu().numpy()
+        # padding is cut off
+        borders = get_borders_batch(segmentator_output[:, 0, :], segmentator_output[:, 1, :],
+                                    peak_minimum_points=self.peak_minimum_points, lengths=lengths)
+        return [roi_borders if label == 1 else None for label, roi_borders in zip(labels, borders)]
+
+    def _classify_batch(self, rois):
+        with torch.no_grad():
+            signal = self._preprocess(rois, interpolate=True)
+            classifier_output, _ = self.classifier(signal)
+        return np.argmax(classifier_output.data.cpu().numpy().reshape(len(rois), -1), axis=1)
+
+    def _segment_batch(self, rois):
+        with torch.no_grad():
+            signal = self._preprocess(rois, interpolate=True)
+            _, segmentator_output = self.segmentator(signal)
+        segmentator_output = segmentator_output.data.sigmoid().cpu().numpy()
+        return get_borders_batch(segmentator_output[:, 0, :], segmentator_output[:, 1, :],
+                                 peak_minimum_points=self.peak_minimum_points,
+                                 interpolation_factor=signal.shape[2] / np.array([len(roi.i) for roi in rois]))
+
+    def _quantize(self, quantization, calibration=None):
+        """
+        Replace models by their int8 copies
+        :param quantization: 'dynamic' or 'static'
+        :param calibration: a list of ROIs to collect ranges of activations (for 'static')
+        """
+        if quantization not in ('dynamic', 'static'):
+            raise ValueError(f'unknown quantization: {quantization}')
+        if torch.device(self.device).type != 'cpu':
+            raise ValueError('quantized models run only on cpu')
+        if quantization == 'static' and not calibration:
+            raise ValueError('static quantization requires calibration ROIs')
+        signal = self._preprocess(calibration, interpolate=True) if quantization == 'static' else None
+        if self.mode == 'all in one':
+            self.model = quantize_model(self.model)  # only LSTM and Linear layers are quantized
+        else:
+            self.classifier = quantize_model(self.classifier, signal)
+            self.segmentator = quantize_model(self.segmentator, signal)
 
-        # get label
-        label = np.argmax(classifier_output)
-        # get borders
+    def _preprocess(self, rois, interpolate=False):
+        offsets = np.zeros(len(rois) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(roi.i) for roi in rois])
+        return preprocess_batch(np.concatenate([roi.i for roi in rois]), offsets, self.device,
+                                interpolate=interpolate, length=256 if interpolate else None)
+
+    @staticmethod
+    def _build_features(roi, sample_name, borders):
         features = []
-        if label == 1:
-            borders = get_borders(segmentator_output[0, 0, :], segmentator_output[0, 1, :],
-                                  peak_minimum_points=self.peak_minimum_points,
-                                  interpolation_factor=len(signal[0, 0]) / len(roi.i))
-            for border in borders:
-                # to do: check correctness of rt calculations
-                scan_frequency = (roi.scan[1] - roi.scan[0]) / (roi.rt[1] - roi.rt[0])
-                rtmin = roi.rt[0] + border[0] / scan_frequency
-                rtmax = roi.rt[0] + border[1] / scan_frequency
-                feature = Feature([sample_name], [roi], [border], [0], [np.sum(roi.i[border[0]:border[1]])],
-                                  roi.mzmean, rtmin, rtmax, 0, 0)
-                features.append(feature)
+        for border in borders or []:
+            # to do: check correctness of rt calculations
+            scan_frequency = (roi.scan[1] - roi.scan[0]) / (roi.rt[1] - roi.rt[0])
+            rtmin = roi.rt[0] + border[0] / scan_frequency
+            rtmax = roi.rt[0] + border[1] / scan_frequency
+            feature = Feature([sample_name], [roi], [border], [0], [np.sum(roi.i[border[0]:border[1]])],
+                              roi.mzmean, rtmin, rtmax, 0, 0)
+            features.append(feature)
         return features
 
 
@@ -110,6 +349,22 @@ class FilesRunner(BasicRunner):
         -
     peak_minimum_points : int
         -
+    n_jobs : int
+        -
+    cache : ROICache
+        -
+    n_files_jobs : int
+        -
+    memory_limit : int
+        -
+    batch_size : int
+        -
+    quantization : str
+        -
+    calibration : list
+        -
+    noise_threshold : float
+        -
 
     Attributes
     ----------
@@ -129,17 +384,52 @@ class FilesRunner(BasicRunner):
         maximal number of zero points in a row (for ROI detection)
     peak_minimum_points : int
         minimum peak length in points
+    n_jobs : int
+        number of processes for ROI detection in m/z slabs (1 means serial detection)
+    cache : ROICache
+        on-disk cache of detected ROIs (optional)
+    n_files_jobs : int
+        number of files processed simultaneously by separate processes in batch mode
+    memory_limit : int
+        memory (in bytes) for simultaneous ROI detection, new files are not started
+        if it is exceeded (free physical memory by default)
+    batch_size : int
+        number of ROIs processed by models at once
+    quantization : str
+        int8 inference on cpu: 'dynamic', 'static' or None (see BasicRunner)
+    noise_threshold : float
+        minimal ratio of maximum to median intensity, ROIs below it, shorter than
+        peak_minimum_points or single spikes are skipped before models (None to process all ROIs)
+    skipped_rois : int
+        number of ROIs skipped as noise during the last run
 
     """
+    # ROIs are passed from detection to models in chunks of this size (see '_single_run')
+    chunk_size = 256
+    # maximal number of detected chunks waiting for models
+    queue_size = 4
+    # ROIs with smaller ratio of maximum of 3-point moving average to maximum are single spikes
+    spike_smoothness = 0.4
+
     def __init__(self, mode, models, delta_mz,
                  required_points, dropped_points,
-                 peak_minimum_points, device):
-        super(FilesRunner, self).__init__(mode, models, peak_minimum_points, device)
+                 peak_minimum_points, device, n_jobs=1, cache=None,
+                 n_files_jobs=1, memory_limit=None, batch_size=64, quantization=None, calibration=None,
+                 noise_threshold=None):
+        super(FilesRunner, self).__init__(mode, models, peak_minimum_points, device, batch_size,
+                                          quantization, calibration)
         self.delta_mz = delta_mz
         self.required_points = required_points
         self.dropped_points = dropped_points
+        self.n_jobs = n_jobs
+        self.cache = cache
+        self.n_files_jobs = n_files_jobs
+        self.memory_limit = memory_limit
+        self.noise_threshold = noise_threshold
+        self.skipped_rois = 0
 
     def __call__(self, files, progress_callback=None, operation_callback=None):
+        self.skipped_rois = 0
         if len(files) == 1:
             file = files[0]
             features = self._single_run(file, progress_callback, operation_callback)
@@ -147,8 +437,93 @@ class FilesRunner(BasicRunner):
             features = self._batch_run(files, progress_callback, operation_callback)
         else:
             features = []
+        if operation_callback is not None and self.noise_threshold is not None:
+            operation_callback.emit(f'{self.skipped_rois} ROIs were skipped as noise')
         return features
 
+    def predict_borders(self, rois, progress_callback=None):
+        """
+        Predict peaks in ROIs, obvious noise is skipped before models (see noise_threshold)
+        """
+        if self.noise_threshold is None or not rois:
+            return super(FilesRunner, self).predict_borders(rois, progress_callback)
+        offsets = np.zeros(len(rois) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(roi.i) for roi in rois])
+        kept = np.flatnonzero(~noise_mask(np.concatenate([roi.i for roi in rois]), offsets,
+                                          self.peak_minimum_points, self.noise_threshold, self.spike_smoothness))
+        self.skipped_rois += len(rois) - len(kept)
+        borders = [None] * len(rois)
+        predicted = super(FilesRunner, self).predict_borders([rois[index] for index in kept], progress_callback)
+        for index, roi_borders in zip(kept, predicted):
+            borders[index] = roi_borders
+        return borders
+
+    def _get_ROIs(self, file, progress_callback=None):
+        return detect_ROIs(file, self.delta_mz, self.required_points, self.dropped_points,
+                           self.n_jobs, self.cache, progress_callback)
+
+    def _get_ROIs_batch(self, files, progress_callback=None, operation_callback=None):
+        """
+        ROI detection in a batch of files, files are processed by a pool of processes
+
+        Parameters
+        ----------
+        files : list
+            list of paths to *.mzML files
+
+        Returns
+        -------
+        rois : dict
+            ROIs for every file (in the same order as files)
+        """
+        if self.n_files_jobs == 1:
+            rois = {}
+            for file in files:
+                if operation_callback is not None:
+                    operation_callback.emit(f'Detecting ROIs in {os.path.basename(file)}:')
+                rois[file] = self._get_ROIs(file, progress_callback)
+            return rois
+
+        if operation_callback is not None:
+            operation_callback.emit(f'Detecting ROIs in {len(files)} files:')
+        memory_limit = available_memory() if self.memory_limit is None else self.memory_limit
+        parameters = (self.delta_mz, self.required_points, self.dropped_points, self.n_jobs, self.cache)
+        rois = dict.fromkeys(files)
+        progress = [0] * len(files)
+        percentage = -1
+        progress_queue = multiprocessing.Queue()
+        with ProcessPoolExecutor(max_workers=self.n_files_jobs, initializer=_init_worker,
+                                 initargs=(progress_queue,)) as executor:
+            pending = list(enumerate(files))
+            running = {}  # future -> (index, required memory)
+            while pending or running:
+                # start new files while there is enough memory (at least one file is always processed)
+                while pending and len(running) < self.n_files_jobs:
+                    index, file = pending[0]
+                    memory = required_memory(file)
+                    in_use = sum(memory for _, memory in running.values())
+                    if running and memory_limit is not None and in_use + memory > memory_limit:
+                        break
+                    pending.pop(0)
+                    running[executor.submit(_detect_ROIs_in_worker, index, file, *parameters)] = (index, memory)
+                done, _ = wait(running, timeout=0.1, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, _ = running.pop(future)
+                    rois[files[index]] = future.result()
+                    progress[index] = 100
+                try:
+                    while True:
+                        index, value = progress_queue.get_nowait()
+                        if progress[index] < 100:
+                            progress[index] = value
+                except queue.Empty:
+                    pass
+                new_percentage = sum(progress) // len(files)
+                if progress_callback is not None and new_percentage > percentage:
+                    percentage = new_percentage
+                    progress_callback.emit(percentage)
+        return rois
+
     def _single_run(self, file, progress_callback=None, operation_callback=None):
         """
         Processing single *.mzML file
@@ -163,21 +538,40 @@ class FilesRunner(BasicRunner):
         features : list
             a list of 'Feature' objects (each consist of single ROI)
         """
-        # get ROIs from raw spectrum
-        if operation_callback is not None:
-            operation_callback.emit(f'Detecting ROIs in {os.path.basename(file)}:')
-        rois = get_ROIs(file, self.delta_mz, self.required_points, self.dropped_points, progress_callback)
         features = []
-        percentage = -1
-        if operation_callback is not None:
-            operation_callback.emit(f'Finding peaks in detected ROIs:')
-        for i, roi in enumerate(rois):
-            features_from_roi = super(FilesRunner, self).__call__(roi, file)
-            features.extend(features_from_roi)
-            new_percentage = int(i * 100 / len(rois))
-            if progress_callback is not None and new_percentage > percentage:
-                percentage = new_percentage
-                progress_callback.emit(percentage)
+        cached = None
+        # ROIs can be streamed only by the python implementation (iter_ROIs gives the same ROIs as get_ROIs)
+        streaming = self.n_jobs == 1 and get_ROIs is python_get_ROIs
+        if streaming and self.cache is not None:
+            cached = self.cache.load(file, self.delta_mz, self.required_points, self.dropped_points,
+                                     implementation_name(get_ROIs))
+        if streaming and cached is None:
+            # pipeline: finished ROIs are processed by models while the rest of file is scanned
+            if operation_callback is not None:
+                operation_callback.emit(f'Detecting ROIs and finding peaks in {os.path.basename(file)}:')
+            detection = iter_ROIs(file, self.delta_mz, self.required_points, self.dropped_points,
+                                  self.chunk_size, progress_callback)
+            detected = []
+            for rois in prefetch(detection, self.queue_size):
+                if self.cache is not None:
+                    detected.append(rois)
+                for features_from_roi in self.process_rois(rois, [file] * len(rois)):
+                    features.extend(features_from_roi)
+            if self.cache is not None:
+                # the same entry as the one of detect_ROIs (and ROI annotation)
+                self.cache.save(ROIBatch.concatenate(detected), file, self.delta_mz, self.required_points,
+                                self.dropped_points, implementation_name(get_ROIs))
+            if progress_callback is not None:
+                progress_callback.emit(100)
+        else:
+            # get ROIs from raw spectrum (or from cache)
+            if operation_callback is not None:
+                operation_callback.emit(f'Detecting ROIs in {os.path.basename(file)}:')
+            rois = self._get_ROIs(file, progress_callback) if cached is None else cached
+            if operation_callback is not None:
+                operation_callback.emit(f'Finding peaks in detected ROIs:')
+            for features_from_roi in self.process_rois(rois, [file] * len(rois), progress_callback):
+                features.extend(features_from_roi)
 
         parameters = {'files': [file], 'delta mz': self.delta_mz, 'required points': self.required_points,
                       'dropped_points': self.dropped_points, 'peak minimum points': self.peak_minimum_points}
@@ -198,12 +592,7 @@ class FilesRunner(BasicRunner):
             a list of 'Feature' objects
         """
         # ROI detection
-        rois = {}
-        for file in files:  # get ROIs for every file
-            if operation_callback is not None:
-                operation_callback.emit(f'Detecting ROIs in {os.path.basename(file)}:')
-            rois[file] = get_ROIs(file, self.delta_mz, self.required_points, self.dropped_points, progress_callback)
-
+        rois = self._get_ROIs_batch(files, progress_callback, operation_callback)
 
         if operation_callback is not None:
             operation_callback.emit(f'Alignment of ROIs:')
@@ -221,40 +610,25 @@ class FilesRunner(BasicRunner):
 
         if operation_callback is not None:
             operation_callback.emit(f'Finding peaks in detected ROIs:')
-        # Classification, integration and correction
+        # Classification and integration (ROIs of all components are processed in batches)
+        component_rois = [roi for component in aligned_components for roi in component.rois]
+        predicted = iter(self.predict_borders(component_rois, progress_callback))
+
+        if operation_callback is not None:
+            operation_callback.emit(f'Correction of peaks:')
+        # Correction
         component_number = 0
         features = []
         percentage = -1
         for j, component in enumerate(aligned_components):  # run through components
             borders = {}  # borders for rois with peaks
             to_delete = []  # noisy rois in components
-            for i, (sample, roi) in enumerate(zip(component.samples, component.rois)):
-                if self.mode == 'all in one':
-                    signal = preprocess(roi.i, self.device)
-                    classifier_output, segmentator_output = self.model(signal)
-                    classifier_output = classifier_output.data.cpu().numpy()
-                    label = np.argmax(classifier_output)
-                    if label == 1:
-                        segmentator_output = segmentator_output.data.sigmoid().cpu().numpy()
-                        borders[sample] = get_borders(segmentator_output[0, 0, :], segmentator_output[0, 1, :],
-                                                      peak_minimum_points=self.peak_minimum_points)
-                    else:
-                        to_delete.append(i)
-                elif self.mode == 'sequential':
-                    signal = preprocess(roi.i, self.device, interpolate=True, length=256)
-                    classifier_output, _ = self.classifier(signal)
-                    classifier_output = classifier_output.data.cpu().numpy()
-                    label = np.argmax(classifier_output)
-                    if label == 1:
-                        _, segmentator_output = self.segmentator(signal)
-                        segmentator_output = segmentator_output.data.sigmoid().cpu().numpy()
-                        borders[sample] = get_borders(segmentator_output[0, 0, :], segmentator_output[0, 1, :],
-                                                      peak_minimum_points=self.peak_minimum_points,
-                                                      interpolation_factor=len(signal[0, 0]) / len(roi.i))
-                    else:
-                        to_delete.append(i)
+            for i, sample in enumerate(component.samples):
+                roi_borders = next(predicted)
+                if roi_borders is not None:
+                    borders[sample] = roi_borders
                 else:
-                    assert False, self.mode
+                    to_delete.append(i)
 
             if len(borders) > len(files) // 3:  # enough rois contain a peak
                 component.pop(to_delete)  # delete ROIs which don't contain peaks
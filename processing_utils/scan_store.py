@@ -0,0 +1,276 @@
+import os
+import json
+import shutil
+import pymzml
+import numpy as np
+from processing_utils.mzml_index import Spectrum, IndexedReader
+
+
+class _ColumnWriter:
+    """
+    A column of the store, which is written by parts: parts are buffered, appended
+    to a raw file and the file is converted into *.npy file, when the column is closed
+
+    Parameters
+    ----------
+    path : str
+        -
+    dtype : np.dtype
+        -
+
+    Attributes
+    ----------
+    path : str
+        path to *.npy file
+    dtype : np.dtype
+        type of the column (the type of the first part if it is None, the next parts are cast to it)
+    size : int
+        number of written values
+    """
+    buffer_size = 1 << 22  # bytes of parts, which are kept in memory before writing
+    copy_size = 1 << 24  # number of values copied into *.npy file at once
+
+    def __init__(self, path, dtype=None):
+        self.path = path
+        self.dtype = None if dtype is None else np.dtype(dtype)
+        self.size = 0
+        self._raw = open(path + '.raw', 'wb')
+        self._parts = []
+        self._buffered = 0
+
+    def append(self, part):
+        part = np.asarray(part, dtype=self.dtype)
+        if self.dtype is None:
+            self.dtype = part.dtype
+        self._parts.append(part)
+        self._buffered += part.nbytes
+        self.size += len(part)
+        if self._buffered >= self.buffer_size:
+            self._flush()
+
+    def _flush(self):
+        if self._parts:
+            np.concatenate(self._parts).tofile(self._raw)
+            self._parts = []
+            self._buffered = 0
+
+    def close(self):
+        self._flush()
+        self._raw.close()
+        dtype = self.dtype or np.dtype(np.float64)
+        if self.size:
+            raw = np.memmap(self.path + '.raw', dtype=dtype, mode='r', shape=(self.size,))
+            column = np.lib.format.open_memmap(self.path, mode='w+', dtype=dtype, shape=(self.size,))
+            for begin in range(0, self.size, self.copy_size):
+                column[begin:begin + self.copy_size] = raw[begin:begin + self.copy_size]
+            column.flush()
+            del raw, column
+        else:  # empty files can't be memory-mapped
+            np.save(self.path, np.zeros(0, dtype=dtype))
+        os.remove(self.path + '.raw')
+
+    def discard(self):
+        """
+        Close the raw file without conversion (e.g. if reading of *.mzML file fails)
+        """
+        self._raw.close()
+        self._parts = []
+
+
+class ScanStore:
+    """
+    Columnar binary copy of *.mzML file: all spectra are concatenated into
+    m/z and intensity columns, the spectrum k occupies [offsets[k], offsets[k + 1]).
+    A store is saved next to *.mzML file (see 'sidecar') as a folder of *.npy
+    files, which are memory-mapped on load. It can be iterated as pymzml.run.Reader.
+
+    Parameters
+    ----------
+    mz : np.ndarray
+        -
+    i : np.ndarray
+        -
+    offsets : np.ndarray
+        -
+    rt : np.ndarray
+        -
+    ms_level : np.ndarray
+        -
+    tic : np.ndarray
+        -
+    time_unit : str
+        -
+
+    Attributes
+    ----------
+    mz : np.ndarray
+        concatenated m/z of all spectra (float32 or float64 as in *.mzML file)
+    i : np.ndarray
+        concatenated intensities of all spectra (float32 or float64 as in *.mzML file)
+    offsets : np.ndarray
+        starts of spectra in mz and i columns and the total number of points (int64)
+    rt : np.ndarray
+        retention times of spectra (float64)
+    ms_level : np.ndarray
+        ms levels of spectra (int8)
+    tic : np.ndarray
+        total ion currents of spectra (float64)
+    time_unit : str
+        unit of retention times (as in pymzml: 'second' or 'minute')
+    """
+    columns = ('mz', 'i', 'offsets', 'rt', 'ms_level', 'tic')
+    version = 1  # should be increased if the format changes
+
+    def __init__(self, mz, i, offsets, rt, ms_level, tic, time_unit='second'):
+        self.mz = mz
+        self.i = i
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.rt = np.asarray(rt, dtype=np.float64)
+        self.ms_level = np.asarray(ms_level, dtype=np.int8)
+        self.tic = np.asarray(tic, dtype=np.float64)
+        self.time_unit = time_unit
+
+    @staticmethod
+    def sidecar(path):
+        """
+        Folder of the store for *.mzML file
+        """
+        return path + '.scans'
+
+    @staticmethod
+    def _source(path):
+        stat = os.stat(path)
+        return {'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+
+    @classmethod
+    def build(cls, path, progress_callback=None):
+        """
+        Convert *.mzML file into the store (the result is saved next to file), spectra are written
+        to the columns one by one, so the file isn't loaded into memory
+        :param path: path to mzml file
+        :param progress_callback: an pyQt5 signal to visualize progress
+        :return: ScanStore (memory-mapped)
+        """
+        source = cls._source(path)
+        folder = cls.sidecar(path)
+        tmp = f'{folder}.{os.getpid()}.tmp'
+        os.makedirs(tmp, exist_ok=True)
+        writers = {column: _ColumnWriter(os.path.join(tmp, column + '.npy'), dtype)
+                   for column, dtype in [('mz', None), ('i', None), ('offsets', np.int64), ('rt', np.float64),
+                                         ('ms_level', np.int8), ('tic', np.float64)]}
+        try:
+            run = IndexedReader.open(path) or pymzml.run.Reader(path)
+            spectrum_count = run.get_spectrum_count()
+            time_unit = None
+            total = 0
+            progress = 0
+            writers['offsets'].append([total])
+            for number, scan in enumerate(run):
+                writers['mz'].append(scan.mz)
+                writers['i'].append(scan.i)
+                total += len(scan.mz)
+                writers['offsets'].append([total])
+                t, measure = scan.scan_time
+                writers['rt'].append([np.nan if t is None else t])
+                if time_unit is None:
+                    time_unit = measure
+                writers['ms_level'].append([scan.ms_level])
+                try:
+                    tic = scan.TIC
+                except (AttributeError, TypeError, ValueError):  # there is no total ion current in *.mzML
+                    tic = float(np.sum(scan.i))
+                writers['tic'].append([tic])
+                if progress_callback is not None and spectrum_count:
+                    percent = int(99 * (number + 1) / spectrum_count)
+                    if percent != progress:
+                        progress = percent
+                        progress_callback.emit(progress)
+            for writer in writers.values():
+                writer.close()
+        except BaseException:
+            for writer in writers.values():
+                writer.discard()
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        with open(os.path.join(tmp, 'meta.json'), 'w') as meta:
+            json.dump({'version': cls.version, 'source': source, 'time unit': time_unit or 'second'}, meta)
+        shutil.rmtree(folder, ignore_errors=True)
+        os.replace(tmp, folder)
+        if progress_callback is not None:
+            progress_callback.emit(100)
+        return cls.open(path)
+
+    @classmethod
+    def open(cls, path, mmap_mode='r'):
+        """
+        Open the store of *.mzML file
+        :param path: path to mzml file
+        :param mmap_mode: numpy memory-map mode (None to read the columns into memory)
+        :return: ScanStore or None if there is no store or it is older than *.mzML file
+        """
+        folder = cls.sidecar(path)
+        try:
+            with open(os.path.join(folder, 'meta.json')) as meta:
+                meta = json.load(meta)
+            if meta['version'] != cls.version or meta['source'] != cls._source(path):
+                return None
+            columns = [np.load(os.path.join(folder, column + '.npy'), mmap_mode=mmap_mode)
+                       for column in cls.columns]
+        except (OSError, ValueError, KeyError):
+            return None
+        return cls(*columns, meta['time unit'])
+
+    def __len__(self):
+        return len(self.rt)
+
+    def get_spectrum_count(self):
+        return len(self)
+
+    def __getitem__(self, k):
+        begin, end = self.offsets[k], self.offsets[k + 1]
+        return Spectrum(int(self.ms_level[k]), self.mz[begin:end], self.i[begin:end],
+                        (float(self.rt[k]), self.time_unit), float(self.tic[k]))
+
+    def spectra(self, ms_level=None):
+        """
+        Iterate over spectra of the given ms level
+        :param ms_level: the required ms level (all spectra if None)
+        :return: a generator of (number of spectrum in file, Spectrum) tuples
+        """
+        numbers = range(len(self)) if ms_level is None else np.flatnonzero(self.ms_level == ms_level)
+        for k in numbers:
+            yield int(k), self[k]
+
+    def __iter__(self):
+        for _, spectrum in self.spectra():
+            yield spectrum
+
+
+def open_run(path):
+    """
+    Open *.mzML file: the store is used if it exists and is fresh, IndexedReader
+    (spectra are decoded by a pool of threads) if file is indexed, pymzml reader otherwise
+    :param path: path to mzml file
+    :return: ScanStore, IndexedReader or pymzml.run.Reader
+    """
+    run = ScanStore.open(path)
+    if run is None:
+        run = IndexedReader.open(path)
+    if run is None:
+        run = pymzml.run.Reader(path)
+    return run
+
+
+def iter_spectra(run, ms_level):
+    """
+    Iterate over spectra of the given ms level, other spectra are skipped before decoding of their arrays
+    :param run: ScanStore, IndexedReader or pymzml.run.Reader (see open_run)
+    :param ms_level: the required ms level
+    :return: a generator of (number of spectrum in file, spectrum) tuples
+    """
+    if isinstance(run, (ScanStore, IndexedReader)):
+        yield from run.spectra(ms_level)
+    else:  # pymzml decodes arrays on the first access
+        for number, scan in enumerate(run):
+            if scan.ms_level == ms_level:
+                yield number, scan
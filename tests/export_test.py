@@ -0,0 +1,66 @@
+import os
+import tempfile
+import unittest
+import torch
+
+from models.rcnn import RecurrentCNN
+from models.cnn_classifier import Classifier
+from models.cnn_segmentator import Segmentator
+from models.export import export_model, scripted_path
+from models.registry import ModelRegistry, is_scripted
+
+
+class ExportTestCase(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.directory = tempfile.TemporaryDirectory()
+        self.registry = ModelRegistry()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def export(self, model):
+        weights = os.path.join(self.directory.name, model.__class__.__name__ + '.pt')
+        torch.save(model.state_dict(), weights)
+        path = export_model(model.__class__.__name__, weights)
+        self.assertEqual(path, scripted_path(weights))
+        self.assertTrue(is_scripted(path))
+        self.assertFalse(is_scripted(weights))
+        return path
+
+    def check_outputs(self, expected, outputs):
+        for expected_output, output in zip(expected, outputs):
+            if expected_output is None:
+                self.assertIsNone(output)
+            else:
+                self.assertTrue(torch.allclose(expected_output, output, atol=1e-5))
+
+    def test_cnn(self):
+        signal = torch.rand(8, 1, 256) * 100
+        for model in [Classifier(), Segmentator()]:
+            model.eval()
+            scripted = self.registry.get(model.__class__.__name__, self.export(model), 'cpu')
+            with torch.no_grad():
+                # normalization is folded in
+                self.check_outputs(model(signal / torch.max(signal, dim=2, keepdim=True)[0]), scripted(signal))
+
+    def test_recurrent(self):
+        model = RecurrentCNN().eval()
+        scripted = self.registry.get('RecurrentCNN', self.export(model), 'cpu')
+        signal = torch.rand(3, 1, 40)
+        lengths = torch.tensor([40, 20, 7])
+        for k, length in enumerate(lengths):
+            signal[k, :, length:] = 0
+        signal = signal / torch.max(signal, dim=2, keepdim=True)[0]
+        with torch.no_grad():
+            self.check_outputs(model(signal), scripted(signal))
+            self.check_outputs(model(signal, lengths), scripted(signal, lengths))
+
+    def test_wrong_architecture(self):
+        path = self.export(Classifier())
+        with self.assertRaises(ValueError):
+            self.registry.get('Segmentator', path, 'cpu')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+import torch
+
+from models.cnn_segmentator import preprocessing, Segmentator
+
+
+def loop_preprocessing(batch):
+    # the original implementation
+    batch_size, _, n_points = batch.shape
+    processed_batch = batch.clone().view(batch_size, n_points)
+    for x in processed_batch:
+        x[x < 1e-4] = 0
+        pos = (x != 0)
+        x[pos] = torch.log10(x[pos])
+        x[pos] = x[pos] - torch.min(x[pos])
+        x[pos] = x[pos] / torch.max(x[pos])
+    return processed_batch.view(batch_size, 1, n_points)
+
+
+class PreprocessingTestCase(unittest.TestCase):
+    def test_equivalence(self):
+        torch.manual_seed(0)
+        batch = torch.rand(64, 1, 256) ** 4  # a lot of points below 1e-4
+        batch[:, :, :10] = 0  # padding
+        batch[3, :, 100:] = -1.
+        original = batch.clone()
+        self.assertTrue(torch.equal(preprocessing(batch), loop_preprocessing(batch)))
+        self.assertTrue(torch.equal(batch, original))  # input isn't changed
+
+    def test_empty_signal(self):
+        batch = torch.zeros(2, 1, 10)
+        batch[1, 0, 3:7] = torch.tensor([1., 10., 100., 1.])
+        processed = preprocessing(batch)
+        self.assertFalse(torch.any(processed[0]))
+        self.assertEqual(processed[1, 0, 3:7].tolist(), [0., 0.5, 1., 0.])
+
+
+class FusionTestCase(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.model = Segmentator()
+        with torch.no_grad():  # BatchNorm layers aren't identities
+            for module in self.model.modules():
+                if isinstance(module, torch.nn.BatchNorm1d):
+                    module.running_mean.uniform_(-1, 1)
+                    module.running_var.uniform_(0.5, 2)
+                    module.weight.uniform_(0.5, 2)
+                    module.bias.uniform_(-1, 1)
+        self.model.eval()
+
+    def test_equivalence(self):
+        fused = self.model.fused()
+        self.assertTrue(fused.is_fused)
+        self.assertFalse(self.model.is_fused)  # the original model isn't changed
+        self.assertIs(fused.fused(), fused)
+        signal = torch.rand(8, 1, 256)
+        with torch.no_grad():
+            _, expected = self.model(signal)
+            _, output = fused(signal)
+        self.assertTrue(torch.allclose(expected, output, atol=1e-4))
+
+    def test_training_model(self):
+        self.model.train()
+        fused = self.model.fused()
+        self.assertFalse(fused.training)
+        self.assertTrue(self.model.training)
+
+
+if __name__ == '__main__':
+    unittest.main()
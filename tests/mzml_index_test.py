@@ -0,0 +1,122 @@
+import os
+import zlib
+import base64
+import tempfile
+import unittest
+from unittest import mock
+import pymzml
+import numpy as np
+
+from processing_utils.roi import construct_tic
+from processing_utils import mzml_index
+from processing_utils.mzml_index import IndexedReader, read_tic
+from processing_utils.scan_store import ScanStore, iter_spectra
+from mzml_utils import generate_scans, write_mzml
+
+
+class ReadTICTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'test.mzML')
+        self.scans = generate_scans(n_scans=60, ms2_every=3, seed=1)
+        ms1 = [(rt, np.sum(np.asarray(i, dtype=np.float32), dtype=np.float64))
+               for level, _, i, rt in self.scans if level == 1]
+        self.time, self.tic = map(np.array, zip(*ms1))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_header_tic(self):
+        write_mzml(self.path, self.scans)
+        time, tic, t_measure = read_tic(self.path)
+        self.assertEqual(t_measure, 'second')
+        np.testing.assert_array_equal(time, self.time)
+        np.testing.assert_allclose(tic, self.tic, rtol=1e-6)
+
+    def test_summed_tic(self):
+        write_mzml(self.path, self.scans, tic=False)
+        time, tic, _ = read_tic(self.path)
+        np.testing.assert_array_equal(time, self.time)
+        np.testing.assert_allclose(tic, self.tic, rtol=1e-6)
+
+    def test_not_indexed(self):
+        write_mzml(self.path, self.scans, indexed=False)
+        self.assertIsNone(read_tic(self.path))
+        # construct_tic falls back to reading of all spectra
+        result = construct_tic(self.path, 'tic')
+        np.testing.assert_allclose(result['x'], self.time / 60)
+        np.testing.assert_allclose(result['y'], self.tic, rtol=1e-6)
+
+
+class IndexedReaderTestCase(unittest.TestCase):
+    def test_same_spectra(self):
+        scans = generate_scans(n_scans=50, ms2_every=3, seed=4)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'test.mzML')
+            write_mzml(path, scans)
+            expected = list(pymzml.run.Reader(path))
+            for n_threads, prefetch in [(1, 1), (3, 2), (None, None)]:
+                reader = IndexedReader.open(path, n_threads, prefetch)
+                self.assertEqual(reader.get_spectrum_count(), len(scans))
+                spectra = list(reader)
+                self.assertEqual(len(spectra), len(expected))
+                for spectrum, scan in zip(spectra, expected):
+                    self.assertEqual(spectrum.ms_level, scan.ms_level)
+                    self.assertEqual(spectrum.scan_time, scan.scan_time)
+                    self.assertEqual(spectrum.TIC, scan.TIC)
+                    self.assertEqual(spectrum.mz.dtype, scan.mz.dtype)
+                    self.assertEqual(spectrum.i.dtype, scan.i.dtype)
+                    np.testing.assert_array_equal(spectrum.mz, scan.mz)
+                    np.testing.assert_array_equal(spectrum.i, scan.i)
+
+    def test_not_indexed(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'test.mzML')
+            write_mzml(path, generate_scans(n_scans=5), indexed=False)
+            self.assertIsNone(IndexedReader.open(path))
+
+    def test_ms_level_filter(self):
+        scans = generate_scans(n_scans=30, ms2_every=2, seed=4)
+        ms1 = [number for number, (level, _, _, _) in enumerate(scans) if level == 1]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'test.mzML')
+            write_mzml(path, scans)
+            reader = IndexedReader.open(path)
+            with mock.patch.object(mzml_index, 'parse_spectrum', wraps=mzml_index.parse_spectrum) as parse:
+                spectra = list(iter_spectra(reader, 1))
+            # MS2 spectra are skipped before decoding
+            self.assertEqual(parse.call_count, len(ms1))
+            self.assertEqual([number for number, _ in spectra], ms1)
+            self.assertTrue(all(spectrum.ms_level == 1 for _, spectrum in spectra))
+            self.assertEqual([number for number, _ in iter_spectra(pymzml.run.Reader(path), 1)], ms1)
+            self.assertEqual([number for number, _ in iter_spectra(ScanStore.build(path), 1)], ms1)
+
+
+class DecodeArrayTestCase(unittest.TestCase):
+    @staticmethod
+    def encode(array, compressed=True):
+        binary = array.tobytes()
+        return base64.b64encode(zlib.compress(binary) if compressed else binary)
+
+    def test_dtypes(self):
+        values = np.arange(5)
+        for accession, dtype in [(b'MS:1000521', '<f4'), (b'MS:1000523', '<f8'),
+                                 (b'MS:1000519', '<i4'), (b'MS:1000522', '<i8')]:
+            for compression, compressed in [(b'MS:1000574', True), (b'MS:1000576', False)]:
+                array = mzml_index._decode_array(accession + b' ' + compression,
+                                                 self.encode(values.astype(dtype), compressed))
+                self.assertEqual(array.dtype, np.dtype(dtype))
+                np.testing.assert_array_equal(array, values)
+
+    def test_unsupported(self):
+        binary = self.encode(np.arange(5, dtype='<f4'))
+        with self.assertRaises(ValueError):
+            mzml_index._decode_array(b'MS:1000574', binary)  # no data type
+        with self.assertRaises(ValueError):
+            mzml_index._decode_array(b'MS:1000520 MS:1000574', binary)  # 16-bit float
+        with self.assertRaises(ValueError):
+            mzml_index._decode_array(b'MS:1000521 MS:1002312', binary)  # numpress
+
+
+if __name__ == '__main__':
+    unittest.main()
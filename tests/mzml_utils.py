@@ -0,0 +1,91 @@
+import base64
+import zlib
+import numpy as np
+
+
+def _encode(array, dtype):
+    return base64.b64encode(zlib.compress(np.asarray(array, dtype=dtype).tobytes())).decode()
+
+
+def _binary_array(array, dtype, name, accession):
+    precision = '64-bit float' if dtype == '<f8' else '32-bit float'
+    precision_accession = 'MS:1000523' if dtype == '<f8' else 'MS:1000521'
+    return ('<binaryDataArray encodedLength="0">'
+            f'<cvParam cvRef="MS" accession="{precision_accession}" name="{precision}" value=""/>'
+            '<cvParam cvRef="MS" accession="MS:1000574" name="zlib compression" value=""/>'
+            f'<cvParam cvRef="MS" accession="{accession}" name="{name}" value=""/>'
+            f'<binary>{_encode(array, dtype)}</binary></binaryDataArray>')
+
+
+def write_mzml(path, scans, tic=True, indexed=True):
+    """
+    Write a minimal indexed *.mzML file
+    :param path: path to *.mzML file
+    :param scans: a list of (ms_level, mz, i, rt) tuples, rt in seconds
+    :param tic: write 'total ion current' parameter of spectra
+    :param indexed: write an index of spectra
+    """
+    head = ('<?xml version="1.0" encoding="utf-8"?>\n'
+            + ('<indexedmzML xmlns="http://psi.hupo.org/ms/mzml">\n' if indexed else '') +
+            '<mzML xmlns="http://psi.hupo.org/ms/mzml" version="1.1.0">\n'
+            '<cvList count="2"><cv id="MS" fullName="PSI-MS" URI="https://psi.hupo.org/ms"/>'
+            '<cv id="UO" fullName="Unit Ontology" URI="https://obo.org/uo"/></cvList>\n'
+            f'<run id="run"><spectrumList count="{len(scans)}" defaultDataProcessingRef="dp">\n')
+    chunks = [head.encode()]
+    offset = len(chunks[0])
+    offsets = []
+    for n, (ms_level, mz, i, rt) in enumerate(scans):
+        spectrum = (f'<spectrum index="{n}" id="scan={n + 1}" defaultArrayLength="{len(mz)}">'
+                    f'<cvParam cvRef="MS" accession="MS:1000511" name="ms level" value="{ms_level}"/>'
+                    + (('<cvParam cvRef="MS" accession="MS:1000285" name="total ion current" '
+                        f'value="{float(np.sum(i))}"/>') if tic else '') +
+                    '<scanList count="1"><scan><cvParam cvRef="MS" accession="MS:1000016" name="scan start time" '
+                    f'value="{rt}" unitCvRef="UO" unitAccession="UO:0000010" unitName="second"/></scan></scanList>'
+                    '<binaryDataArrayList count="2">'
+                    + _binary_array(mz, '<f8', 'm/z array', 'MS:1000514')
+                    + _binary_array(i, '<f4', 'intensity array', 'MS:1000515')
+                    + '</binaryDataArrayList></spectrum>\n').encode()
+        offsets.append((n + 1, offset))
+        chunks.append(spectrum)
+        offset += len(spectrum)
+    tail = '</spectrumList></run>\n</mzML>\n'.encode()
+    chunks.append(tail)
+    offset += len(tail)
+    index = ('<indexList count="1"><index name="spectrum">'
+             + ''.join(f'<offset idRef="scan={n}">{o}</offset>' for n, o in offsets)
+             + f'</index></indexList>\n<indexListOffset>{offset}</indexListOffset>\n'
+             '</indexedmzML>\n')
+    if indexed:
+        chunks.append(index.encode())
+    with open(path, 'wb') as f:
+        f.write(b''.join(chunks))
+
+
+def generate_scans(n_scans=120, n_ions=60, noise=150, ms2_every=0, seed=0):
+    """
+    Generate a synthetic LC-MS run: ions with chromatographic peaks and m/z jitter plus random noise
+    :return: a list of (ms_level, mz, i, rt) tuples
+    """
+    rng = np.random.RandomState(seed)
+    ion_mz = rng.uniform(100, 1000, n_ions)
+    # a few ions close to each other (within one m/z window)
+    ion_mz[:n_ions // 6] = ion_mz[n_ions // 6:2 * (n_ions // 6)] + rng.uniform(-0.004, 0.004, n_ions // 6)
+    ion_apex = rng.uniform(0, n_scans, n_ions)
+    ion_width = rng.uniform(3, 15, n_ions)
+    ion_height = rng.lognormal(10, 1, n_ions)
+    scans = []
+    for number in range(n_scans):
+        rt = 0.5 * number
+        profile = ion_height * np.exp(-(number - ion_apex) ** 2 / (2 * ion_width ** 2))
+        present = (profile > 50) & (rng.uniform(size=n_ions) > 0.1)
+        mz = np.concatenate((ion_mz[present] + rng.normal(0, 0.0015, present.sum()),
+                             rng.uniform(100, 1000, noise),
+                             np.round(rng.uniform(100, 1000, 5), 1)))
+        i = np.concatenate((profile[present], rng.uniform(0, 300, noise), rng.uniform(0, 300, 5)))
+        i[rng.uniform(size=len(i)) < 0.02] = 0
+        order = np.argsort(mz, kind='stable')
+        scans.append((1, mz[order], i[order].astype(np.float32), rt))
+        if ms2_every and number % ms2_every == 0:
+            mz2 = np.sort(rng.uniform(50, 500, 40))
+            scans.append((2, mz2, rng.uniform(0, 1e3, 40).astype(np.float32), rt + 0.1))
+    return scans
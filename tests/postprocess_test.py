@@ -0,0 +1,62 @@
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+import numpy as np
+
+from processing_utils.postprocess import ResultTable
+from processing_utils.scan_store import ScanStore
+from mzml_utils import generate_scans, write_mzml
+
+
+def reference_fill(scans, mz, rtmin, rtmax, delta_mz):
+    ms1 = [(scan_mz, scan_i.astype(np.float32), rt) for level, scan_mz, scan_i, rt in scans if level == 1]
+    rt = np.array([scan_rt for _, _, scan_rt in ms1])
+    begin = max(np.searchsorted(rt, rtmin, side='left') - 1, 0)
+    end = np.searchsorted(rt, rtmax, side='right') + 1
+    intensity = 0
+    for scan_mz, scan_i, _ in ms1[begin:end]:
+        pos = np.searchsorted(scan_mz, mz)
+        if pos < len(scan_mz) and mz - delta_mz < scan_mz[pos] < mz + delta_mz:
+            intensity += scan_i[pos]
+        if pos >= 1 and mz - delta_mz < scan_mz[pos - 1] < mz + delta_mz:
+            intensity += scan_i[pos - 1]
+    return intensity
+
+
+class FillZerosTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.scans = generate_scans(n_scans=80, ms2_every=3, seed=11)
+        rng = np.random.RandomState(0)
+        ms1_mz = np.concatenate([mz for level, mz, _, _ in self.scans if level == 1])
+        mz = np.concatenate((rng.choice(ms1_mz, 30), rng.uniform(100, 1000, 10)))
+        rtmin = rng.uniform(-5, 40, len(mz))
+        rtmax = rtmin + rng.uniform(0, 10, len(mz))
+        self.features = [SimpleNamespace(mz=m, rtmin=a, rtmax=b, samples=['other'], intensities=[1.])
+                         for m, a, b in zip(mz, rtmin, rtmax)]
+        self.expected = [reference_fill(self.scans, m, a, b, 0.005) for m, a, b in zip(mz, rtmin, rtmax)]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def fill(self, path):
+        table = ResultTable([path, 'other'], self.features)
+        table.fill_zeros(0.005)
+        return table.intensities[0]
+
+    def test_indexed(self):
+        path = os.path.join(self.directory.name, 'test.mzML')
+        write_mzml(path, self.scans)
+        np.testing.assert_allclose(self.fill(path), self.expected, rtol=1e-6)
+        ScanStore.build(path)
+        np.testing.assert_allclose(self.fill(path), self.expected, rtol=1e-6)
+
+    def test_not_indexed(self):
+        path = os.path.join(self.directory.name, 'test.mzML')
+        write_mzml(path, self.scans, indexed=False)
+        np.testing.assert_allclose(self.fill(path), self.expected, rtol=1e-6)
+
+
+if __name__ == '__main__':
+    unittest.main()
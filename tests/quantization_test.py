@@ -0,0 +1,87 @@
+import unittest
+import numpy as np
+import torch
+
+from models.rcnn import RecurrentCNN
+from models.cnn_classifier import Classifier
+from models.cnn_segmentator import Segmentator
+from models.quantization import quantize_model
+from processing_utils.roi import ROI
+from processing_utils.runner import BasicRunner
+
+
+class QuantizationTestCase(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.signal = torch.rand(16, 1, 256) ** 2
+        self.signal = self.signal / torch.max(self.signal, dim=2, keepdim=True)[0]
+
+    def check_outputs(self, model, calibration=None):
+        model.eval()
+        quantized = quantize_model(model, calibration)
+        with torch.no_grad():
+            expected = model(self.signal)
+            outputs = quantized(self.signal)
+        for expected_output, output in zip(expected, outputs):
+            if expected_output is None:
+                self.assertIsNone(output)
+            else:
+                scale = expected_output.abs().max()
+                self.assertLess((expected_output - output).abs().max(), 0.05 * scale)
+        return quantized
+
+    def test_dynamic(self):
+        for model in [RecurrentCNN(), Classifier(), Segmentator()]:
+            quantized = self.check_outputs(model)
+            self.assertFalse(any(type(m) in (torch.nn.Linear, torch.nn.LSTM)
+                                 for m in quantized.modules()))
+
+    def test_static(self):
+        for model in [Classifier(), Segmentator()]:
+            quantized = self.check_outputs(model, self.signal)
+            self.assertFalse(any(type(m) is torch.nn.Conv1d for m in quantized.modules()))
+            # the original model is not changed
+            self.assertTrue(any(type(m) is torch.nn.Conv1d for m in model.modules()))
+
+    def test_engine(self):
+        engine = torch.backends.quantized.engine
+        backend = next(backend for backend in ['qnnpack', 'fbgemm', 'x86']
+                       if backend in torch.backends.quantized.supported_engines and backend != engine)
+        model = Classifier().eval()
+        quantized = quantize_model(model, self.signal, backend)
+        # the global engine is restored, the model quantized for the other backend still works
+        self.assertEqual(torch.backends.quantized.engine, engine)
+        with torch.no_grad():
+            self.assertEqual(quantized(self.signal)[0].shape, model(self.signal)[0].shape)
+
+    def test_scripted(self):
+        with self.assertRaises(ValueError):
+            quantize_model(torch.jit.script(Classifier().eval()))
+
+
+class QuantizedRunnerTestCase(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.rois = []
+        for length in [20, 35, 64, 12]:
+            i = rng.uniform(0, 100, length)
+            self.rois.append(ROI([0, length - 1], [0., length - 1.], i, [100.] * length, 100.))
+
+    def test_runner(self):
+        models = [Classifier().eval(), Segmentator().eval()]
+        runner = BasicRunner('sequential', models, 5, 'cpu', quantization='static', calibration=self.rois)
+        self.assertIsNot(runner.classifier, models[0])
+        self.assertEqual(len(runner.predict_borders(self.rois)), len(self.rois))
+        runner = BasicRunner('all in one', [RecurrentCNN().eval()], 5, 'cpu', quantization='dynamic')
+        self.assertEqual(len(runner.predict_borders(self.rois)), len(self.rois))
+
+    def test_errors(self):
+        models = [Classifier().eval(), Segmentator().eval()]
+        with self.assertRaises(ValueError):
+            BasicRunner('sequential', models, 5, 'cpu', quantization='static')
+        with self.assertRaises(ValueError):
+            BasicRunner('sequential', models, 5, 'cpu', quantization='float16')
+
+
+if __name__ == '__main__':
+    unittest.main()
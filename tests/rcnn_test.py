@@ -0,0 +1,60 @@
+import unittest
+import numpy as np
+import torch
+
+from models.rcnn import RecurrentCNN
+from training_utils.dataset import BucketLoader
+from training_utils.training import CombinedLoss
+
+
+def make_item(length, label=1):
+    x = torch.rand(1, length) + 0.01
+    integration_mask = (torch.arange(length) > length // 3).float()
+    intersection_mask = torch.zeros(length)
+    return x / torch.max(x), torch.tensor(label), integration_mask, intersection_mask
+
+
+class PaddedBatchTestCase(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        np.random.seed(0)
+        self.model = RecurrentCNN().eval()
+        self.items = [make_item(length, k % 2) for k, length in enumerate([12, 40, 25, 40, 7, 33, 18])]
+
+    def test_padding_doesnt_change_outputs(self):
+        x, _, _, _, lengths = next(iter(BucketLoader(self.items, batch_size=len(self.items))))
+        with torch.no_grad():
+            classifier_output, integrator_output = self.model(x, lengths)
+            for k, length in enumerate(lengths):
+                # items are sorted by length
+                expected_classifier, expected_integrator = self.model(x[k:k + 1, :, :length])
+                self.assertTrue(torch.allclose(classifier_output[k], expected_classifier[0], atol=1e-6))
+                self.assertTrue(torch.allclose(integrator_output[k, :, :length], expected_integrator[0], atol=1e-6))
+
+    def test_bucket_loader(self):
+        loader = BucketLoader(self.items, batch_size=3, shuffle=True, pool_size=2)
+        batches = list(loader)
+        self.assertEqual(len(batches), len(loader))
+        self.assertEqual(sorted(int(length) for batch in batches for length in batch[4]),
+                         sorted(item[0].shape[-1] for item in self.items))
+        for x, y, integration_mask, intersection_mask, lengths in batches:
+            self.assertEqual(x.shape, (len(lengths), 1, max(lengths)))
+            self.assertEqual(integration_mask.shape, (len(lengths), max(lengths)))
+            for k, length in enumerate(lengths):
+                self.assertEqual(float(x[k, 0, length:].abs().sum()), 0.)
+
+    def test_masked_loss(self):
+        criterion = CombinedLoss([0.4, 0.2])
+        _, _, integration_mask, _, lengths = next(iter(BucketLoader(self.items[:2], batch_size=2)))
+        output = torch.randn(integration_mask.shape)
+        mask = (torch.arange(integration_mask.shape[1]) < lengths.view(-1, 1)).float()
+        output[0, lengths[0]:] = 10.  # padding is ignored
+        length = int(lengths[0])
+        expected = criterion(output[:1, :length], integration_mask[:1, :length]).item()
+        self.assertAlmostEqual(criterion(output[:1], integration_mask[:1], mask[:1]).item(), expected, places=5)
+        self.assertNotAlmostEqual(criterion(output, integration_mask).item(),
+                                  criterion(output, integration_mask, mask).item(), places=3)
+
+
+if __name__ == '__main__':
+    unittest.main()
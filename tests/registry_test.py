@@ -0,0 +1,51 @@
+import os
+import tempfile
+import unittest
+import torch
+
+from models.cnn_classifier import Classifier
+from models.registry import ModelRegistry
+
+
+class ModelRegistryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'Classifier.pt')
+        torch.save(Classifier().state_dict(), self.path)
+        self.registry = ModelRegistry()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_models_are_reused(self):
+        model = self.registry.get('Classifier', self.path, 'cpu')
+        self.assertFalse(model.training)
+        self.assertIs(self.registry.get('Classifier', self.path, torch.device('cpu')), model)
+        self.assertEqual(len(self.registry), 1)
+
+    def test_changed_weights_are_reloaded(self):
+        model = self.registry.get('Classifier', self.path, 'cpu')
+        weights = Classifier().state_dict()
+        torch.save(weights, self.path)
+        stat = os.stat(self.path)
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        reloaded = self.registry.get('Classifier', self.path, 'cpu')
+        self.assertIsNot(reloaded, model)
+        self.assertEqual(len(self.registry), 1)  # the old model is dropped
+        for name, value in reloaded.state_dict().items():
+            self.assertTrue(torch.equal(value, weights[name]))
+
+    def test_evict(self):
+        model = self.registry.get('Classifier', self.path, 'cpu')
+        self.assertEqual(self.registry.evict('Segmentator'), 0)
+        self.assertEqual(self.registry.evict(path=self.path), 1)
+        self.assertEqual(len(self.registry), 0)
+        self.assertIsNot(self.registry.get('Classifier', self.path, 'cpu'), model)
+
+    def test_unknown_architecture(self):
+        with self.assertRaises(ValueError):
+            self.registry.get('Unknown', self.path, 'cpu')
+
+
+if __name__ == '__main__':
+    unittest.main()
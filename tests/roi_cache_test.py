@@ -0,0 +1,88 @@
+import os
+import time
+import tempfile
+import unittest
+import numpy as np
+
+from processing_utils.roi import get_ROIs
+from processing_utils.roi_cache import ROICache, file_fingerprint, implementation_name
+from mzml_utils import generate_scans, write_mzml
+
+
+class CountingDetector:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, *args, **kwargs):
+        self.calls += 1
+        return get_ROIs(*args, **kwargs)
+
+
+class ROICacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'test.mzML')
+        write_mzml(self.path, generate_scans(n_scans=60, seed=3))
+        self.cache = ROICache(os.path.join(self.directory.name, 'cache'))
+        self.detector = CountingDetector()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_hit(self):
+        rois = self.cache.detect(self.detector, self.path, 0.005, 5, 2)
+        cached = self.cache.detect(self.detector, self.path, 0.005, 5, 2)
+        self.assertEqual(self.detector.calls, 1)
+        self.assertFalse(cached.i.flags.writeable)  # memory-mapped in read-only mode
+        self.assertEqual(len(cached), len(rois))
+        for column in cached.columns:
+            np.testing.assert_array_equal(getattr(cached, column), getattr(rois, column))
+
+    def test_invalidation(self):
+        self.cache.detect(self.detector, self.path, 0.005, 5, 2)
+        self.cache.detect(self.detector, self.path, 0.005, 5, 3)
+        self.assertEqual(self.detector.calls, 2)
+        name = implementation_name(self.detector)
+        self.assertIsNotNone(self.cache.load(self.path, 0.005, 5, 2, name))
+        self.assertIsNone(self.cache.load(self.path, 0.01, 5, 2, name))
+        # the same file with a new content
+        write_mzml(self.path, generate_scans(n_scans=60, seed=4))
+        self.assertIsNone(self.cache.load(self.path, 0.005, 5, 2, name))
+
+    def test_implementations(self):
+        # ROIs of another implementation (e.g. Cython get_ROIs) aren't returned
+        self.cache.detect(self.detector, self.path, 0.005, 5, 2)
+        rois = self.cache.detect(get_ROIs, self.path, 0.005, 5, 2)
+        self.assertEqual(self.detector.calls, 1)
+        self.assertIsNotNone(self.cache.load(self.path, 0.005, 5, 2, implementation_name(get_ROIs)))
+        self.assertEqual(implementation_name(get_ROIs), 'processing_utils.roi.get_ROIs')
+        self.assertGreater(len(rois), 0)
+
+    def test_eviction(self):
+        rois = self.cache.detect(self.detector, self.path, 0.005, 5, 2)
+        name = implementation_name(self.detector)
+        self.cache.max_size = int(1.5 * rois.nbytes) + 1024
+        for dropped_points, mtime in zip([2, 1, 3], [100, 200, 300]):
+            self.cache.detect(self.detector, self.path, 0.005, 5, dropped_points)
+            entry = os.path.join(self.cache.folder, self.cache.key(self.path, 0.005, 5, dropped_points, name))
+            os.utime(entry, (time.time() - 1000 + mtime,) * 2)
+        # the least recently used entry (dropped_points=2) is removed
+        self.assertIsNone(self.cache.load(self.path, 0.005, 5, 2, name))
+        self.assertIsNotNone(self.cache.load(self.path, 0.005, 5, 3, name))
+
+
+class FingerprintTestCase(unittest.TestCase):
+    def test_head_and_tail(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'file')
+            fingerprints = []
+            for content in [b'a' * 100, b'a' * 99 + b'b', b'b' + b'a' * 99]:
+                with open(path, 'wb') as file:
+                    file.write(content)
+                os.utime(path, ns=(0, 0))  # the same size and modification time
+                fingerprints.append(file_fingerprint(path, sample_size=10))
+            self.assertEqual(len(set(fingerprints)), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
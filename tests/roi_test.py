@@ -0,0 +1,371 @@
+import os
+import bisect
+import tempfile
+import unittest
+import numpy as np
+
+from processing_utils.roi import ROI, ROIBatch, ROIDetector, get_ROIs, get_ROIs_parallel, get_closest, construct_eics
+from mzml_utils import generate_scans, write_mzml
+try:
+    from cython_utils.roi import get_ROIs as cython_get_ROIs
+except ImportError:
+    cython_get_ROIs = None
+
+
+class _SortedMap:
+    """
+    Minimal replacement of bintrees.FastAVLTree used by the reference implementation
+    """
+    def __init__(self):
+        self.keys = []
+        self.values = {}
+
+    def __setitem__(self, key, value):
+        if key not in self.values:
+            bisect.insort(self.keys, key)
+        self.values[key] = value
+
+    def ceiling_item(self, key):
+        k = self.keys[bisect.bisect_left(self.keys, key)]
+        return k, self.values[k]
+
+    def floor_item(self, key):
+        k = self.keys[bisect.bisect_right(self.keys, key) - 1]
+        return k, self.values[k]
+
+    def items(self):
+        return [(k, self.values[k]) for k in self.keys]
+
+    def remove_items(self, keys):
+        for k in keys:
+            del self.values[k]
+        self.keys = [k for k in self.keys if k in self.values]
+
+    def min_item(self):
+        if not self.keys:
+            raise ValueError
+        return self.keys[0], self.values[self.keys[0]]
+
+    def max_item(self):
+        if not self.keys:
+            raise ValueError
+        return self.keys[-1], self.values[self.keys[-1]]
+
+
+def _process_roi(number, time, i, mz):
+    roi = ROI([number, number], [time, time], [i], [mz], mz)
+    roi.points = 1
+    return roi
+
+
+def reference_get_ROIs(scans, delta_mz=0.005, required_points=15, dropped_points=3):
+    """
+    Point-by-point ROI detection (the original algorithm)
+    """
+    ROIs = []
+    process_ROIs = _SortedMap()
+    number = 1
+    init_mz, init_i, start_time = scans[0]
+    min_mz, max_mz = float('inf'), 0
+    for mz, i in zip(init_mz, init_i):
+        if i != 0:
+            process_ROIs[mz] = _process_roi(1, start_time, i, mz)
+            min_mz = min(min_mz, mz)
+            max_mz = max(max_mz, mz)
+
+    for scan_mz, scan_i, time in scans[1:]:
+        number += 1
+        for n, mz in enumerate(scan_mz):
+            if scan_i[n] == 0:
+                continue
+            ceiling_mz, ceiling_item = None, None
+            floor_mz, floor_item = None, None
+            if mz < max_mz:
+                _, ceiling_item = process_ROIs.ceiling_item(mz)
+                ceiling_mz = ceiling_item.mzmean
+            if mz > min_mz:
+                _, floor_item = process_ROIs.floor_item(mz)
+                floor_mz = floor_item.mzmean
+            if ceiling_mz is None and floor_mz is None:
+                process_ROIs[mz] = _process_roi(number, time, scan_i[n], mz)
+                continue
+            elif ceiling_mz is None:
+                closest_item = floor_item
+            elif floor_mz is None:
+                closest_item = ceiling_item
+            else:
+                closest_item = floor_item if ceiling_mz - mz > mz - floor_mz else ceiling_item
+
+            if abs(closest_item.mzmean - mz) < delta_mz:
+                roi = closest_item
+                if roi.scan[1] == number:
+                    roi.mzmean = (roi.mzmean * roi.points + mz) / (roi.points + 1)
+                    roi.points += 1
+                    roi.mz[-1] = (roi.i[-1] * roi.mz[-1] + scan_i[n] * mz) / (roi.i[-1] + scan_i[n])
+                    roi.i[-1] = (roi.i[-1] + scan_i[n])
+                else:
+                    roi.mzmean = (roi.mzmean * roi.points + mz) / (roi.points + 1)
+                    roi.points += 1
+                    roi.mz.append(mz)
+                    roi.i.append(scan_i[n])
+                    roi.scan[1] = number
+                    roi.rt[1] = time
+            else:
+                process_ROIs[mz] = _process_roi(number, time, scan_i[n], mz)
+        to_delete = []
+        for mz, roi in process_ROIs.items():
+            if roi.scan[1] < number <= roi.scan[1] + dropped_points:
+                roi.mz.append(roi.mzmean)
+                roi.i.append(0)
+            elif roi.scan[1] != number:
+                to_delete.append(mz)
+                if roi.points >= required_points:
+                    ROIs.append(roi)
+        process_ROIs.remove_items(to_delete)
+        try:
+            min_mz, _ = process_ROIs.min_item()
+            max_mz, _ = process_ROIs.max_item()
+        except ValueError:
+            min_mz, max_mz = float('inf'), 0
+    number += 1
+    for mz, roi in process_ROIs.items():
+        if roi.points >= required_points:
+            for n in range(dropped_points - (number - 1 - roi.scan[1])):
+                roi.mz.append(roi.mzmean)
+                roi.i.append(0)
+            ROIs.append(roi)
+    for roi in ROIs:
+        for n in range(dropped_points):
+            roi.i.insert(0, 0)
+            roi.mz.insert(0, roi.mzmean)
+        roi.scan = (roi.scan[0] - dropped_points, roi.scan[1] + dropped_points)
+    return ROIs
+
+
+def detect(scans, *args):
+    detector = ROIDetector(*args)
+    for mz, i, rt in scans:
+        detector.process_scan(mz, i, rt)
+    return detector.finish()
+
+
+class ROIDetectionTestCase(unittest.TestCase):
+    def assertSameROIs(self, expected, actual):
+        self.assertEqual(len(expected), len(actual))
+        for roi1, roi2 in zip(expected, actual):
+            self.assertEqual(tuple(roi1.scan), tuple(roi2.scan))
+            self.assertEqual(list(roi1.rt), list(roi2.rt))
+            self.assertEqual(roi1.mzmean, roi2.mzmean)
+            # ROIBatch stores points as float32
+            np.testing.assert_array_equal(np.asarray(roi1.i, dtype=np.float32), np.asarray(roi2.i, dtype=np.float32))
+            np.testing.assert_array_equal(np.asarray(roi1.mz, dtype=np.float32),
+                                          np.asarray(roi2.mz, dtype=np.float32))
+
+    def test_detector_matches_reference(self):
+        for seed in range(3):
+            scans = [(mz, i, rt) for _, mz, i, rt in generate_scans(seed=seed)]
+            for parameters in [(0.005, 15, 3), (0.01, 5, 1), (0.02, 3, 0)]:
+                self.assertSameROIs(reference_get_ROIs(scans, *parameters), detect(scans, *parameters))
+
+    def test_detector_small_collect_size(self):
+        scans = [(mz, i, rt) for _, mz, i, rt in generate_scans(seed=3)]
+        detector = ROIDetector(0.005, 5, 2)
+        detector.collect_size = 100
+        for mz, i, rt in scans:
+            detector.process_scan(mz, i, rt)
+        self.assertSameROIs(reference_get_ROIs(scans, 0.005, 5, 2), detector.finish())
+
+    def test_detector_compaction(self):
+        class Detector(ROIDetector):
+            compact_size = 1  # active ROIs are compacted every few scans
+            compactions = 0
+
+            def _compact(self):
+                self.compactions += 1
+                super()._compact()
+
+        scans = [(mz, i, rt) for _, mz, i, rt in generate_scans(seed=5)]
+        detector = Detector(0.005, 5, 2)
+        for mz, i, rt in scans:
+            detector.process_scan(mz, i, rt)
+        self.assertSameROIs(reference_get_ROIs(scans, 0.005, 5, 2), detector.finish())
+        self.assertGreater(detector.compactions, 1)
+
+    def test_detector_unsorted_scan(self):
+        rng = np.random.RandomState(0)
+        scans = []
+        for _, mz, i, rt in generate_scans(seed=4):
+            order = rng.permutation(len(mz))
+            scans.append((mz[order], i[order], rt))
+        self.assertSameROIs(reference_get_ROIs(scans, 0.005, 5, 2), detect(scans, 0.005, 5, 2))
+
+    def test_detector_key_collision(self):
+        # the first point replaces the active ROI with the same key, the second one extends the new ROI
+        scans = [(np.array([100.021]), np.array([1.]), 0.), (np.array([100.021, 100.026]), np.array([1., 1.]), 1.)]
+        expected = reference_get_ROIs(scans, 0.01, 1, 0)
+        self.assertEqual(len(expected), 1)
+        self.assertEqual(list(expected[0].i), [2.])
+        self.assertSameROIs(expected, detect(scans, 0.01, 1, 0))
+
+    def test_detector_duplicate_key(self):
+        # the first point replaces the active ROI with the same key, the duplicate point extends the new ROI
+        # and the next point is closer to the new ROI than to the other active ones
+        scans = [(np.array([100.01]), np.array([7.]), 0.),
+                 (np.array([100.02, 100.024, 100.026, 100.029, 100.045]), np.array([7., 3., 1., 7., 3.]), 1.),
+                 (np.array([100.01, 100.01, 100.02]), np.array([7., 7., 7.]), 2.)]
+        expected = reference_get_ROIs(scans, 0.01, 1, 0)
+        self.assertEqual([tuple(roi.scan) for roi in expected], [(2, 2), (3, 3)])
+        self.assertEqual(list(expected[1].i), [21.])
+        self.assertSameROIs(expected, detect(scans, 0.01, 1, 0))
+
+    def test_detector_rounded_mz(self):
+        # rounded m/z values: exact collisions with keys and duplicates within scans
+        for seed in range(200):
+            rng = np.random.RandomState(seed)
+            scans = []
+            for rt in range(rng.randint(2, 12)):
+                mz = np.sort(np.round(rng.uniform(100, 100.08, rng.randint(1, 25)), rng.choice([2, 3])))
+                scans.append((mz, rng.choice([0., 1., 2., 5.], len(mz)), float(rt)))
+            for parameters in [(0.01, 1, 0), (0.005, 2, 1), (0.02, 1, 2)]:
+                self.assertSameROIs(reference_get_ROIs(scans, *parameters), detect(scans, *parameters))
+
+    def test_get_ROIs(self):
+        scans = generate_scans(ms2_every=3, seed=5)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'test.mzML')
+            write_mzml(path, scans)
+            rois = get_ROIs(path, 0.005, 10, 3)
+        ms1 = [(mz, i.astype(np.float32), rt) for level, mz, i, rt in scans if level == 1]
+        self.assertSameROIs(reference_get_ROIs(ms1, 0.005, 10, 3), rois)
+
+    def test_get_ROIs_progress(self):
+        class Callback:
+            def __init__(self):
+                self.values = []
+
+            def emit(self, value):
+                self.values.append(value)
+
+        callback = Callback()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'test.mzML')
+            write_mzml(path, generate_scans(n_scans=60, ms2_every=2, seed=8))
+            get_ROIs(path, 0.005, 10, 3, callback)
+        # the progress is based on the number of spectra in the index (MS1 and MS2)
+        self.assertEqual(callback.values, [int(number * 100 / 90) for number in range(0, 90, 10)])
+
+    def test_get_ROIs_parallel(self):
+        scans = generate_scans(n_ions=300, noise=1000, seed=7)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'test.mzML')
+            write_mzml(path, scans)
+            for parameters in [(0.005, 10, 3), (0.02, 3, 1)]:
+                rois = get_ROIs(path, *parameters)
+                for n_jobs in [2, 5]:
+                    self.assertSameROIs(rois, get_ROIs_parallel(path, *parameters, n_jobs=n_jobs))
+
+    def test_get_ROIs_parallel_progress(self):
+        class Callback:
+            def __init__(self):
+                self.values = []
+
+            def emit(self, value):
+                self.values.append(value)
+
+        callback = Callback()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'test.mzML')
+            write_mzml(path, generate_scans(n_scans=60, ms2_every=2, seed=8))
+            get_ROIs_parallel(path, 0.005, 10, 3, n_jobs=2, progress_callback=callback)
+        # the file is read before the slabs are processed
+        self.assertEqual(callback.values, sorted(callback.values))
+        self.assertGreater(len([value for value in callback.values if value <= 50]), 10)
+        self.assertEqual(callback.values[-1], 100)
+
+
+@unittest.skipIf(cython_get_ROIs is None, 'cython_utils.roi is not built')
+class CythonROIDetectionTestCase(unittest.TestCase):
+    def test_empty_map(self):
+        # all ROIs are retired and the same m/z appears again: the new ROI isn't merged with the retired one
+        scans = [(1, [100.], [1.], float(rt)) for rt in range(6)] + [(1, [], [], float(rt)) for rt in range(6, 10)] + \
+                [(1, [100.], [2.], float(rt)) for rt in range(10, 16)]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'file.mzML')
+            write_mzml(path, scans)
+            rois = cython_get_ROIs(path, 0.005, 3, 1)
+        self.assertEqual([tuple(roi.scan) for roi in rois], [(-1, 6), (9, 16)])
+        self.assertEqual(list(rois[0].i), [0.] + [1.] * 6 + [0.])
+        self.assertEqual(list(rois[1].i), [0.] + [2.] * 6 + [0.])
+
+    def test_above_every_key(self):
+        # points above the keys of all active ROIs extend the last ROI (its key is the m/z of the first point)
+        scans = [(1, [100., 200.], [1., 1.], 0.)] + [(1, [100., 200.002], [1., 2.], float(rt)) for rt in range(1, 6)]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'file.mzML')
+            write_mzml(path, scans)
+            rois = cython_get_ROIs(path, 0.005, 3, 1)
+        self.assertEqual([tuple(roi.scan) for roi in rois], [(-1, 6), (-1, 6)])
+        self.assertEqual(list(rois[1].i), [0., 1.] + [2.] * 5 + [0.])
+        self.assertTrue(200. < rois[1].mzmean < 200.002)
+
+
+class ROIBatchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.rois = [ROI((0, 2), [0., 2.], [1., 2., 3.], [100., 100.1, 100.2], 100.1),
+                     ROI((5, 6), [5., 6.], [4., 5.], [200., 200.], 200.),
+                     ROI((1, 4), [1., 4.], [6., 7., 8., 9.], [300., 300., 300., 300.], 300.)]
+        self.batch = ROIBatch.from_rois(self.rois)
+
+    def test_views(self):
+        self.assertEqual(len(self.batch), 3)
+        np.testing.assert_array_equal(self.batch.lengths, [3, 2, 4])
+        roi = self.batch[-1]
+        self.assertEqual(roi.scan, (1, 4))
+        self.assertEqual(roi.rt, [1., 4.])
+        self.assertEqual(roi.mzmean, 300.)
+        np.testing.assert_array_equal(roi.i, [6., 7., 8., 9.])
+        self.assertTrue(np.shares_memory(roi.i, self.batch.i))
+        self.assertEqual(len(list(self.batch)), 3)
+        with self.assertRaises(IndexError):
+            self.batch[3]
+
+    def test_take_and_concatenate(self):
+        subset = self.batch[np.array([2, 0])]
+        np.testing.assert_array_equal(subset.i, [6., 7., 8., 9., 1., 2., 3.])
+        np.testing.assert_array_equal(subset.scan, [[1, 4], [0, 2]])
+        joined = ROIBatch.concatenate([self.batch[:1], ROIBatch.empty(), self.batch[1:]])
+        np.testing.assert_array_equal(joined.offsets, self.batch.offsets)
+        np.testing.assert_array_equal(joined.mz, self.batch.mz)
+        np.testing.assert_array_equal(joined.mzmean, self.batch.mzmean)
+        self.assertEqual(len(ROIBatch.concatenate([])), 0)
+
+    def test_detector_output(self):
+        scans = [(mz, i, rt) for _, mz, i, rt in generate_scans(seed=6)]
+        rois = detect(scans, 0.005, 5, 2)
+        self.assertIsInstance(rois, ROIBatch)
+        self.assertEqual(rois.i.dtype, np.float32)
+        # a few bytes per point: float32 intensity and m/z
+        self.assertLess(rois.nbytes, 10 * len(rois.i) + 50 * len(rois))
+
+
+class EICTestCase(unittest.TestCase):
+    def test_construct_eics(self):
+        scans = generate_scans(n_scans=40, ms2_every=4, seed=9)
+        mzs = np.concatenate((scans[0][1][:20], [50., 2000.], scans[0][1][:3] + 0.003))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'test.mzML')
+            write_mzml(path, scans)
+            eics = construct_eics(path, [str(mz) for mz in mzs], mzs, 0.005)
+        ms1 = [(mz, i.astype(np.float32), rt) for level, mz, i, rt in scans if level == 1]
+        for mz, eic in zip(mzs, eics):
+            expected = []
+            for scan_mz, scan_i, _ in ms1:
+                closest = get_closest(scan_mz, mz, np.searchsorted(scan_mz, mz))
+                expected.append(scan_i[closest] if abs(scan_mz[closest] - mz) < 0.005 else 0)
+            self.assertEqual(eic['label'], str(mz))
+            np.testing.assert_array_equal(eic['y'], expected)
+            np.testing.assert_allclose(eic['x'], [rt / 60 for _, _, rt in ms1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,6 @@
 import unittest
 import numpy as np
+from scipy.interpolate import interp1d
 
 from processing_utils import run_utils
 
@@ -49,5 +50,99 @@ class MyTestCase(unittest.TestCase):
                           [])
 
 
+class PreprocessingTestCase(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.signals = [rng.uniform(1, 100, n) for n in [2, 3, 17, 256, 300, 1000]]
+        self.i = np.concatenate(self.signals)
+        self.offsets = np.cumsum([0] + [len(signal) for signal in self.signals])
+
+    def test_resample(self):
+        # the same as interp1d for every signal
+        resampled = run_utils.resample(self.i, self.offsets, 256)
+        for signal, row in zip(self.signals, resampled):
+            expected = interp1d(np.arange(len(signal)), signal, kind='linear')(np.arange(256) / 255 * (len(signal) - 1))
+            np.testing.assert_allclose(row, expected, rtol=1e-12)
+
+    def test_preprocess_batch(self):
+        batch = run_utils.preprocess_batch(self.i, self.offsets, 'cpu', interpolate=True, length=256).numpy()
+        self.assertEqual(batch.shape, (len(self.signals), 1, 256))
+        self.assertEqual(batch.dtype, np.float32)
+        np.testing.assert_allclose(batch.max(axis=2), 1)
+        # signals are padded with zeros
+        batch = run_utils.preprocess_batch(self.i, self.offsets, 'cpu').numpy()
+        self.assertEqual(batch.shape, (len(self.signals), 1, 1000))
+        for signal, row in zip(self.signals, batch[:, 0, :]):
+            np.testing.assert_allclose(row[:len(signal)], signal / np.max(signal), rtol=1e-6)
+            self.assertFalse(np.any(row[len(signal):]))
+
+
+class BordersTestCase(unittest.TestCase):
+    def test_find_runs(self):
+        domain = np.array([[1, 1, 0, 0, 1, 0, 1],
+                           [0, 0, 0, 0, 0, 0, 0],
+                           [0, 1, 1, 1, 1, 1, 1]], dtype=bool)
+        rows, begins, ends = run_utils.find_runs(domain)
+        self.assertEqual(rows.tolist(), [0, 0, 0, 2])
+        self.assertEqual(begins.tolist(), [0, 4, 6, 1])
+        self.assertEqual(ends.tolist(), [2, 5, 7, 7])
+
+    def test_get_borders(self):
+        integration_mask = np.zeros(30)
+        integration_mask[2:10] = 0.9
+        integration_mask[12:14] = 0.9  # too short peak
+        integration_mask[20:] = 0.9
+        intersection_mask = np.zeros(30)
+        intersection_mask[5] = 0.9  # the first peak is split
+        self.assertEqual(run_utils.get_borders(integration_mask, intersection_mask, peak_minimum_points=2),
+                         [[2, 6], [6, 11], [20, 30]])
+        self.assertEqual(run_utils.get_borders(integration_mask, intersection_mask, peak_minimum_points=2,
+                                               interpolation_factor=2),
+                         [[10, 15]])
+
+    def test_get_borders_batch(self):
+        rng = np.random.RandomState(0)
+        integration_mask = rng.uniform(0, 1, (16, 40)) ** 0.2
+        intersection_mask = rng.uniform(0, 1, (16, 40)) ** 4
+        lengths = rng.randint(1, 41, 16)
+        factors = rng.uniform(0.5, 3, 16)
+        borders = run_utils.get_borders_batch(integration_mask, intersection_mask, peak_minimum_points=1,
+                                              interpolation_factor=factors, lengths=lengths)
+        for k, length in enumerate(lengths):
+            self.assertEqual(borders[k], run_utils.get_borders(integration_mask[k, :length],
+                                                               intersection_mask[k, :length],
+                                                               peak_minimum_points=1,
+                                                               interpolation_factor=factors[k]))
+
+
+class NoiseFilterTestCase(unittest.TestCase):
+    def test_descriptors(self):
+        rng = np.random.RandomState(0)
+        signals = [rng.choice([0., 0., 1., 2., 5.], size=n) for n in rng.randint(1, 30, 100)] + [np.zeros(5)]
+        offsets = np.zeros(len(signals) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(signal) for signal in signals])
+        points, ratio, smoothness = run_utils.roi_descriptors(np.concatenate(signals), offsets)
+        for signal, signal_points, signal_ratio, signal_smoothness in zip(signals, points, ratio, smoothness):
+            nonzero = signal[signal > 0]
+            median = np.median(nonzero) if len(nonzero) else 0
+            smoothed = np.convolve(np.r_[signal[0], signal, signal[-1]], np.ones(3) / 3, 'valid')
+            self.assertEqual(signal_points, len(nonzero))
+            self.assertAlmostEqual(signal_ratio, signal.max() / median if median else 0)
+            self.assertAlmostEqual(signal_smoothness, smoothed.max() / signal.max() if signal.max() else 0)
+
+    def test_noise_mask(self):
+        x = np.arange(40)
+        peak = 100 + 1e4 * np.exp(-(x - 20) ** 2 / 20)
+        flat = 100 + np.arange(40) % 3
+        spike = np.full(40, 100.)
+        spike[20] = 1e4
+        short = np.r_[np.zeros(36), peak[18:22]]
+        signals = [peak, flat, spike, short]
+        offsets = np.arange(len(signals) + 1) * 40
+        noise = run_utils.noise_mask(np.concatenate(signals), offsets, 5, 1.5, 0.4)
+        self.assertEqual(noise.tolist(), [False, True, True, True])
+        self.assertEqual(len(run_utils.noise_mask([], [0], 5, 1.5, 0.4)), 0)
+
+
 if __name__ == '__main__':
     unittest.main()
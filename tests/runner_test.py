@@ -0,0 +1,224 @@
+import os
+import time
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+import torch
+
+from models.rcnn import RecurrentCNN
+from models.cnn_classifier import Classifier
+from models.cnn_segmentator import Segmentator
+from processing_utils.roi import ROI, get_ROIs
+from processing_utils.roi_cache import ROICache
+from processing_utils import runner as runner_module
+from processing_utils.runner import BasicRunner, FilesRunner, prefetch, detect_ROIs
+from mzml_utils import generate_scans, write_mzml
+
+
+class Callback:
+    def __init__(self):
+        self.values = []
+
+    def emit(self, value):
+        self.values.append(value)
+
+
+class FilesRunnerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.files = []
+        for seed in range(3):
+            path = os.path.join(self.directory.name, f'{seed}.mzML')
+            write_mzml(path, generate_scans(n_scans=60, seed=seed))
+            self.files.append(path)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def check_batch(self, runner):
+        progress = Callback()
+        rois = runner._get_ROIs_batch(self.files, progress)
+        self.assertEqual(list(rois), self.files)
+        for file in self.files:
+            expected = runner_module.get_ROIs(file, 0.005, 5, 2)  # the cython one if it is built
+            self.assertEqual(len(rois[file]), len(expected))
+            for roi, expected_roi in zip(rois[file], expected):
+                self.assertEqual(list(roi.i), list(expected_roi.i))
+        self.assertEqual(progress.values, sorted(progress.values))
+        self.assertEqual(progress.values[-1], 100)
+
+    def test_batch_detection(self):
+        self.check_batch(FilesRunner('all in one', [None], 0.005, 5, 2, 8, 'cpu', n_files_jobs=2))
+
+    def test_memory_throttling(self):
+        # files are processed one by one, but all of them are processed
+        self.check_batch(FilesRunner('all in one', [None], 0.005, 5, 2, 8, 'cpu', n_files_jobs=3, memory_limit=1))
+
+    @staticmethod
+    def pipeline_runner(cache=None):
+        def classifier(signal):
+            return torch.eye(2)[torch.ones(len(signal), dtype=torch.int64)], None
+
+        def segmentator(signal):
+            output = -10 * torch.ones((len(signal), 2, signal.shape[2]))
+            output[:, 0, 64:192] = 10
+            return None, output
+
+        runner = FilesRunner('sequential', [classifier, segmentator], 0.005, 5, 2, 1, 'cpu', cache=cache,
+                             batch_size=4)
+        runner.chunk_size = 3  # a few chunks of ROIs
+        return runner
+
+    def check_features(self, runner, features):
+        rois = runner_module.get_ROIs(self.files[0], 0.005, 5, 2)
+        expected = [feature for roi_features in runner.process_rois(rois, [self.files[0]] * len(rois))
+                    for feature in roi_features]
+        self.assertEqual(len(features), len(expected))
+        self.assertGreater(len(features), runner.chunk_size)
+        for feature, expected_feature in zip(features, expected):
+            self.assertEqual(feature.borders, expected_feature.borders)
+            self.assertEqual(list(feature.rois[0].i), list(expected_feature.rois[0].i))
+
+    @mock.patch('processing_utils.runner.get_ROIs', get_ROIs)  # the python implementation is streamed
+    def test_pipeline(self):
+        runner = self.pipeline_runner()
+        progress = Callback()
+        features, _ = runner._single_run(self.files[0], progress)
+        self.check_features(runner, features)
+        self.assertEqual(progress.values[-1], 100)
+
+    @mock.patch('processing_utils.runner.get_ROIs', get_ROIs)
+    def test_pipeline_cache(self):
+        # cache miss is pipelined and fills the cache, the next runs (and detect_ROIs) read ROIs from it
+        cache = ROICache(os.path.join(self.directory.name, 'cache'))
+        runner = self.pipeline_runner(cache)
+        features, _ = runner._single_run(self.files[0])
+        self.check_features(runner, features)
+        self.assertEqual(len(os.listdir(cache.folder)), 1)
+
+        def save(*args):
+            self.fail('ROIs are detected again')
+
+        cache.save = save
+        features, _ = runner._single_run(self.files[0])
+        self.check_features(runner, features)
+        rois = detect_ROIs(self.files[0], 0.005, 5, 2, cache=cache)
+        self.assertEqual(len(rois), len(runner_module.get_ROIs(self.files[0], 0.005, 5, 2)))
+
+    @mock.patch('processing_utils.runner.iter_ROIs', side_effect=AssertionError('ROIs are streamed'))
+    def test_not_streamed(self, _):
+        # other implementations (e.g. the cython one) are used as is
+        with mock.patch('processing_utils.runner.get_ROIs', wraps=get_ROIs) as detection:
+            runner = self.pipeline_runner()
+            features, _ = runner._single_run(self.files[0])
+            detection.assert_called_once()
+            self.check_features(runner, features)
+
+
+class PrefetchTestCase(unittest.TestCase):
+    def test_order(self):
+        self.assertEqual(list(prefetch(iter(range(100)), 2)), list(range(100)))
+
+    def test_exception(self):
+        def failing():
+            yield 1
+            raise ValueError
+
+        with self.assertRaises(ValueError):
+            list(prefetch(failing(), 2))
+
+    def test_backpressure(self):
+        produced = []
+
+        def producer():
+            for k in range(100):
+                produced.append(k)
+                yield k
+
+        items = prefetch(producer(), 2)
+        next(items)
+        time.sleep(0.3)
+        # one item is consumed, two items are in the queue and one is waiting to be put
+        self.assertLessEqual(len(produced), 4)
+        items.close()  # the producer is stopped
+
+
+class BatchPredictionTestCase(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        rng = np.random.RandomState(0)
+        self.rois = []
+        for length in [20, 35, 20, 64, 35, 20, 12, 64, 20, 35]:
+            x = np.arange(length)
+            i = 1e4 * np.exp(-(x - length / 2) ** 2 / length) + rng.uniform(0, 100, length)
+            self.rois.append(ROI([0, length - 1], [0., length - 1.], i, [100.] * length, 100.))
+
+    def check_batches(self, mode, models):
+        with torch.no_grad():  # random models are biased to find peaks
+            for model in models:
+                model.eval()
+                layers = [m for m in model.modules() if isinstance(m, (torch.nn.Linear, torch.nn.Conv1d))]
+                if isinstance(layers[-1], torch.nn.Conv1d) or mode == 'all in one':
+                    layers[-1].weight.mul_(20)
+                    layers[-1].bias.copy_(torch.tensor([2., -2.]))
+                if not isinstance(model, Segmentator):
+                    classification = layers[-2] if mode == 'all in one' else layers[-1]
+                    classification.bias.copy_(torch.tensor([0., 100.]))
+        expected = [BasicRunner(mode, models, 5, 'cpu')(roi, 'sample') for roi in self.rois]
+        progress = Callback()
+        borders = BasicRunner(mode, models, 5, 'cpu', batch_size=4).predict_borders(self.rois, progress)
+        self.assertEqual(progress.values[-1], 100)
+        self.assertTrue(all(borders))
+        for roi, roi_borders, features in zip(self.rois, borders, expected):
+            self.assertEqual([feature.borders[0] for feature in features], list(roi_borders or []))
+
+    def test_all_in_one(self):
+        self.check_batches('all in one', [RecurrentCNN()])
+
+    def test_sequential(self):
+        self.check_batches('sequential', [Classifier(), Segmentator()])
+
+    def test_cascade(self):
+        # only ROIs classified as peaks are segmented
+        labels = [0, 1, 1, 0, 0, 0, 1, 0, 0, 1]
+        segmented = []
+
+        def classifier(signal):
+            batch = labels[:len(signal)]
+            del labels[:len(signal)]
+            return torch.eye(2)[batch], None
+
+        def segmentator(signal):
+            segmented.append(len(signal))
+            return None, torch.ones((len(signal), 2, signal.shape[2])) * torch.tensor([10., -10.]).view(1, 2, 1)
+
+        borders = BasicRunner('sequential', [classifier, segmentator], 5, 'cpu', batch_size=3).predict_borders(self.rois)
+        self.assertEqual(segmented, [3, 1])
+        self.assertEqual([k for k, roi_borders in enumerate(borders) if roi_borders is not None], [1, 2, 6, 9])
+        self.assertTrue(all(len(borders[k]) == 1 for k in [1, 2, 6, 9]))
+
+    def test_noise_filter(self):
+        classified = []
+
+        def classifier(signal):
+            classified.append(len(signal))
+            return torch.eye(2)[torch.ones(len(signal), dtype=torch.int64)], None
+
+        def segmentator(signal):
+            return None, torch.ones((len(signal), 2, signal.shape[2])) * torch.tensor([10., -10.]).view(1, 2, 1)
+
+        rois = list(self.rois)
+        for length in [20, 35]:  # flat noise
+            i = np.full(length, 100.)
+            rois.append(ROI([0, length - 1], [0., length - 1.], i, [100.] * length, 100.))
+        runner = FilesRunner('sequential', [classifier, segmentator], 0.005, 5, 2, 5, 'cpu', noise_threshold=1.5)
+        borders = runner.predict_borders(rois)
+        self.assertEqual(classified, [len(self.rois)])
+        self.assertEqual(runner.skipped_rois, 2)
+        self.assertEqual(borders[-2:], [None, None])
+        self.assertTrue(all(roi_borders is not None for roi_borders in borders[:-2]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+
+from processing_utils.roi import get_ROIs, construct_tic, construct_eic
+from processing_utils import scan_store
+from processing_utils.scan_store import ScanStore, open_run
+from mzml_utils import generate_scans, write_mzml
+
+
+class ScanStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'test.mzML')
+        self.scans = generate_scans(n_scans=60, ms2_every=3, seed=2)
+        write_mzml(self.path, self.scans)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_spectra(self):
+        self.assertIsNone(ScanStore.open(self.path))
+        store = ScanStore.build(self.path)
+        self.assertIsInstance(open_run(self.path), ScanStore)
+        self.assertEqual(store.get_spectrum_count(), len(self.scans))
+        for (ms_level, mz, i, rt), spectrum in zip(self.scans, store):
+            self.assertEqual(spectrum.ms_level, ms_level)
+            self.assertEqual(spectrum.scan_time, (rt, 'second'))
+            np.testing.assert_array_equal(spectrum.mz, mz)
+            np.testing.assert_array_equal(spectrum.i, np.asarray(i, dtype=np.float32))
+            self.assertAlmostEqual(spectrum.TIC, float(np.sum(i)))
+        self.assertFalse(store.mz.flags.writeable)  # memory-mapped in read-only mode
+
+    def test_parts(self):
+        # columns are written by small parts and copied into *.npy files in a few steps
+        expected = ScanStore.build(self.path)
+        expected = {column: np.array(getattr(expected, column)) for column in ScanStore.columns}
+        progress = []
+
+        class Callback:
+            emit = progress.append
+
+        with mock.patch.object(scan_store._ColumnWriter, 'buffer_size', 1000), \
+                mock.patch.object(scan_store._ColumnWriter, 'copy_size', 777):
+            store = ScanStore.build(self.path, Callback())
+        for column, values in expected.items():
+            np.testing.assert_array_equal(getattr(store, column), values)
+            self.assertEqual(getattr(store, column).dtype, values.dtype)
+        self.assertEqual(progress, sorted(set(progress)))
+        self.assertEqual(progress[-1], 100)
+
+    def test_failed_build(self):
+        def failing():
+            yield from scans[:5]
+            raise ValueError('broken file')
+
+        scans = list(scan_store.IndexedReader.open(self.path))
+        reader = mock.MagicMock()
+        reader.__iter__.side_effect = failing
+        reader.get_spectrum_count.return_value = len(scans)
+        with mock.patch.object(scan_store.IndexedReader, 'open', return_value=reader):
+            with self.assertRaises(ValueError):
+                ScanStore.build(self.path)
+        self.assertEqual(os.listdir(self.directory.name), ['test.mzML'])
+        self.assertIsNone(ScanStore.open(self.path))
+
+    def test_stale_store(self):
+        ScanStore.build(self.path)
+        write_mzml(self.path, self.scans[:30])
+        os.utime(self.path, ns=(0, 0))
+        self.assertIsNone(ScanStore.open(self.path))
+
+    def test_consumers(self):
+        rois = get_ROIs(self.path, 0.005, 5, 2)
+        tic = construct_tic(self.path, 'tic')
+        eic = construct_eic(self.path, 'eic', self.scans[0][1][0], 0.005)
+        ScanStore.build(self.path)
+        stored_rois = get_ROIs(self.path, 0.005, 5, 2)
+        for column in rois.columns:
+            np.testing.assert_array_equal(getattr(stored_rois, column), getattr(rois, column))
+        for expected, result in [(tic, construct_tic(self.path, 'tic')),
+                                 (eic, construct_eic(self.path, 'eic', self.scans[0][1][0], 0.005))]:
+            np.testing.assert_array_equal(result['x'], expected['x'])
+            np.testing.assert_array_equal(result['y'], expected['y'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,7 +4,7 @@ from copy import deepcopy
 import numpy as np
 import torch
 from torch.utils.data import Dataset
-from scipy.interpolate import interp1d
+from processing_utils.run_utils import resample
 
 
 # to do: Reflection should take a ROI (dict)
@@ -82,8 +82,8 @@ class ROIDataset(Dataset):
     def _interpolate(self, roi):
         roi = deepcopy(roi)
         points = len(roi['intensity'])
-        interpolate = interp1d(np.arange(points), roi['intensity'], kind='linear')
-        roi['intensity'] = interpolate(np.arange(self.length) / (self.length - 1.) * (points - 1.))
+        # the same resampling as in inference (see run_utils.preprocess_batch)
+        roi['intensity'] = resample(roi['intensity'], [0, points], self.length)[0]
         roi['borders'] = np.array(roi['borders'])
         roi['borders'] = roi['borders'] * (self.length - 1) // (points - 1)
         return roi
@@ -112,3 +112,74 @@ class ROIDataset(Dataset):
             return x, y, integration_mask, intersection_mask, roi['code'], original_length
 
         return x, y, integration_mask, intersection_mask
+
+
+def pad_batch(items):
+    """
+    Collate items of ROIDataset with different lengths: signals and masks are padded with zeros
+    :param items: a list of (x, y, integration_mask, intersection_mask) tuples
+    :return: x, y, integration_mask, intersection_mask and lengths of signals (for RecurrentCNN)
+    """
+    lengths = torch.tensor([item[0].shape[-1] for item in items], dtype=torch.int64)
+    x, y, integration_mask, intersection_mask = items[0][:4]
+    n_points = int(lengths.max())
+    batch_x = x.new_zeros((len(items), 1, n_points))
+    batch_integration = integration_mask.new_zeros((len(items), n_points))
+    batch_intersection = intersection_mask.new_zeros((len(items), n_points))
+    for k, (x, _, integration_mask, intersection_mask) in enumerate(items):
+        batch_x[k, :, :x.shape[-1]] = x
+        batch_integration[k, :x.shape[-1]] = integration_mask
+        batch_intersection[k, :x.shape[-1]] = intersection_mask
+    batch_y = torch.stack([item[1] for item in items])
+    return batch_x, batch_y, batch_integration, batch_intersection, lengths
+
+
+class BucketLoader:
+    """
+    A data loader for signals of different lengths (RecurrentCNN training): items
+    are drawn into a pool of a few batches, the pool is sorted by length and split
+    into batches, so signals in a batch have similar lengths and padding is small.
+    Batches are collated by 'pad_batch'.
+
+    Parameters
+    ----------
+    dataset : ROIDataset
+        -
+    batch_size : int
+        -
+    shuffle : bool
+        -
+    pool_size : int
+        -
+
+    Attributes
+    ----------
+    dataset : ROIDataset
+        a dataset without interpolation
+    batch_size : int
+        maximal number of items in batch
+    shuffle : bool
+        if items and batches should be shuffled
+    pool_size : int
+        number of batches which are sorted by length together
+    """
+    def __init__(self, dataset, batch_size=64, shuffle=False, pool_size=50):
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.pool_size = pool_size
+
+    def __len__(self):
+        return (len(self.dataset) + self.batch_size - 1) // self.batch_size
+
+    def __iter__(self):
+        indexes = np.random.permutation(len(self.dataset)) if self.shuffle else np.arange(len(self.dataset))
+        pool = self.batch_size * self.pool_size
+        for begin in range(0, len(indexes), pool):
+            items = [self.dataset[idx] for idx in indexes[begin:begin + pool]]
+            items.sort(key=lambda item: item[0].shape[-1])
+            batches = [items[k:k + self.batch_size] for k in range(0, len(items), self.batch_size)]
+            if self.shuffle:
+                batches = [batches[k] for k in np.random.permutation(len(batches))]
+            for batch in batches:
+                yield pad_batch(batch)
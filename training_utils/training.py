@@ -81,13 +81,15 @@ class WeightedBCE:
         self.weights = weights
         self.logsigmoid = nn.LogSigmoid()
 
-    def __call__(self, output, target):
+    def __call__(self, output, target, mask=None):
         if self.weights is not None:
             assert len(self.weights) == 2
             loss = self.weights[1] * (target * self.logsigmoid(output)) + \
                 self.weights[0] * ((1 - target) * self.logsigmoid(-output))
         else:
             loss = target * self.logsigmoid(output) + (1 - target) * self.logsigmoid(-output)
+        if mask is not None:  # padded points are ignored
+            return torch.neg(torch.sum(loss * mask) / torch.sum(mask))
         return torch.neg(torch.mean(loss))
 
 
@@ -95,8 +97,10 @@ class DiceLoss:
     def __init__(self, smooth=1e-2):
         self.smooth = smooth
 
-    def __call__(self, output, target):
+    def __call__(self, output, target, mask=None):
         output = output.sigmoid()
+        if mask is not None:  # padded points are ignored
+            output = output * mask
         numerator = torch.sum(output * target, dim=1)
         denominator = torch.sum(torch.sqrt(output) + target, dim=1)
         return 1 - torch.mean((2 * numerator + self.smooth) / (denominator + self.smooth))
@@ -107,8 +111,25 @@ class CombinedLoss:
         self.dice = DiceLoss()
         self.bce = WeightedBCE(weights)
 
-    def __call__(self, output, target):
-        return self.dice(output, target) + self.bce(output, target)
+    def __call__(self, output, target, mask=None):
+        return self.dice(output, target, mask) + self.bce(output, target, mask)
+
+
+def _unpack_batch(model, batch):
+    """
+    Run the model on a batch from a loader, a batch from BucketLoader also contains lengths of signals
+    :return: classifier output, integrator output, labels, integration mask, intersection mask
+        and mask of real (not padded) points (None if signals aren't padded)
+    """
+    x, y, integration_mask, intersection_mask = batch[:4]
+    if len(batch) > 4:
+        lengths = batch[4]
+        classifier_output, integrator_output = model(x, lengths)
+        mask = (torch.arange(x.shape[2]) < lengths.view(-1, 1)).to(x.device, x.dtype)
+    else:
+        classifier_output, integrator_output = model(x)
+        mask = None
+    return classifier_output, integrator_output, y, integration_mask, intersection_mask, mask
 
 
 def train_model(model, loader, val_loader,
@@ -138,17 +159,18 @@ def train_model(model, loader, val_loader,
         segemntation_score_accum = 0
         count = 0
         step = 0
-        for x, y, integration_mask, intersection_mask in loader:
-            classifier_output, integrator_output = model(x)
+        for batch in loader:
+            classifier_output, integrator_output, y, integration_mask, intersection_mask, mask = \
+                _unpack_batch(model, batch)
             # classifier_output = classifier_output.view(1, -1)
             # calculate loss and gradients
-            loss = torch.tensor(0, dtype=torch.float32, device=x.device)
+            loss = torch.tensor(0, dtype=torch.float32, device=y.device)
             if label_criterion is not None:
                 loss = loss + label_criterion(classifier_output, y)
             if integration_criterion is not None:
-                loss = loss + integration_criterion(integrator_output[:, 0, :], integration_mask)
+                loss = loss + integration_criterion(integrator_output[:, 0, :], integration_mask, mask)
             if intersection_criterion is not None:
-                loss = loss + intersection_criterion(integrator_output[:, 1, :], intersection_mask)
+                loss = loss + intersection_criterion(integrator_output[:, 1, :], intersection_mask, mask)
             loss = loss / accumulation
             loss.backward()
 
@@ -164,8 +186,10 @@ def train_model(model, loader, val_loader,
             if segmentation_metric is not None:
                 gt = np.stack((integration_mask.data.cpu().numpy(),
                                intersection_mask.data.cpu().numpy())).transpose(1, 0, 2)
-                segemntation_score_accum += segmentation_metric(integrator_output.detach().cpu().sigmoid().numpy(),
-                                                                gt) * len(y)
+                prediction = integrator_output.detach().cpu().sigmoid()
+                if mask is not None:
+                    prediction = prediction * mask.cpu().unsqueeze(1)
+                segemntation_score_accum += segmentation_metric(prediction.numpy(), gt) * len(y)
             loss_accum += loss
             count += len(y)
         loss_history.append(float(loss_accum / count))  # average loss over epoch
@@ -176,16 +200,19 @@ def train_model(model, loader, val_loader,
         classification_score_accum = 0
         segemntation_score_accum = 0
         count = 0
-        for x, y, integration_mask, intersection_mask in val_loader:
-            classifier_output, integrator_output = model(x)
+        for batch in val_loader:
+            classifier_output, integrator_output, y, integration_mask, intersection_mask, mask = \
+                _unpack_batch(model, batch)
             if classification_metric is not None:
                 classification_score_accum += classification_metric(classifier_output.detach().cpu().numpy(),
                                                                     y.detach().cpu().numpy()) * len(y)
             if segmentation_metric is not None:
                 gt = np.stack((integration_mask.data.cpu().numpy(),
                                intersection_mask.data.cpu().numpy())).transpose(1, 0, 2)
-                segemntation_score_accum += segmentation_metric(integrator_output.detach().cpu().sigmoid().numpy(),
-                                                                gt) * len(y)
+                prediction = integrator_output.detach().cpu().sigmoid()
+                if mask is not None:
+                    prediction = prediction * mask.cpu().unsqueeze(1)
+                segemntation_score_accum += segmentation_metric(prediction.numpy(), gt) * len(y)
             count += len(y)
         val_classification_score_history.append(float(classification_score_accum / count))
         val_segmentation_score_history.append(float(segemntation_score_accum / count))